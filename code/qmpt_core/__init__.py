@@ -3,4 +3,4 @@ QMPT core models, metrics, scenarios, and IO helpers.
 Intended to stay minimal but aligned with the theory files.
 """
 
-__all__ = ["models", "metrics", "scenarios", "io"]
+__all__ = ["models", "metrics", "scenarios", "io", "noise", "sweeps", "hierarchy", "neighbors", "sketch", "bootstrap", "quantiles", "calibration", "datasets"]
@@ -0,0 +1,185 @@
+"""
+Threshold-sweep calibration of anomaly predictions against ground truth.
+
+Predictions are sorted once (descending); every distinct prediction value is a
+candidate threshold t (a sample is flagged when pred >= t). TP/FP counts at all
+thresholds are cumulative sums over that order, which gives the ROC curve, AUC
+and precision/F1 per threshold. Detection latency follows the scenarios'
+`detection_latency`: the time (index * dt) of the first flagged ground-truth
+sample of a run. Per run only the positives that lower the earliest flagged
+index as the threshold drops matter ("records"); they are found with one
+running maximum over all runs, and spread over the threshold grid with
+difference arrays. Several runs (split by `offsets`) are pooled into one curve
+with the mean latency over the runs detected at each threshold.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+PRED_KEYS = ["anomaly_proxy", "anomaly_index"]
+TRUTH_KEYS = ["anomaly_ground_truth", "anomaly_gt"]
+
+
+@dataclass
+class CalibrationCurve:
+    """
+    Counts at every threshold, highest first. `latency` is the mean detection
+    latency over the `detected` runs (NaN where no run is detected).
+    """
+
+    thresholds: np.ndarray
+    tp: np.ndarray
+    fp: np.ndarray
+    positives: int
+    negatives: int
+    latency: np.ndarray
+    detected: np.ndarray
+    runs: int
+
+    @property
+    def tpr(self) -> np.ndarray:
+        return self.tp / self.positives if self.positives else np.full(len(self.tp), np.nan)
+
+    @property
+    def fpr(self) -> np.ndarray:
+        return self.fp / self.negatives if self.negatives else np.full(len(self.fp), np.nan)
+
+    @property
+    def precision(self) -> np.ndarray:
+        return self.tp / np.maximum(self.tp + self.fp, 1)
+
+    @property
+    def f1(self) -> np.ndarray:
+        return 2.0 * self.tp / np.maximum(self.tp + self.fp + self.positives, 1)
+
+    def auc(self) -> float:
+        """Area under the ROC curve (trapezoids from (0, 0) to (1, 1)); NaN without both classes."""
+        if not self.positives or not self.negatives:
+            return float("nan")
+        fpr = np.concatenate([[0.0], self.fpr])
+        tpr = np.concatenate([[0.0], self.tpr])
+        return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1])) / 2.0)
+
+    def summary(self) -> Dict[str, Any]:
+        """Scalar metrics for metrics.json: AUC and the best-F1 threshold with its latency."""
+        if not len(self.thresholds):
+            return {}
+        best = int(np.argmax(self.f1))
+        latency = self.latency[best]
+        return {
+            "calib_auc": self.auc(),
+            "calib_thresholds": int(len(self.thresholds)),
+            "calib_best_f1": float(self.f1[best]),
+            "calib_best_threshold": float(self.thresholds[best]),
+            "calib_best_tp_rate": float(self.tpr[best]),
+            "calib_best_fp_rate": float(self.fpr[best]),
+            "calib_best_latency": float(latency) if np.isfinite(latency) else -1.0,
+            "calib_best_detected_runs": int(self.detected[best]),
+        }
+
+
+def calibration_curve(
+    pred: np.ndarray,
+    truth: np.ndarray,
+    offsets: Optional[np.ndarray] = None,
+    truth_threshold: float = 0.5,
+    dt: float = 1.0,
+) -> CalibrationCurve:
+    """
+    Sweep every threshold of `pred` against `truth >= truth_threshold`.
+    `offsets` (n_runs + 1) splits flat series into runs; a single run by default.
+    """
+    pred = np.asarray(pred, dtype=float).ravel()
+    pos = np.asarray(truth, dtype=float).ravel() >= truth_threshold
+    n = len(pred)
+    if len(pos) != n:
+        raise ValueError("pred and truth must have the same length")
+    offsets = np.asarray([0, n] if offsets is None else offsets, dtype=np.int64)
+    if offsets[0] != 0 or offsets[-1] != n or np.any(np.diff(offsets) < 0):
+        raise ValueError("offsets must rise from 0 to the series length")
+    n_runs = len(offsets) - 1
+    order = np.argsort(-pred)
+    sorted_pred = pred[order]
+    changes = np.diff(sorted_pred) != 0
+    ends = np.append(np.flatnonzero(changes), n - 1) if n else np.zeros(0, dtype=np.int64)
+    cum_pos = np.cumsum(pos[order])
+    tp = cum_pos[ends]
+    fp = ends + 1 - tp
+    n_groups = len(ends)
+    # group[i]: index of the highest threshold that flags sample i.
+    group = np.empty(n, dtype=np.int64)
+    if n:
+        group[order[0]] = 0
+        group[order[1:]] = np.cumsum(changes)
+
+    lat_diff = np.zeros(n_groups + 1)
+    cnt_diff = np.zeros(n_groups + 1)
+    run = np.repeat(np.arange(n_runs), np.diff(offsets))
+    if np.any(pos):
+        big = n_groups + 1
+        key = np.where(pos, run * big + (big - 1 - group), run * big - 1)
+        best = np.maximum.accumulate(key)
+        record = pos.copy()
+        record[1:] &= key[1:] > best[:-1]
+        idx = np.flatnonzero(record)
+        r, g = run[idx], group[idx]
+        local = (idx - offsets[r]) * dt
+        # Record k of a run holds for groups g_k .. g_(k-1) - 1; the first one up to the end.
+        first = np.ones(len(idx), dtype=bool)
+        first[1:] = r[1:] != r[:-1]
+        prev = np.where(first, n_groups, np.concatenate([[n_groups], g[:-1]]))
+        lat_diff += np.bincount(g, weights=local, minlength=n_groups + 1)
+        lat_diff -= np.bincount(prev, weights=local, minlength=n_groups + 1)
+        cnt_diff += np.bincount(g, minlength=n_groups + 1)
+        cnt_diff -= np.bincount(prev, minlength=n_groups + 1)
+    detected = np.rint(np.cumsum(cnt_diff)[:n_groups]).astype(np.int64)
+    lat_sum = np.cumsum(lat_diff)[:n_groups]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        latency = np.where(detected > 0, lat_sum / detected, np.nan)
+    return CalibrationCurve(
+        thresholds=sorted_pred[ends],
+        tp=tp,
+        fp=fp,
+        positives=int(cum_pos[-1]) if n else 0,
+        negatives=int(n - cum_pos[-1]) if n else 0,
+        latency=latency,
+        detected=detected,
+        runs=n_runs,
+    )
+
+
+def calibrate_runs(series: Sequence[Dict[str, Any]], config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Pooled calibration summary of stored runs (dicts holding the prediction and
+    ground-truth series); runs without both series are skipped.
+    """
+    config = config or {}
+    preds: List[np.ndarray] = []
+    truths: List[np.ndarray] = []
+    for ts in series:
+        pred, truth = _first(ts, PRED_KEYS), _first(ts, TRUTH_KEYS)
+        if pred is not None and truth is not None and pred.size == truth.size:
+            preds.append(pred.ravel())
+            truths.append(truth.ravel())
+    if not preds:
+        return {}
+    offsets = np.concatenate([[0], np.cumsum([len(p) for p in preds])])
+    curve = calibration_curve(
+        np.concatenate(preds),
+        np.concatenate(truths),
+        offsets,
+        truth_threshold=float(config.get("anomaly_threshold", 0.5)),
+        dt=float(config.get("dt", 1.0)),
+    )
+    return curve.summary()
+
+
+def _first(series: Dict[str, Any], keys: List[str]) -> Optional[np.ndarray]:
+    for key in keys:
+        if key in series:
+            return np.asarray(series[key], dtype=float)
+    return None
@@ -0,0 +1,229 @@
+"""
+Columnar dataset store: all runs of a dataset in a few shared files.
+
+    <root>/columns/<key>.npy      series of every run, concatenated along time
+    <root>/columns/<key>/<i>.npy  series of run i whose rows do not fit <key>.npy
+    <root>/offsets.npy            (n_keys, n_runs + 1) int64 row offsets per key
+    <root>/metrics.npy            (n_runs, n_metrics) float table of numeric metrics
+    <root>/records.jsonl          one line per run: full metrics dict and patterns
+    <root>/records.npy            (n_runs + 1,) byte offsets of the lines
+    <root>/store.json             run ids, keys, metric names and per-run files
+
+Run i of key k is columns/<k>.npy[offsets[k, i]:offsets[k, i + 1]]; a run
+without that key has an empty range. The shared column takes the row shape
+and dtype of the first run with that key; a run whose series differs (a
+sweep over n_layers, say) keeps it unconverted in its own file, listed under
+"run_files" in store.json, and has an empty range in the column. Every array
+is a plain .npy file, so a reader memory-maps it and touches only the rows it
+slices. The writer keeps
+its files under temporary names and renames them on `close`, store.json last.
+
+Runs are addressed by id or index. `DatasetStore.run_path` gives a locator
+path (<root>/runs/<run_id>, not created on disk) that `load_run` resolves just
+like a per-run result directory.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from .expressions import metrics_columns
+from .io import ColumnWriter, atomic_write, load_run_series, numeric_series, pattern_records, run_metrics, write_json
+
+STORE_FILE = "store.json"
+
+Run = Union[int, str]
+
+
+class DatasetWriter:
+    """
+    Appends runs to a columnar store under `root`; safe to share between
+    threads. Metrics are computed like `io.write_run_results`; series go
+    straight to the shared column files.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._columns = ColumnWriter(self.root / "columns")
+        self._lock = threading.Lock()
+        self.run_ids: List[str] = []
+        self._ends: List[Dict[str, int]] = []
+        self._records: List[Dict[str, Any]] = []
+        self._run_files: Dict[str, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.run_ids)
+
+    def run_path(self, run_id: str) -> Path:
+        return self.root / "runs" / run_id
+
+    def append(
+        self,
+        run_id: str,
+        summary: Dict[str, Any],
+        timeseries: Dict[str, Any],
+        config: Optional[Dict] = None,
+        extra: Optional[Dict[str, Any]] = None,
+        patterns=None,
+    ) -> Dict[str, Any]:
+        """Add one run; returns its metrics."""
+        metrics = run_metrics(summary, timeseries, config, extra)
+        series = numeric_series(timeseries)
+        record = {"run_id": run_id, "metrics": metrics, "patterns": pattern_records(patterns or [])}
+        with self._lock:
+            index = len(self.run_ids)
+            own = {key: values for key, values in series.items() if not self._columns.fits(key, values)}
+            self._columns.append({key: values for key, values in series.items() if key not in own})
+            for key, values in own.items():
+                path = self.root / "columns" / key / f"{index}.npy"
+                path.parent.mkdir(exist_ok=True)
+                atomic_write(path, lambda fh, values=values: np.save(fh, np.asarray(values)))
+                self._run_files.setdefault(key, []).append(index)
+            self.run_ids.append(run_id)
+            self._ends.append(dict(self._columns.lengths))
+            self._records.append(record)
+        return metrics
+
+    def close(self) -> None:
+        """Finish the column files and write the index, metrics table and records."""
+        with self._lock:
+            self._columns.close()
+            keys = sorted(self._columns.lengths)
+            offsets = np.zeros((len(keys), len(self.run_ids) + 1), dtype=np.int64)
+            for i, key in enumerate(keys):
+                offsets[i, 1:] = [ends.get(key, 0) for ends in self._ends]
+            columns = metrics_columns([r["metrics"] for r in self._records])
+            names = list(columns)
+            table = np.column_stack([columns[n] for n in names]) if names else np.zeros((len(self.run_ids), 0))
+            lines = [(json.dumps(r) + "\n").encode("utf-8") for r in self._records]
+            line_offsets = np.concatenate([[0], np.cumsum([len(line) for line in lines])]).astype(np.int64)
+            atomic_write(self.root / "offsets.npy", lambda fh: np.save(fh, offsets))
+            atomic_write(self.root / "metrics.npy", lambda fh: np.save(fh, table))
+            atomic_write(self.root / "records.jsonl", lambda fh: fh.writelines(lines))
+            atomic_write(self.root / "records.npy", lambda fh: np.save(fh, line_offsets))
+            write_json(
+                self.root / STORE_FILE, {"runs": self.run_ids, "keys": keys, "metrics": names, "run_files": self._run_files}
+            )
+
+    def __enter__(self) -> "DatasetWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class DatasetStore:
+    """Read side of a columnar store; arrays are memory-mapped and sliced per run."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+        info = json.loads((self.root / STORE_FILE).read_text(encoding="utf-8"))
+        self.run_ids: List[str] = info["runs"]
+        self.keys: List[str] = info["keys"]
+        self.metric_names: List[str] = info["metrics"]
+        self._run_files = {key: set(runs) for key, runs in info["run_files"].items()}
+        self._index = {run_id: i for i, run_id in enumerate(self.run_ids)}
+        self._offsets = np.load(self.root / "offsets.npy", mmap_mode="r")
+        self._lines = np.load(self.root / "records.npy", mmap_mode="r")
+        self._columns: Dict[str, np.ndarray] = {}
+
+    @staticmethod
+    def exists(root: Path) -> bool:
+        return (Path(root) / STORE_FILE).exists()
+
+    def __len__(self) -> int:
+        return len(self.run_ids)
+
+    def __contains__(self, run_id: object) -> bool:
+        return run_id in self._index
+
+    def index(self, run: Run) -> int:
+        return run if isinstance(run, (int, np.integer)) else self._index[run]
+
+    def run_path(self, run: Run) -> Path:
+        return self.root / "runs" / self.run_ids[self.index(run)]
+
+    def column(self, key: str) -> np.ndarray:
+        """All runs' rows of `key` (memory-mapped)."""
+        if key not in self._columns:
+            self._columns[key] = np.load(self.root / "columns" / f"{key}.npy", mmap_mode="r")
+        return self._columns[key]
+
+    def offsets(self, key: str) -> np.ndarray:
+        """(n_runs + 1,) row offsets of `key` into `column(key)`; runs kept in their own file have empty ranges."""
+        return np.asarray(self._offsets[self.keys.index(key)])
+
+    def series(self, run: Run, keys: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """Memory-mapped series of one run: `keys` (all when None); keys the run lacks are left out."""
+        i = self.index(run)
+        out: Dict[str, np.ndarray] = {}
+        for key in self.keys if keys is None else keys:
+            if key not in self.keys:
+                continue
+            if i in self._run_files.get(key, ()):
+                out[key] = np.load(self.root / "columns" / key / f"{i}.npy", mmap_mode="r")
+                continue
+            start, stop = self._offsets[self.keys.index(key), i:i + 2]
+            if stop > start:
+                out[key] = self.column(key)[start:stop]
+        return out
+
+    def record(self, run: Run) -> Dict[str, Any]:
+        i = self.index(run)
+        start, stop = int(self._lines[i]), int(self._lines[i + 1])
+        with (self.root / "records.jsonl").open("rb") as fh:
+            fh.seek(start)
+            return json.loads(fh.read(stop - start))
+
+    def metrics(self, run: Run) -> Dict[str, Any]:
+        return self.record(run)["metrics"]
+
+    def patterns(self, run: Run) -> List[Dict[str, Any]]:
+        return self.record(run)["patterns"]
+
+    def metrics_table(self) -> np.ndarray:
+        """(n_runs, n_metrics) numeric metrics, NaN where a run lacks one (columns: `metric_names`)."""
+        return np.load(self.root / "metrics.npy", mmap_mode="r")
+
+
+@dataclass
+class RunData:
+    """Stored data of one run, from a result directory or a dataset store; `series(keys)` loads series lazily."""
+
+    run_id: str
+    metrics: Dict[str, Any]
+    patterns: List[Dict[str, Any]]
+    series: Callable[[Optional[Sequence[str]]], Dict[str, np.ndarray]] = field(repr=False)
+    store_root: Optional[Path] = None
+
+
+def load_run(path: Path) -> RunData:
+    """
+    Resolve a run's results path: a store locator (<store>/runs/<run_id>) or a
+    result directory with metrics.json, patterns.json and timeseries.npz/series.
+    """
+    path = Path(path)
+    if path.parent.name == "runs" and DatasetStore.exists(path.parents[1]):
+        store = DatasetStore(path.parents[1])
+        record = store.record(path.name)
+        return RunData(
+            run_id=path.name,
+            metrics=record["metrics"],
+            patterns=record["patterns"],
+            series=lambda keys=None: store.series(path.name, keys),
+            store_root=store.root,
+        )
+    metrics_path, patterns_path = path / "metrics.json", path / "patterns.json"
+    return RunData(
+        run_id=path.name,
+        metrics=json.loads(metrics_path.read_text(encoding="utf-8")) if metrics_path.exists() else {},
+        patterns=json.loads(patterns_path.read_text(encoding="utf-8")) if patterns_path.exists() else [],
+        series=lambda keys=None: load_run_series(path, keys),
+    )
@@ -1,94 +1,472 @@
 """
 Tiny expression evaluator for derived metrics.
-Supports basic arithmetic on existing metric keys.
+Supports basic arithmetic on existing metric keys and on other derived metrics.
+
+All expressions of a config are compiled together, once (cached by source),
+into a flat program of slots. Derived names may refer to each other: they are
+ordered topologically and cycles are reported before anything runs. Identical
+subexpressions, including references to a derived name and a copy of its
+formula, share one slot, so every common term is computed once per pass. A
+program evaluates against scalar metrics of one run or against NumPy arrays of
+per-run metrics, so one call derives a metric for a whole ensemble.
+
+Names that are not metrics can be read from a run's stored series
+(timeseries.npz); only the series a program references are loaded. Series
+functions reduce (mean, quantile, argmax, ...), transform (cumsum, diff) or
+window (rolling_mean, ...) along the time axis, and comparisons give boolean
+masks for where() and masked().
 """
 
 from __future__ import annotations
 
 import ast
-from typing import Dict, Any
-
-
-class _SafeEval(ast.NodeVisitor):
-    allowed_nodes = {
-        ast.Expression,
-        ast.BinOp,
-        ast.UnaryOp,
-        ast.Add,
-        ast.Sub,
-        ast.Mult,
-        ast.Div,
-        ast.Pow,
-        ast.Mod,
-        ast.Num,
-        ast.Constant,
-        ast.Load,
-        ast.Name,
-        ast.USub,
-        ast.UAdd,
-        ast.Call,
-    }
-    allowed_funcs = {"abs": abs, "max": max, "min": min}
-
-    def __init__(self, variables: Dict[str, Any]):
-        self.vars = variables
-
-    def visit(self, node):
-        if type(node) not in self.allowed_nodes:
-            raise ValueError(f"Illegal expression element: {type(node).__name__}")
-        return super().visit(node)
-
-    def visit_Name(self, node):
-        if node.id in self.vars:
-            return self.vars[node.id]
-        raise ValueError(f"Unknown variable {node.id}")
-
-    def visit_Constant(self, node):
-        return node.value
-
-    def visit_Num(self, node):
-        return node.n
-
-    def visit_UnaryOp(self, node):
-        operand = self.visit(node.operand)
-        if isinstance(node.op, ast.USub):
-            return -operand
-        if isinstance(node.op, ast.UAdd):
-            return +operand
-        raise ValueError("Unsupported unary operator")
-
-    def visit_BinOp(self, node):
-        left = self.visit(node.left)
-        right = self.visit(node.right)
-        if isinstance(node.op, ast.Add):
-            return left + right
-        if isinstance(node.op, ast.Sub):
-            return left - right
-        if isinstance(node.op, ast.Mult):
-            return left * right
-        if isinstance(node.op, ast.Div):
-            return left / right
-        if isinstance(node.op, ast.Pow):
-            return left ** right
-        if isinstance(node.op, ast.Mod):
-            return left % right
-        raise ValueError("Unsupported binary operator")
-
-    def visit_Call(self, node):
-        if isinstance(node.func, ast.Name) and node.func.id in self.allowed_funcs:
-            func = self.allowed_funcs[node.func.id]
-            args = [self.visit(a) for a in node.args]
-            return func(*args)
-        raise ValueError("Unsupported function call")
-
-
-def evaluate_derived(metrics: Dict[str, Any], expressions: Dict[str, str]) -> Dict[str, Any]:
-    derived: Dict[str, Any] = {}
-    for name, expr in expressions.items():
+import functools
+import operator
+from dataclasses import dataclass
+from collections import ChainMap
+from typing import Any, Callable, Dict, FrozenSet, Hashable, List, Mapping, Optional, Tuple, Union
+
+import numpy as np
+
+
+class ExpressionError(ValueError):
+    """An expression that cannot be compiled or evaluated."""
+
+
+def _max(*args):
+    if any(isinstance(a, np.ndarray) for a in args):
+        return functools.reduce(np.maximum, args)
+    return max(args)
+
+
+def _min(*args):
+    if any(isinstance(a, np.ndarray) for a in args):
+        return functools.reduce(np.minimum, args)
+    return min(args)
+
+
+def _series(x) -> np.ndarray:
+    x = np.asarray(x)
+    if x.ndim == 0:
+        raise ExpressionError("expected a series, got a scalar")
+    return x
+
+
+def _reduction(fn):
+    return lambda x: fn(_series(x), axis=0)
+
+
+def _window(x, w) -> np.ndarray:
+    x, w = _series(x), int(w)
+    if not 1 <= w <= len(x):
+        raise ExpressionError(f"window {w} does not fit a series of length {len(x)}")
+    return np.lib.stride_tricks.sliding_window_view(x, w, axis=0)
+
+
+def _masked(x, mask) -> np.ndarray:
+    return _series(x)[np.asarray(mask, dtype=bool)]
+
+
+def _at(x, i):
+    return _series(x)[int(i)]
+
+
+_BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+    ast.Mod: operator.mod,
+    ast.BitAnd: operator.and_,
+    ast.BitOr: operator.or_,
+}
+_COMPARE = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+_UNARY = {ast.USub: operator.neg, ast.UAdd: operator.pos, ast.Invert: np.logical_not}
+_SYMBOLS = {
+    operator.add: "+", operator.sub: "-", operator.mul: "*", operator.truediv: "/", operator.pow: "**",
+    operator.mod: "%", operator.and_: "&", operator.or_: "|", operator.lt: "<", operator.le: "<=",
+    operator.gt: ">", operator.ge: ">=", operator.eq: "==", operator.ne: "!=",
+}
+_UNARY_SYMBOLS = {operator.neg: "-", operator.pos: "+"}
+# name -> (function, minimum, maximum number of arguments; None = any).
+# Series functions work along axis 0 (time) of series from timeseries.npz.
+_FUNCS = {
+    "abs": (abs, 1, 1),
+    "max": (_max, 2, None),
+    "min": (_min, 2, None),
+    "mean": (_reduction(np.mean), 1, 1),
+    "std": (_reduction(np.std), 1, 1),
+    "sum": (_reduction(np.sum), 1, 1),
+    "median": (_reduction(np.median), 1, 1),
+    "peak": (_reduction(np.max), 1, 1),
+    "trough": (_reduction(np.min), 1, 1),
+    "argmax": (_reduction(np.argmax), 1, 1),
+    "argmin": (_reduction(np.argmin), 1, 1),
+    "cumsum": (_reduction(np.cumsum), 1, 1),
+    "diff": (_reduction(np.diff), 1, 1),
+    "quantile": (lambda x, q: np.quantile(_series(x), q, axis=0), 2, 2),
+    "rolling_mean": (lambda x, w: _window(x, w).mean(axis=-1), 2, 2),
+    "rolling_max": (lambda x, w: _window(x, w).max(axis=-1), 2, 2),
+    "rolling_min": (lambda x, w: _window(x, w).min(axis=-1), 2, 2),
+    "where": (np.where, 3, 3),
+    "masked": (_masked, 2, 2),
+    "at": (_at, 2, 2),
+    "length": (lambda x: len(_series(x)), 1, 1),
+}
+# Functions that read along a run's series; they have no meaning over per-run metric columns.
+_SERIES_FUNCS = frozenset(_FUNCS) - {"abs", "max", "min", "where"}
+
+
+# One program step: ("const", value, ()), ("load", name, ()) or ("apply", fn, arg_slots).
+_Op = Tuple[str, Any, Tuple[int, ...]]
+
+
+class DerivedProgram:
+    """
+    Derived metrics (name -> source) compiled into one shared program.
+
+    `order` lists the names in evaluation order; `errors` holds names that
+    failed to compile (syntax, unsupported elements, cycles, or a dependency
+    that failed); `names` are the input metrics the program reads.
+    """
+
+    def __init__(self, expressions: Mapping[str, str]) -> None:
+        self.sources = dict(expressions)
+        self.ops: List[_Op] = []
+        self.outputs: Dict[str, int] = {}
+        self.errors: Dict[str, str] = {}
+        self.order: List[str] = []
+        self._slots: Dict[Hashable, int] = {}
+        self._inputs: set = set()
+
+        trees: Dict[str, ast.AST] = {}
+        for name, source in self.sources.items():
+            try:
+                trees[name] = _parse(source)
+            except ExpressionError as exc:
+                self.errors[name] = str(exc)
+        # A name used inside its own formula reads the input metric of that name.
+        deps = {name: (_names(tree) & set(self.sources)) - {name} for name, tree in trees.items()}
+        self._deps = deps
+        self._series_calls = {name: sorted(_calls(tree) & _SERIES_FUNCS) for name, tree in trees.items()}
+        for name in self._topological(deps):
+            failed = sorted(d for d in deps[name] if d in self.errors)
+            if failed:
+                self.errors[name] = f"Depends on failed derived metric {failed[0]}"
+                continue
+            try:
+                self.outputs[name] = self._emit(trees[name])
+                self.order.append(name)
+            except ExpressionError as exc:
+                self.errors[name] = str(exc)
+        self._fast = self._generate()
+
+    @property
+    def names(self) -> FrozenSet[str]:
+        return frozenset(self._inputs)
+
+    def _topological(self, deps: Dict[str, set]) -> List[str]:
+        # Names that failed to parse are already settled; their dependents
+        # report the failure instead of a cycle.
+        pending = {name: set(d) - set(self.errors) for name, d in deps.items()}
+        order: List[str] = []
+        ready = [name for name, d in pending.items() if not d]
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            del pending[name]
+            for other, d in pending.items():
+                if name in d:
+                    d.discard(name)
+                    if not d and other not in ready:
+                        ready.append(other)
+        if pending:
+            cycle = ", ".join(sorted(pending))
+            for name in pending:
+                self.errors[name] = f"Cycle in derived metrics: {cycle}"
+        return order
+
+    def _slot(self, key: Hashable, op: _Op) -> int:
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = len(self.ops)
+            self.ops.append(op)
+        return slot
+
+    def _emit(self, node: ast.AST) -> int:
+        if isinstance(node, ast.Constant):
+            value = node.value
+            return self._slot(("const", type(value).__name__, value), ("const", value, ()))
+        if isinstance(node, ast.Name):
+            if node.id in self.outputs:
+                return self.outputs[node.id]
+            self._inputs.add(node.id)
+            return self._slot(("load", node.id), ("load", node.id, ()))
+        if isinstance(node, ast.UnaryOp):
+            arg = self._emit(node.operand)
+            return self._slot(("unary", type(node.op), arg), ("apply", _UNARY[type(node.op)], (arg,)))
+        if isinstance(node, ast.BinOp):
+            args = (self._emit(node.left), self._emit(node.right))
+            return self._slot(("binary", type(node.op)) + args, ("apply", _BINARY[type(node.op)], args))
+        if isinstance(node, ast.Compare):
+            args = (self._emit(node.left), self._emit(node.comparators[0]))
+            op = type(node.ops[0])
+            return self._slot(("compare", op) + args, ("apply", _COMPARE[op], args))
+        # Calls were validated by _parse.
+        args = tuple(self._emit(a) for a in node.args)
+        return self._slot(("call", node.func.id) + args, ("apply", _FUNCS[node.func.id][0], args))
+
+    def _generate(self):
+        """
+        Straight-line Python for the whole program (slot i -> local s<i>). Only
+        validated ops go in: metric names as string literals, operators as
+        symbols, functions and constants through the namespace.
+        """
+        namespace: Dict[str, Any] = {}
+        lines = ["def program(v):"]
+        for i, (kind, payload, args) in enumerate(self.ops):
+            if kind == "const":
+                namespace[f"c{i}"] = payload
+                expr = f"c{i}"
+            elif kind == "load":
+                expr = f"v[{payload!r}]"
+            elif payload in _SYMBOLS:
+                expr = f"s{args[0]} {_SYMBOLS[payload]} s{args[1]}"
+            elif payload in _UNARY_SYMBOLS:
+                expr = f"{_UNARY_SYMBOLS[payload]}s{args[0]}"
+            else:
+                namespace[f"f{i}"] = payload
+                expr = f"f{i}({', '.join(f's{a}' for a in args)})"
+            lines.append(f"    s{i} = {expr}")
+        lines.append("    return [" + "".join(f"s{i}, " for i in range(len(self.ops))) + "]")
+        exec(compile("\n".join(lines), "<derived_metrics>", "exec"), namespace)
+        return namespace["program"]
+
+    def run(self, variables: Mapping[str, Any]) -> Tuple[List[Any], Dict[int, str]]:
+        """Values of all slots, plus the error message of every failed slot."""
         try:
-            tree = ast.parse(expr, mode="eval")
-            val = _SafeEval(metrics).visit(tree.body)
-            derived[name] = val
+            return self._fast(variables), {}
         except Exception:
-            continue
-    return derived
+            pass
+        # Slow path: step by step, so each failure is tied to the slots it reaches.
+        values: List[Any] = [None] * len(self.ops)
+        failed: Dict[int, str] = {}
+        for i, (kind, payload, args) in enumerate(self.ops):
+            if kind == "apply":
+                if failed:
+                    cause = next((failed[a] for a in args if a in failed), None)
+                    if cause is not None:
+                        # Everything computed from a failed slot fails the same way.
+                        failed[i] = cause
+                        continue
+                try:
+                    values[i] = payload(*[values[a] for a in args])
+                except Exception as exc:
+                    failed[i] = _message(exc)
+            elif kind == "load":
+                if payload in variables:
+                    values[i] = variables[payload]
+                else:
+                    failed[i] = f"Unknown variable {payload}"
+            else:
+                values[i] = payload
+        return values, failed
+
+    def series_errors(self) -> Dict[str, str]:
+        """Errors for compiled names that call series functions, directly or through another derived name."""
+        errors: Dict[str, str] = {}
+        for name in self.order:
+            failed = sorted(d for d in self._deps[name] if d in errors)
+            if self._series_calls[name]:
+                errors[name] = f"Series function {self._series_calls[name][0]}() is not supported over metric columns"
+            elif failed:
+                errors[name] = f"Depends on failed derived metric {failed[0]}"
+        return errors
+
+    def evaluate(self, variables: Mapping[str, Any], errors: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Derived values by name, in config order; failures (compile or runtime) go to `errors` when given."""
+        values, failed = self.run(variables)
+        derived: Dict[str, Any] = {}
+        failures = dict(self.errors)
+        for name in self.sources:
+            slot = self.outputs.get(name)
+            if slot is None:
+                continue
+            if slot in failed:
+                failures[name] = failed[slot]
+            else:
+                value = values[slot]
+                derived[name] = value.item() if isinstance(value, np.generic) else value
+        if errors is not None:
+            errors.update(failures)
+        return derived
+
+
+@dataclass(frozen=True)
+class CompiledExpression:
+    """A validated expression: `names` are the metrics it reads, calling it evaluates it."""
+
+    source: str
+    program: DerivedProgram
+
+    @property
+    def names(self) -> FrozenSet[str]:
+        return self.program.names
+
+    def __call__(self, variables: Mapping[str, Any]) -> Any:
+        values, failed = self.program.run(variables)
+        slot = self.program.outputs[""]
+        if slot in failed:
+            raise ExpressionError(failed[slot])
+        return values[slot]
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_expression(source: str) -> CompiledExpression:
+    """Parse and validate `source` once; raises ExpressionError for anything outside the language."""
+    program = DerivedProgram({"": source})
+    if "" in program.errors:
+        raise ExpressionError(program.errors[""])
+    return CompiledExpression(source=source, program=program)
+
+
+def compile_derived(expressions: Mapping[str, str]) -> DerivedProgram:
+    """Compile a config's `derived_metrics` into one program (cached by its items)."""
+    return _compile_derived(tuple(expressions.items()))
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_derived(items: Tuple[Tuple[str, str], ...]) -> DerivedProgram:
+    return DerivedProgram(dict(items))
+
+
+def _parse(source: str) -> ast.AST:
+    try:
+        tree = ast.parse(source, mode="eval").body
+    except SyntaxError as exc:
+        raise ExpressionError(f"Invalid expression {source!r}: {exc.msg}") from None
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                raise ExpressionError(f"Unsupported constant {node.value!r}")
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in _FUNCS or node.keywords:
+                raise ExpressionError("Unsupported function call")
+            _, min_args, max_args = _FUNCS[node.func.id]
+            if len(node.args) < min_args:
+                raise ExpressionError(f"{node.func.id}() needs at least {min_args} argument(s)")
+            if max_args is not None and len(node.args) > max_args:
+                raise ExpressionError(f"{node.func.id}() takes at most {max_args} argument(s)")
+        elif isinstance(node, ast.UnaryOp):
+            if type(node.op) not in _UNARY:
+                raise ExpressionError("Unsupported unary operator")
+        elif isinstance(node, ast.BinOp):
+            if type(node.op) not in _BINARY:
+                raise ExpressionError("Unsupported binary operator")
+        elif isinstance(node, ast.Compare):
+            if len(node.ops) != 1:
+                raise ExpressionError("Chained comparisons are not supported; combine them with &")
+            if type(node.ops[0]) not in _COMPARE:
+                raise ExpressionError("Unsupported comparison")
+        elif not isinstance(node, (ast.Name, ast.Load, ast.operator, ast.unaryop, ast.cmpop)):
+            raise ExpressionError(f"Illegal expression element: {type(node).__name__}")
+    return tree
+
+
+def _names(tree: ast.AST) -> set:
+    """Variable names read by a parsed expression (function names excluded)."""
+    funcs = {id(n.func) for n in ast.walk(tree) if isinstance(n, ast.Call)}
+    return {n.id for n in ast.walk(tree) if isinstance(n, ast.Name) and id(n) not in funcs}
+
+
+def _calls(tree: ast.AST) -> set:
+    """Function names called by a parsed expression."""
+    return {n.func.id for n in ast.walk(tree) if isinstance(n, ast.Call) and isinstance(n.func, ast.Name)}
+
+
+# Run series: a mapping (name -> array) or a loader called with the names a program needs.
+SeriesSource = Union[Mapping[str, Any], Callable[[List[str]], Mapping[str, Any]]]
+
+
+def _with_series(program: DerivedProgram, metrics: Mapping[str, Any], series: Optional[SeriesSource]) -> Mapping[str, Any]:
+    """Metrics plus the referenced series they lack; metric names take precedence."""
+    wanted = sorted(name for name in program.names if name not in metrics)
+    if series is None or not wanted:
+        return metrics
+    if callable(series):
+        loaded = series(wanted)
+    else:
+        loaded = {name: series[name] for name in wanted if name in series}
+    return ChainMap(metrics, loaded) if loaded else metrics
+
+
+def evaluate_derived(
+    metrics: Dict[str, Any],
+    expressions: Dict[str, str],
+    errors: Optional[Dict[str, str]] = None,
+    series: Optional[SeriesSource] = None,
+) -> Dict[str, Any]:
+    """
+    Evaluate `expressions` (name -> source) over one run's metrics and, for
+    other names, its `series`. Expressions that fail are left out of the
+    result; their messages go to `errors` when given.
+    """
+    program = compile_derived(expressions)
+    return program.evaluate(_with_series(program, metrics, series), errors)
+
+
+def evaluate_derived_batch(
+    columns: Mapping[str, np.ndarray], expressions: Dict[str, str], errors: Optional[Dict[str, str]] = None
+) -> Dict[str, np.ndarray]:
+    """
+    Evaluate `expressions` once over per-run metric columns (name -> (n_runs,) array,
+    see `metrics_columns`). Returns one (n_runs,) float array per expression;
+    NaN inputs and divisions by zero give NaN/inf entries instead of errors.
+    Series functions (`mean`, `quantile`, ...) would reduce across runs here,
+    so formulas using them are reported as errors and left out.
+    """
+    n = len(next(iter(columns.values()))) if columns else 0
+    program = compile_derived(expressions)
+    rejected = program.series_errors()
+    if rejected:
+        if errors is not None:
+            errors.update(rejected)
+        program = compile_derived({name: source for name, source in expressions.items() if name not in rejected})
+    with np.errstate(all="ignore"):
+        values = program.evaluate(columns, errors)
+    return {name: np.broadcast_to(np.asarray(value, dtype=float), (n,)).copy() for name, value in values.items()}
+
+
+def metrics_columns(run_metrics: List[Dict[str, Any]], names: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+    """Per-run metric dicts as float columns (NaN where a run lacks the metric); numeric keys only by default."""
+    if names is None:
+        names = sorted({k for m in run_metrics for k, v in m.items() if isinstance(v, (int, float)) and not isinstance(v, bool)})
+    return {name: np.array([m.get(name, np.nan) for m in run_metrics], dtype=float) for name in names}
+
+
+def derived_fields(
+    metrics: Dict[str, Any], expressions: Dict[str, str], series: Optional[SeriesSource] = None
+) -> Dict[str, Any]:
+    """`derived` and `derived_errors` entries for metrics.json (each left out when empty)."""
+    errors: Dict[str, str] = {}
+    derived = evaluate_derived(metrics, expressions, errors, series)
+    fields: Dict[str, Any] = {}
+    if derived:
+        fields["derived"] = {
+            name: value.tolist() if isinstance(value, np.ndarray) else value for name, value in derived.items()
+        }
+    if errors:
+        fields["derived_errors"] = errors
+    return fields
+
+
+def _message(exc: Exception) -> str:
+    return str(exc) if isinstance(exc, ExpressionError) else f"{type(exc).__name__}: {exc}"
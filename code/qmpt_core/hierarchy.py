@@ -0,0 +1,258 @@
+"""
+Coupled multi-layer scenario: K layers L_k evolved together as (K,) state arrays.
+
+Anomaly spills between layers through a sparse coupling matrix C: each step,
+layer k receives sum_j C[k, j] * anomaly_j. C is a scipy.sparse CSR matrix when
+SciPy is installed and a NumPy CSR (`CSRMatrix`) otherwise; both give the same
+product up to summation order. Timeseries are stored time-major, (T + 1, K), under
+the usual timeseries.npz keys.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .models import Layer, Trajectory
+from .noise import make_noise
+
+try:
+    import scipy.sparse as _sparse
+
+    SCIPY_AVAILABLE = True
+except Exception:
+    _sparse = None  # type: ignore
+    SCIPY_AVAILABLE = False
+
+# Noise terms per layer and step: stress, protection, novelty, anomaly.
+_TERMS = 4
+# Upper bound on noise values drawn per provider call.
+_NOISE_BLOCK = 1 << 20
+
+
+class CSRMatrix:
+    """Minimal compressed-sparse-row matrix: enough for `C @ x` without SciPy."""
+
+    def __init__(self, data: np.ndarray, indices: np.ndarray, indptr: np.ndarray, shape: Tuple[int, int]) -> None:
+        self.data = np.asarray(data, dtype=float)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.shape = (int(shape[0]), int(shape[1]))
+        self._rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+
+    @classmethod
+    def from_coo(cls, rows: np.ndarray, cols: np.ndarray, values: np.ndarray, shape: Tuple[int, int]) -> "CSRMatrix":
+        """Build from (row, col, value) triplets; duplicate entries are summed."""
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        values = np.asarray(values, dtype=float)
+        key = rows * shape[1] + cols
+        uniq, inverse = np.unique(key, return_inverse=True)
+        summed = np.bincount(inverse, weights=values, minlength=len(uniq))
+        r, c = np.divmod(uniq, shape[1])
+        indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(r, minlength=shape[0]), out=indptr[1:])
+        return cls(summed, c, indptr, shape)
+
+    @property
+    def nnz(self) -> int:
+        return len(self.data)
+
+    def dot(self, x: np.ndarray) -> np.ndarray:
+        return np.bincount(self._rows, weights=self.data * x[self.indices], minlength=self.shape[0])
+
+    __matmul__ = dot
+
+    def toarray(self) -> np.ndarray:
+        out = np.zeros(self.shape)
+        np.add.at(out, (self._rows, self.indices), self.data)
+        return out
+
+
+def sparse_matrix(rows: np.ndarray, cols: np.ndarray, values: np.ndarray, shape: Tuple[int, int], backend: Optional[str] = None):
+    """CSR matrix from triplets: scipy.sparse if available (or `backend="scipy"`), else CSRMatrix."""
+    use_scipy = SCIPY_AVAILABLE if backend is None else backend == "scipy"
+    if use_scipy:
+        if not SCIPY_AVAILABLE:
+            raise ImportError("scipy is not installed")
+        return _sparse.csr_matrix((np.asarray(values, dtype=float), (rows, cols)), shape=shape)
+    return CSRMatrix.from_coo(rows, cols, values, shape)
+
+
+def coupling_edges(config: Dict, n_layers: int, seed: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (receiver, source, weight) triplets from `config["coupling"]`:
+    {"topology": "chain" | "tree" | "random" | "edges", "strength": 0.05,
+     "branching": 2 (tree), "degree": 3 (random), "edges": [[dst, src, w], ...]}.
+    Chain and tree links spill both ways; random links are directed. Built-in
+    topologies split `strength` evenly over each layer's incoming links; explicit
+    edges keep their own weights.
+    """
+    spec = config.get("coupling") or {}
+    topology = spec.get("topology", "chain")
+    strength = float(spec.get("strength", 0.05))
+    k = np.arange(n_layers)
+    if topology == "chain":
+        dst, src = k[1:], k[:-1]
+        rows, cols = np.concatenate([dst, src]), np.concatenate([src, dst])
+    elif topology == "tree":
+        branching = max(1, int(spec.get("branching", 2)))
+        child = k[1:]
+        parent = (child - 1) // branching
+        rows, cols = np.concatenate([child, parent]), np.concatenate([parent, child])
+    elif topology == "random":
+        degree = max(0, min(int(spec.get("degree", 3)), n_layers - 1))
+        rng = np.random.default_rng(int(spec.get("seed", seed)))
+        rows = np.repeat(k, degree)
+        # Offsets in [1, K) never point a layer at itself.
+        cols = (rows + rng.integers(1, max(n_layers, 2), size=len(rows))) % n_layers
+    elif topology == "edges":
+        edges = np.asarray(spec.get("edges", []), dtype=float).reshape(-1, 3)
+        rows, cols, weights = edges[:, 0].astype(np.int64), edges[:, 1].astype(np.int64), edges[:, 2]
+        if len(rows) and (rows.min() < 0 or cols.min() < 0 or max(rows.max(), cols.max()) >= n_layers):
+            raise ValueError(f"coupling edges must index layers 0..{n_layers - 1}")
+        return rows, cols, weights
+    else:
+        raise ValueError(f"Unknown coupling topology {topology}")
+    in_degree = np.bincount(rows, minlength=n_layers)
+    return rows, cols, strength / in_degree[rows]
+
+
+@dataclass
+class HierarchyResult:
+    """
+    Output of `run_hierarchy`: time-major (T + 1, K) state arrays with the initial
+    state in row 0, plus the scalar summary.
+    """
+
+    layer_ids: List[str]
+    t: np.ndarray
+    stress: np.ndarray
+    protection: np.ndarray
+    novelty: np.ndarray
+    anomaly: np.ndarray
+    summary: Dict[str, Any] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.layer_ids)
+
+    def timeseries(self) -> Dict[str, np.ndarray]:
+        """Arrays for timeseries.npz: t (T + 1,), per-layer series (T + 1, K) and layer_ids."""
+        return {
+            "t": self.t,
+            "stress": self.stress,
+            "protection": self.protection,
+            "novelty": self.novelty,
+            "anomaly_proxy": self.anomaly,
+            "layer_ids": np.asarray(self.layer_ids),
+        }
+
+    def layer(self, k: int) -> Layer:
+        """Layer k as a regular single-layer `Layer` (columns are copied out)."""
+        trajectory = Trajectory.from_arrays(
+            self.t,
+            np.ascontiguousarray(self.stress[:, k]),
+            np.ascontiguousarray(self.protection[:, k]),
+            np.ascontiguousarray(self.novelty[:, k]),
+            labels=[(("regime", "coupled"),)],
+        )
+        return Layer(layer_id=self.layer_ids[k], description="coupled_layers", trajectory=trajectory)
+
+
+def run_hierarchy(config: Dict) -> HierarchyResult:
+    """
+    Evolve `n_layers` coupled layers for `horizon` steps.
+
+    Per layer and step (all layers at once):
+        anomaly    <- clip(decay * anomaly + (1 - decay) * anomaly_base + C @ (anomaly - anomaly_base) + 0.02 z3 + injection)
+        stress     <- clip(stress + 0.05 z0 + 0.1 anomaly)
+        protection <- clip(protection - 0.05 anomaly + 0.02 z1)
+        novelty    <- clip(novelty + 0.05 z2 + 0.05 anomaly)
+    Layers relax to `anomaly_base` and only their excess over it spills, so the
+    hierarchy is stable while decay + coupling strength < 1.
+    `inject` = {"layers": [...], "step": s, "level": a} adds 0.2 * a to those layers from step s on.
+    Noise comes from the provider selected by `config["noise"]`, with 4 terms per layer.
+    """
+    n_layers = int(config.get("n_layers", 8))
+    if n_layers < 1:
+        raise ValueError("coupled_layers needs at least one layer")
+    horizon = int(config.get("horizon", 50))
+    dt = float(config.get("dt", 1.0))
+    seed = int(config.get("seed", 42))
+    decay = float(config.get("anomaly_decay", 0.9))
+    base = float(config.get("anomaly_base", 0.1))
+    threshold = float(config.get("anomaly_threshold", 0.5))
+    inject = config.get("inject") or {}
+    inject_layers = np.asarray(inject.get("layers", [0] if inject else []), dtype=np.int64)
+    inject_step = int(inject.get("step", horizon // 3))
+    inject_boost = 0.2 * float(inject.get("level", 0.8))
+    prefix = config.get("layer_prefix", "L")
+    layer_ids = [f"{prefix}{k}" for k in range(n_layers)]
+
+    rows, cols, weights = coupling_edges(config, n_layers, seed)
+    backend = (config.get("coupling") or {}).get("backend")
+    coupling = sparse_matrix(rows, cols, weights, (n_layers, n_layers), backend)
+
+    stress = np.empty((horizon + 1, n_layers))
+    protection = np.empty((horizon + 1, n_layers))
+    novelty = np.empty((horizon + 1, n_layers))
+    anomaly = np.empty((horizon + 1, n_layers))
+    stress[0], protection[0], novelty[0], anomaly[0] = 0.2, 0.8, 0.1, base
+    injected = np.zeros(n_layers)
+
+    noise = make_noise(config, seed, _TERMS * n_layers)
+    block = max(1, min(256, _NOISE_BLOCK // (_TERMS * n_layers)))
+    zs = np.empty((0, _TERMS, n_layers))
+    for k in range(horizon):
+        j = k % block
+        if j == 0:
+            zs = noise.draw(k, min(block, horizon - k)).reshape(-1, _TERMS, n_layers)
+        z = zs[j]
+        if k == inject_step and len(inject_layers):
+            injected[inject_layers] = inject_boost
+        a = decay * anomaly[k] + (1.0 - decay) * base + coupling @ (anomaly[k] - base) + 0.02 * z[3] + injected
+        np.clip(a, 0.0, 1.0, out=anomaly[k + 1])
+        a = anomaly[k + 1]
+        np.clip(stress[k] + 0.05 * z[0] + 0.1 * a, 0.0, 1.0, out=stress[k + 1])
+        np.clip(protection[k] - 0.05 * a + 0.02 * z[1], 0.0, 1.0, out=protection[k + 1])
+        np.clip(novelty[k] + 0.05 * z[2] + 0.05 * a, 0.0, 1.0, out=novelty[k + 1])
+
+    result = HierarchyResult(
+        layer_ids=layer_ids,
+        t=np.arange(horizon + 1) * dt,
+        stress=stress,
+        protection=protection,
+        novelty=novelty,
+        anomaly=anomaly,
+    )
+    result.summary = _summarize(result, config, coupling, inject_layers, threshold)
+    return result
+
+
+def _summarize(result: HierarchyResult, config: Dict, coupling, inject_layers: np.ndarray, threshold: float) -> Dict[str, Any]:
+    anomaly = result.anomaly
+    above = anomaly >= threshold
+    affected = above.any(axis=0)
+    # Spillover: first time a layer that was not injected crosses the threshold.
+    spread = above.copy()
+    if len(inject_layers):
+        spread[:, inject_layers] = False
+    spread_rows = np.flatnonzero(spread.any(axis=1))
+    peak = np.unravel_index(int(np.argmax(anomaly)), anomaly.shape)
+    return {
+        "scenario": "coupled_layers",
+        "seed": int(config.get("seed", 42)),
+        "n_layers": len(result),
+        "coupling_nnz": int(coupling.nnz),
+        "sparse_backend": "scipy" if not isinstance(coupling, CSRMatrix) else "numpy",
+        "anomaly_threshold": threshold,
+        "affected_layers": int(np.sum(affected)),
+        "spillover_time": float(result.t[spread_rows[0]]) if len(spread_rows) else -1,
+        "peak_anomaly": float(anomaly[peak]),
+        "peak_layer": result.layer_ids[int(peak[1])],
+        "final_anomaly_mean": float(np.mean(anomaly[-1])),
+        "final_stress_mean": float(np.mean(result.stress[-1])),
+    }
+
@@ -1,45 +1,250 @@
 """
 IO helpers for QMPT simulation results.
+
+Every backend persists a run through `write_run_results`: metrics (run metrics,
+calibration and `derived_metrics`) are computed from the in-memory series, then
+timeseries.npz, metrics.json and patterns.json are each written once, to a
+temporary file in the run directory that is renamed over the target. Readers
+never see a partial artifact and callers get the metrics back without a read.
 """
 
 from __future__ import annotations
 
 import json
+import os
+import uuid
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Optional, Iterable, Any, BinaryIO, IO, Tuple
 import numpy as np
 
 from .models import Layer
-from .metrics import compute_run_metrics, METRICS_SCHEMA_VERSION
+from .metrics import compute_run_metrics, RunMetricsAccumulator, METRICS_SCHEMA_VERSION
+from .calibration import PRED_KEYS, TRUTH_KEYS, calibrate_runs
+from .expressions import SeriesSource, derived_fields
+
+_NPY_HEADER_SIZE = 128
 
 
-def save_run_results(run_id: str, layer: Layer, summary: Dict, base_dir: Path, config: Optional[Dict] = None) -> None:
+def write_run_results(
+    base_dir: Path,
+    summary: Dict[str, Any],
+    timeseries: Dict[str, Any],
+    config: Optional[Dict] = None,
+    extra: Optional[Dict[str, Any]] = None,
+    patterns=None,
+) -> Dict[str, Any]:
+    """
+    Single-write result stage shared by all backends. Computes run metrics,
+    calibration and the config's `derived_metrics` from `timeseries`, then writes
+    timeseries.npz (numeric series), metrics.json and, when `patterns` is given,
+    patterns.json atomically. Returns the metrics as written.
+    """
+    series = numeric_series(timeseries)
+    metrics = run_metrics(summary, timeseries, config, extra)
     base_dir.mkdir(parents=True, exist_ok=True)
-    metrics_path = base_dir / "metrics.json"
-    timeseries_path = base_dir / "timeseries.npz"
-    patterns_path = base_dir / "patterns.json"
+    atomic_write(base_dir / "timeseries.npz", lambda fh: np.savez(fh, **series))
+    write_json(base_dir / "metrics.json", metrics)
+    if patterns is not None:
+        write_json(base_dir / "patterns.json", pattern_records(patterns))
+    return metrics
+
+
+def run_metrics(
+    summary: Dict[str, Any],
+    timeseries: Dict[str, Any],
+    config: Optional[Dict] = None,
+    extra: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Metrics of one run as stored: summary, run metrics, calibration and `derived_metrics` over `timeseries`."""
+    config = config or {}
+    series = {k: np.asarray(v) for k, v in timeseries.items()}
+    derived = compute_run_metrics(series, config)
+    derived.update(calibrate_runs([series], config))
+    return _merge_metrics(summary, extra, derived, config, series)
+
+
+def numeric_series(timeseries: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """The numeric arrays of `timeseries` (what gets stored)."""
+    arrays = {k: np.asarray(v) for k, v in timeseries.items()}
+    return {k: v for k, v in arrays.items() if v.dtype.kind in "biuf"}
+
+
+def _merge_metrics(
+    summary: Dict[str, Any],
+    extra: Optional[Dict[str, Any]],
+    derived: Dict[str, Any],
+    config: Dict[str, Any],
+    series: SeriesSource,
+) -> Dict[str, Any]:
+    metrics = {"metrics_schema_version": METRICS_SCHEMA_VERSION, **summary, **(extra or {}), **derived}
+    exprs = config.get("derived_metrics") or {}
+    if exprs:
+        metrics.update(derived_fields(metrics, exprs, series))
+    return metrics
+
+
+def save_run_results(run_id: str, layer: Layer, summary: Dict, base_dir: Path, config: Optional[Dict] = None, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Write a single-layer run (trajectory plus numeric `summary["timeseries"]` extras); returns the metrics."""
+    return write_run_results(base_dir, summary, layer_timeseries(layer, summary), config, extra, layer.patterns)
+
+
+def layer_timeseries(layer: Layer, summary: Dict) -> Dict[str, np.ndarray]:
+    """Trajectory series of a layer plus the scenario's `summary["timeseries"]` extras (popped from `summary`)."""
     extra_ts = summary.pop("timeseries", None)
 
-    t = np.array([s.t for s in layer.trajectory])
-    stress = np.array([s.stress for s in layer.trajectory])
-    protection = np.array([s.protection for s in layer.trajectory])
-    novelty = np.array([s.novelty for s in layer.trajectory])
-    np.savez(timeseries_path, t=t, stress=stress, protection=protection, novelty=novelty)
+    traj = layer.trajectory
+    t, stress, protection, novelty = traj.t, traj.stress, traj.protection, traj.novelty
 
     timeseries_payload = {"t": t, "stress": stress, "protection": protection, "novelty": novelty}
     if isinstance(extra_ts, dict):
         for k, v in extra_ts.items():
             try:
-                timeseries_payload[k] = np.array(v)
+                timeseries_payload[k] = np.asarray(v)
             except Exception:
                 continue
-    if config is None:
-        config = {}
-    derived = compute_run_metrics(timeseries_payload, config)
-    merged_metrics = {"metrics_schema_version": METRICS_SCHEMA_VERSION, **summary, **derived}
-    metrics_path.write_text(json.dumps(merged_metrics, indent=2), encoding="utf-8")
+    # Numeric extras (e.g. anomaly_proxy / anomaly_ground_truth) are stored too,
+    # so run-level analyses can be redone from disk.
+    return timeseries_payload
+
+
+def save_run_stream(
+    run_id: str,
+    stream: Iterable[Dict[str, np.ndarray]],
+    base_dir: Path,
+    config: Optional[Dict] = None,
+    extra: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Consume a chunked scenario (e.g. `scenarios.ScenarioStream`) without holding it in memory.
+
+    Every chunk is appended to `series/<name>.npy` as it arrives and folded into a
+    `RunMetricsAccumulator`; metrics.json and patterns.json are written at the end.
+    Derived metrics read the stored columns memory-mapped. Returns the merged metrics.
+    """
+    config = config or {}
+    base_dir.mkdir(parents=True, exist_ok=True)
+    writer = ColumnWriter(base_dir / "series")
+    acc = RunMetricsAccumulator(config)
+    try:
+        for chunk in stream:
+            writer.append(chunk)
+            acc.update(chunk)
+    finally:
+        writer.close()
+    summary = dict(getattr(stream, "summary", None) or {})
+    derived = acc.result()
+    derived.update(calibrate_runs([load_run_series(base_dir, PRED_KEYS + TRUTH_KEYS)], config))
+    merged_metrics = _merge_metrics(summary, extra, derived, config, lambda keys: load_run_series(base_dir, keys))
+    write_json(base_dir / "metrics.json", merged_metrics)
+    write_json(base_dir / "patterns.json", pattern_records(getattr(stream, "patterns", [])))
+    return merged_metrics
+
+
+def load_run_series(result_dir: Path, keys: Optional[Iterable[str]] = None) -> Dict[str, np.ndarray]:
+    """
+    Stored series of one run: `keys` (all when None) from timeseries.npz, or from
+    memory-mapped series/<key>.npy for streamed runs. Missing keys are left out;
+    only the requested members of the archive are read.
+    """
+    result_dir = Path(result_dir)
+    out: Dict[str, np.ndarray] = {}
+    npz_path = result_dir / "timeseries.npz"
+    if npz_path.exists():
+        with np.load(npz_path) as data:
+            for key in data.files if keys is None else keys:
+                if key in data.files:
+                    out[key] = data[key]
+        return out
+    series_dir = result_dir / "series"
+    if series_dir.is_dir():
+        names = [p.stem for p in series_dir.glob("*.npy")] if keys is None else keys
+        for key in names:
+            path = series_dir / f"{key}.npy"
+            if path.exists():
+                out[key] = np.load(path, mmap_mode="r")
+    return out
+
+
+class ColumnWriter:
+    """
+    Append-only writer of columns, one `<name>.npy` file per key. Chunks are
+    appended along the first axis; rows keep the shape of the first chunk
+    (scalars for 1-D series, (K,) for per-layer series).
+
+    Data is written as it arrives, to `<name>.npy.tmp`; on `close` the .npy
+    header is rewritten with the final length and the file is renamed into
+    place, so the files load with `np.load(..., mmap_mode="r")`.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._files: Dict[str, BinaryIO] = {}
+        self._dtypes: Dict[str, np.dtype] = {}
+        self._rows: Dict[str, Tuple[int, ...]] = {}
+        self.lengths: Dict[str, int] = {}
+
+    def fits(self, key: str, values: Any) -> bool:
+        """Whether `values` can be appended to `key` as is (same row shape and dtype, or a new key)."""
+        arr = np.asarray(values)
+        return arr.ndim == 0 or key not in self._files or (arr.shape[1:] == self._rows[key] and arr.dtype == self._dtypes[key])
+
+    def append(self, chunk: Dict[str, Any]) -> None:
+        for key, values in chunk.items():
+            arr = np.asarray(values)
+            if arr.ndim == 0:
+                continue
+            fh = self._files.get(key)
+            if fh is None:
+                fh = (self.directory / f"{key}.npy.tmp").open("wb")
+                self._files[key] = fh
+                self._dtypes[key] = arr.dtype
+                self._rows[key] = arr.shape[1:]
+                self.lengths[key] = 0
+                fh.write(_npy_header(arr.dtype, (0,) + arr.shape[1:]))
+            elif arr.shape[1:] != self._rows[key]:
+                raise ValueError(f"Column {key} has rows of shape {self._rows[key]}, got {arr.shape[1:]}")
+            fh.write(np.ascontiguousarray(arr, dtype=self._dtypes[key]).tobytes())
+            self.lengths[key] += len(arr)
+
+    def close(self) -> None:
+        for key, fh in self._files.items():
+            fh.seek(0)
+            fh.write(_npy_header(self._dtypes[key], (self.lengths[key],) + self._rows[key]))
+            fh.close()
+            os.replace(self.directory / f"{key}.npy.tmp", self.directory / f"{key}.npy")
+        self._files = {}
+
+
+def _npy_header(dtype: np.dtype, shape: Tuple[int, ...]) -> bytes:
+    """Fixed-size .npy v1.0 header for a C-order array, so it can be patched in place."""
+    header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (np.lib.format.dtype_to_descr(np.dtype(dtype)), tuple(shape))
+    header = header.ljust(_NPY_HEADER_SIZE - 11) + "\n"
+    return b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode("latin1")
+
+
+def atomic_write(path: Path, write: Callable[[IO[bytes]], Any]) -> None:
+    """Run `write` on a temporary file next to `path`, then rename it over `path`."""
+    # A unique name (not mkstemp) keeps the default file mode of the directory.
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with tmp.open("xb") as fh:
+            write(fh)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def write_json(path: Path, payload: Any) -> None:
+    """`payload` as indented JSON, written atomically."""
+    data = json.dumps(payload, indent=2).encode("utf-8")
+    atomic_write(path, lambda fh: fh.write(data))
+
 
-    patterns = [
+def pattern_records(patterns) -> List[Dict[str, Any]]:
+    """Patterns as the dicts stored in patterns.json."""
+    return [
         {
             "pattern_id": p.pattern_id,
             "layer_id": p.layer_id,
@@ -47,6 +252,5 @@ def save_run_results(run_id: str, layer: Layer, summary: Dict, base_dir: Path, c
             "reflexivity": p.reflexivity,
             "self_operator": p.self_operator,
         }
-        for p in layer.patterns
+        for p in patterns
     ]
-    patterns_path.write_text(json.dumps(patterns, indent=2), encoding="utf-8")
@@ -5,71 +5,304 @@ Shape follows QMPT specs: A(Ψ), R_norm(Ψ), O_self(Ψ).
 
 from __future__ import annotations
 
-from typing import List, Dict, Any, Tuple
+from collections import OrderedDict
+from typing import List, Dict, Any, Tuple, Optional, Union
 import numpy as np
 
-from .models import Pattern
-
-METRICS_SCHEMA_VERSION = "0.2"
+from .models import Pattern, PatternPopulation
+from .bootstrap import bootstrap_settings, mean_ci
+from .neighbors import NeighborIndex, knn_distance, local_outlier_factor
+from .quantiles import KLLSketch
 
+try:
+    from scipy.linalg import solve_triangular as _solve_triangular
+except Exception:
+    _solve_triangular = None  # type: ignore
 
-def estimate_anomaly(patterns: List[Pattern]) -> None:
+METRICS_SCHEMA_VERSION = "0.2"
+ANOMALY_METHODS = ("mean", "knn", "lof", "mahalanobis")
+# Run-level metrics aggregated across an ensemble.
+_ENSEMBLE_KEYS = ["max_sigma", "sigma_mean", "anomaly_mean", "entropy_mean", "quantum_instability"]
+
+
+def estimate_anomaly(
+    patterns: Union[List[Pattern], PatternPopulation],
+    method: str = "mean",
+    k: int = 10,
+    index: Optional[NeighborIndex] = None,
+    scorer: Optional["MahalanobisScorer"] = None,
+) -> None:
     """
     Compute a toy anomaly score:
     A = w1 * rarity + w2 * distance + w3 * impact
 
     rarity   ~ inverse feature norm
-    distance ~ distance from mean feature vector
+    distance ~ by `method`: "mean" = distance from mean feature vector,
+               "knn" = mean distance to the k nearest patterns,
+               "lof" = local outlier factor over the k nearest patterns,
+               "mahalanobis" = Mahalanobis distance under the feature covariance
     impact   ~ free scalar from metadata ("impact" fallback to 0.1)
+
+    Accepts a list of patterns or a PatternPopulation; both run as whole-matrix ops.
+    A population with a JL sketch attached is scored on the sketch.
+    "knn"/"lof" reuse `index` when given (a NeighborIndex over the featured rows);
+    "mahalanobis" scores against `scorer` when given, else fits one to the rows.
     """
-    if not patterns:
-        return
-    feats = [p.features for p in patterns if p.features is not None]
-    if not feats:
-        for p in patterns:
-            p.anomaly_score = 0.1
+    if method not in ANOMALY_METHODS:
+        raise ValueError(f"Unknown anomaly method {method}")
+    if isinstance(patterns, list):
+        if patterns:
+            _on_population(patterns, lambda pop: estimate_anomaly(pop, method, k, index, scorer))
         return
-    stacked = np.stack(feats)
-    mean_vec = np.mean(stacked, axis=0)
-    for p in patterns:
-        if p.features is None:
-            p.anomaly_score = 0.1
-            continue
-        rarity = 1.0 / (np.linalg.norm(p.features) + 1e-6)
-        distance = float(np.linalg.norm(p.features - mean_vec))
-        impact = float(p.metadata.get("impact", 0.1))
-        p.anomaly_score = float(0.5 * rarity + 0.3 * distance + 0.2 * impact)
-
-
-def estimate_reflexivity(patterns: List[Pattern]) -> None:
+    pop = patterns
+    score = np.full(len(pop), 0.1)
+    mask = pop.has_features
+    if np.any(mask):
+        feats = _feature_rows(pop, mask)
+        rarity = 1.0 / (np.linalg.norm(feats, axis=1) + 1e-6)
+        if method == "mean":
+            mean_vec = np.mean(feats, axis=0)
+            distance = np.linalg.norm(feats - mean_vec, axis=1)
+        elif method == "mahalanobis":
+            distance = (scorer or MahalanobisScorer.from_features(feats)).score(feats)
+        else:
+            if index is None:
+                index = NeighborIndex(feats)
+            dist, idx = index.query_self(max(1, min(int(k), len(feats) - 1)))
+            distance = knn_distance(dist) if method == "knn" else local_outlier_factor(dist, idx)
+        score[mask] = 0.5 * rarity + 0.3 * distance + 0.2 * pop.impact[mask]
+    pop.anomaly_score = score
+
+
+def estimate_reflexivity(patterns: Union[List[Pattern], PatternPopulation]) -> None:
     """
     Toy reflexivity R_norm in [0,1]:
     R_norm = sigmoid(var(features)) where variance approximates self-model richness.
     """
-    for p in patterns:
-        if p.features is None:
-            p.reflexivity = 0.2
-            continue
-        var = float(np.var(p.features))
-        p.reflexivity = float(1.0 / (1.0 + np.exp(-var)))
+    if isinstance(patterns, list):
+        _on_population(patterns, estimate_reflexivity)
+        return
+    pop = patterns
+    refl = np.full(len(pop), 0.2)
+    mask = pop.has_features
+    if np.any(mask):
+        var = pop.sketch.row_variance()[mask] if pop.sketch is not None else np.var(pop.features[mask], axis=1)
+        refl[mask] = 1.0 / (1.0 + np.exp(-var))
+    pop.reflexivity = refl
 
 
-def estimate_self_operator(patterns: List[Pattern]) -> None:
+def estimate_self_operator(patterns: Union[List[Pattern], PatternPopulation]) -> None:
     """
     O_self = alpha_pop * Q_pop + alpha_self * Q_self + alpha_meta * Q_meta + alpha_R * R_norm.
     Here we synthesize Q_pop/Q_self/Q_meta from simple heuristics.
     """
+    if isinstance(patterns, list):
+        _on_population(patterns, estimate_self_operator)
+        return
+    pop = patterns
     alpha_pop = 0.25
     alpha_self = 0.25
     alpha_meta = 0.25
     alpha_R = 0.25
-    for p in patterns:
-        rarity_proxy = 1.0 / (np.linalg.norm(p.features) + 1e-6) if p.features is not None else 0.1
-        q_pop = min(1.0, rarity_proxy)
-        q_self = min(1.0, abs(p.anomaly_score or 0.0) / 5.0)
-        q_meta = min(1.0, (p.metadata.get("meta_consistency", 0.2)))
-        r_norm = p.reflexivity or 0.0
-        p.self_operator = float(alpha_pop * q_pop + alpha_self * q_self + alpha_meta * q_meta + alpha_R * r_norm)
+    rarity_proxy = np.full(len(pop), 0.1)
+    mask = pop.has_features
+    if np.any(mask):
+        rarity_proxy[mask] = 1.0 / (np.linalg.norm(_feature_rows(pop, mask), axis=1) + 1e-6)
+    q_pop = np.minimum(1.0, rarity_proxy)
+    q_self = np.minimum(1.0, np.abs(_filled(pop.anomaly_score, len(pop))) / 5.0)
+    q_meta = np.minimum(1.0, pop.meta_consistency)
+    r_norm = _filled(pop.reflexivity, len(pop))
+    pop.self_operator = alpha_pop * q_pop + alpha_self * q_self + alpha_meta * q_meta + alpha_R * r_norm
+
+
+class PopulationAggregate:
+    """
+    Cached A-statistics (count, mean, std) of a pattern population.
+
+    Scenario steps read `mean` in O(1); dynamic populations keep it current with
+    `add`, `remove` and `mutate` instead of re-averaging every pattern each step.
+    Call `refresh` to rebuild the sums exactly after many updates.
+    """
+
+    def __init__(self, scores: Optional[np.ndarray] = None) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        if scores is not None:
+            self.refresh(scores)
+
+    @classmethod
+    def from_population(cls, population: PatternPopulation) -> "PopulationAggregate":
+        return cls(_filled(population.anomaly_score, len(population)))
+
+    def refresh(self, scores: np.ndarray) -> None:
+        scores = np.asarray(scores, dtype=float)
+        self.count = int(scores.size)
+        self.total = float(np.sum(scores))
+        self.total_sq = float(np.sum(scores * scores))
+
+    def add(self, scores: Union[float, np.ndarray]) -> None:
+        scores = np.atleast_1d(np.asarray(scores, dtype=float))
+        self.count += int(scores.size)
+        self.total += float(np.sum(scores))
+        self.total_sq += float(np.sum(scores * scores))
+
+    def remove(self, scores: Union[float, np.ndarray]) -> None:
+        scores = np.atleast_1d(np.asarray(scores, dtype=float))
+        if scores.size > self.count:
+            raise ValueError("cannot remove more patterns than the aggregate holds")
+        self.count -= int(scores.size)
+        self.total -= float(np.sum(scores))
+        self.total_sq -= float(np.sum(scores * scores))
+
+    def mutate(self, old_scores: Union[float, np.ndarray], new_scores: Union[float, np.ndarray]) -> None:
+        old_scores = np.atleast_1d(np.asarray(old_scores, dtype=float))
+        new_scores = np.atleast_1d(np.asarray(new_scores, dtype=float))
+        if old_scores.shape != new_scores.shape:
+            raise ValueError("mutate needs matching old/new score shapes")
+        self.total += float(np.sum(new_scores) - np.sum(old_scores))
+        self.total_sq += float(np.sum(new_scores * new_scores) - np.sum(old_scores * old_scores))
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        if not self.count:
+            return 0.0
+        return float(np.sqrt(max(0.0, self.total_sq / self.count - self.mean ** 2)))
+
+
+class MahalanobisScorer:
+    """
+    Running mean and scatter of pattern features with a cached Cholesky factor.
+
+    The factor L satisfies L L^T = S + ridge * I, where S is the scatter matrix
+    sum (x - mean)(x - mean)^T. `add` and `remove` keep it current with rank-1
+    updates and downdates, one per pattern. Batches of at least
+    max(_MIN_REFACTOR_ROWS, dim // 8) rows refactor from S instead. `score` returns Mahalanobis distances for a batch of
+    patterns from one triangular solve.
+    """
+
+    _MIN_REFACTOR_ROWS = 4
+
+    def __init__(self, dim: int, ridge: float = 1e-6) -> None:
+        self.dim = int(dim)
+        self.ridge = float(ridge)
+        self._refactor_rows = max(self._MIN_REFACTOR_ROWS, self.dim // 8)
+        self.clear()
+
+    @classmethod
+    def from_features(cls, features: np.ndarray, ridge: float = 1e-6) -> "MahalanobisScorer":
+        features = np.atleast_2d(np.asarray(features, dtype=float))
+        scorer = cls(features.shape[1], ridge)
+        scorer.add(features)
+        return scorer
+
+    def clear(self) -> None:
+        self.count = 0
+        self.mean = np.zeros(self.dim)
+        self.scatter = np.zeros((self.dim, self.dim))
+        self.factor = np.sqrt(self.ridge) * np.eye(self.dim)
+
+    @property
+    def covariance(self) -> np.ndarray:
+        return self.scatter / max(self.count - 1, 1)
+
+    def add(self, features: np.ndarray) -> None:
+        features = np.atleast_2d(np.asarray(features, dtype=float))
+        if len(features) >= self._refactor_rows:
+            n_b = len(features)
+            mean_b = features.mean(axis=0)
+            centered = features - mean_b
+            delta = mean_b - self.mean
+            total = self.count + n_b
+            self.scatter += centered.T @ centered + np.outer(delta, delta) * (self.count * n_b / total)
+            self.mean += delta * (n_b / total)
+            self.count = total
+            self._refactor()
+            return
+        for x in features:
+            n = self.count + 1
+            delta = x - self.mean
+            self.mean += delta / n
+            self._rank1(np.sqrt(self.count / n) * delta, 1.0)
+            self.count = n
+
+    def remove(self, features: np.ndarray) -> None:
+        features = np.atleast_2d(np.asarray(features, dtype=float))
+        if len(features) > self.count:
+            raise ValueError("cannot remove more patterns than the scorer holds")
+        if len(features) == self.count:
+            self.clear()
+            return
+        if len(features) >= self._refactor_rows:
+            n_b = len(features)
+            mean_b = features.mean(axis=0)
+            centered = features - mean_b
+            total = self.count - n_b
+            mean = (self.count * self.mean - n_b * mean_b) / total
+            delta = mean_b - mean
+            self.scatter -= centered.T @ centered + np.outer(delta, delta) * (total * n_b / self.count)
+            self.mean = mean
+            self.count = total
+            self._refactor()
+            return
+        for x in features:
+            n = self.count - 1
+            delta = x - self.mean
+            self.mean -= delta / n
+            self._rank1(np.sqrt(self.count / n) * delta, -1.0)
+            self.count = n
+
+    def score(self, features: np.ndarray) -> np.ndarray:
+        """Mahalanobis distance of each row to the running mean under the running covariance."""
+        features = np.atleast_2d(np.asarray(features, dtype=float))
+        y = _solve_lower(self.factor, (features - self.mean).T)
+        return np.sqrt(max(self.count - 1, 1) * np.einsum("ij,ij->j", y, y))
+
+    def _rank1(self, x: np.ndarray, sign: float) -> None:
+        """L L^T += sign * x x^T; falls back to refactoring if a downdate loses definiteness."""
+        self.scatter += sign * np.outer(x, x)
+        L = self.factor
+        x = x.copy()
+        for k in range(self.dim):
+            r2 = L[k, k] ** 2 + sign * x[k] ** 2
+            if r2 <= 0.0:
+                self._refactor()
+                return
+            r = np.sqrt(r2)
+            c, s = r / L[k, k], x[k] / L[k, k]
+            L[k, k] = r
+            L[k + 1 :, k] = (L[k + 1 :, k] + sign * s * x[k + 1 :]) / c
+            x[k + 1 :] = c * x[k + 1 :] - s * L[k + 1 :, k]
+
+    def _refactor(self) -> None:
+        self.factor = np.linalg.cholesky(self.scatter + self.ridge * np.eye(self.dim))
+
+
+def _solve_lower(L: np.ndarray, b: np.ndarray) -> np.ndarray:
+    if _solve_triangular is not None:
+        return _solve_triangular(L, b, lower=True, check_finite=False)
+    return np.linalg.solve(L, b)
+
+
+def _on_population(patterns: List[Pattern], estimator) -> None:
+    pop = PatternPopulation.from_patterns(patterns)
+    estimator(pop)
+    pop.write_back(patterns)
+
+
+def _feature_rows(pop: PatternPopulation, mask: np.ndarray) -> np.ndarray:
+    """Featured rows the estimators read: the JL sketch when one is attached, else the raw features."""
+    return pop.sketch.features[mask] if pop.sketch is not None else pop.features[mask]
+
+
+def _filled(column: Optional[np.ndarray], n: int) -> np.ndarray:
+    if column is None:
+        return np.zeros(n)
+    return np.nan_to_num(column, nan=0.0)
 
 
 def compute_run_metrics(timeseries: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, float]:
@@ -109,133 +342,565 @@ def compute_run_metrics(timeseries: Dict[str, Any], config: Dict[str, Any]) -> D
     return metrics
 
 
-def compute_ensemble_summary(run_metrics_list: List[Dict[str, float]]) -> Dict[str, float]:
+def compute_run_metrics_batch(
+    timeseries: Dict[str, Any], config: Dict[str, Any], offsets: Optional[np.ndarray] = None
+) -> Dict[str, np.ndarray]:
+    """
+    `compute_run_metrics` for many runs at once: one (n_runs,) array per metric.
+
+    Series are (n_runs, T) arrays reduced along axis 1, or, when `offsets`
+    (n_runs + 1 ascending positions) is given, concatenated 1-D arrays where run
+    i is values[offsets[i]:offsets[i + 1]], reduced per segment. A run with an
+    empty series gets NaN for that series' metrics. The schema version is not
+    repeated per run.
+    """
+    sigma = _segments(timeseries, ["stress", "sigma_k"], offsets)
+    anomaly_idx = _segments(timeseries, ["anomaly_proxy", "anomaly_index"], offsets)
+    expectation = _segments(timeseries, ["expectation_mean"], offsets)
+    entropy = _segments(timeseries, ["entropy"], offsets)
+    metrics: Dict[str, np.ndarray] = {}
+    sigma_crit = float(config.get("sigma_crit", 0.8))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if sigma is not None:
+            metrics["max_sigma"] = sigma.max()
+            metrics["sigma_time_above_crit"] = sigma.mean(sigma.values > sigma_crit)
+            metrics["sigma_mean"] = sigma.mean()
+            metrics["sigma_std"] = sigma.std()
+        if anomaly_idx is not None:
+            metrics["anomaly_mean"] = anomaly_idx.mean()
+            metrics["anomaly_std"] = anomaly_idx.std()
+        if expectation is not None:
+            metrics["expectation_mean"] = expectation.mean()
+            metrics["expectation_std"] = expectation.std()
+            metrics["quantum_instability"] = expectation.mean(np.abs(expectation.values))
+        if entropy is not None:
+            metrics["entropy_mean"] = entropy.mean()
+            metrics["entropy_std"] = entropy.std()
+        gt_anom = _segments(timeseries, ["anomaly_ground_truth", "anomaly_gt"], offsets)
+        if gt_anom is not None and anomaly_idx is not None and gt_anom.values.shape == anomaly_idx.values.shape:
+            threshold = config.get("anomaly_threshold", 0.5)
+            pred, truth = anomaly_idx.values, gt_anom.values
+            pred_bin, truth_bin = pred >= threshold, truth >= threshold
+            counts = np.stack(
+                [
+                    anomaly_idx.sum((pred - truth) ** 2),
+                    anomaly_idx.sum(pred - truth),
+                    anomaly_idx.sum(pred_bin & truth_bin),
+                    anomaly_idx.sum(pred_bin & ~truth_bin),
+                    anomaly_idx.sum(~pred_bin & truth_bin),
+                    anomaly_idx.sum(~pred_bin & ~truth_bin),
+                    anomaly_idx.counts.astype(float),
+                ]
+            )
+            metrics.update(_calibration_from_counts(counts))
+    return metrics
+
+
+class _Segments:
+    """Series of many runs, as (n_runs, T) rows or a flat array split by offsets."""
+
+    def __init__(self, values: np.ndarray, offsets: Optional[np.ndarray]) -> None:
+        values = np.asarray(values, dtype=float)
+        if offsets is None:
+            if values.ndim != 2:
+                raise ValueError("batched series must be (n_runs, T) arrays unless offsets are given")
+            self.starts = None
+            self.counts = np.full(values.shape[0], values.shape[1], dtype=np.int64)
+        else:
+            offsets = np.asarray(offsets, dtype=np.int64)
+            if values.ndim != 1 or len(offsets) < 1 or offsets[0] != 0 or offsets[-1] != len(values) or np.any(np.diff(offsets) < 0):
+                raise ValueError("offsets must rise from 0 to the length of each flat series")
+            self.counts = np.diff(offsets)
+            # reduceat over the non-empty runs only: each then spans up to the
+            # next non-empty start, which skips the empty runs in between.
+            self.starts = offsets[:-1][self.counts > 0]
+        self.values = values
+
+    def _reduce(self, ufunc, x: np.ndarray) -> np.ndarray:
+        if self.starts is None:
+            return ufunc.reduce(x, axis=1).astype(float) if x.size else np.full(len(self.counts), np.nan)
+        out = np.full(len(self.counts), np.nan)
+        if len(self.starts):
+            out[self.counts > 0] = ufunc.reduceat(x, self.starts)
+        return out
+
+    def sum(self, x: np.ndarray) -> np.ndarray:
+        return self._reduce(np.add, x)
+
+    def mean(self, x: Optional[np.ndarray] = None) -> np.ndarray:
+        return self.sum(self.values if x is None else x) / self.counts
+
+    def max(self) -> np.ndarray:
+        return self._reduce(np.maximum, self.values)
+
+    def std(self) -> np.ndarray:
+        mean = self.mean()
+        if self.starts is None:
+            dev = self.values - mean[:, None]
+        else:
+            dev = self.values - np.repeat(mean, self.counts)
+        return np.sqrt(self.sum(dev * dev) / self.counts)
+
+
+def _segments(timeseries: Dict[str, Any], keys: List[str], offsets: Optional[np.ndarray]) -> Optional[_Segments]:
+    arr = _arr(timeseries, keys)
+    return None if arr is None else _Segments(arr, offsets)
+
+
+class _Moments:
+    """Count/mean/M2/min/max of a series, merged chunk by chunk (Welford/Chan)."""
+
+    __slots__ = ("n", "mean", "m2", "min", "max", "abs_sum", "above")
+
+    def __init__(self) -> None:
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.abs_sum = 0.0
+        self.above = 0
+
+    def update(self, x: np.ndarray, crit: Optional[float] = None) -> None:
+        n_b = x.size
+        if n_b == 0:
+            return
+        mean_b = float(np.mean(x))
+        m2_b = float(np.sum((x - mean_b) ** 2))
+        if self.n == 0:
+            self.mean, self.m2 = mean_b, m2_b
+        else:
+            n = self.n + n_b
+            delta = mean_b - self.mean
+            self.mean += delta * n_b / n
+            self.m2 += m2_b + delta * delta * self.n * n_b / n
+        self.n += n_b
+        self.min = min(self.min, float(np.min(x)))
+        self.max = max(self.max, float(np.max(x)))
+        self.abs_sum += float(np.sum(np.abs(x)))
+        if crit is not None:
+            self.above += int(np.sum(x > crit))
+
+    def merge(self, other: "_Moments") -> None:
+        if other.n == 0:
+            return
+        if self.n == 0:
+            self.mean, self.m2 = other.mean, other.m2
+        else:
+            n = self.n + other.n
+            delta = other.mean - self.mean
+            self.mean += delta * other.n / n
+            self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.abs_sum += other.abs_sum
+        self.above += other.above
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.m2 / self.n)) if self.n else 0.0
+
+
+class RunMetricsAccumulator:
+    """
+    Online counterpart of `compute_run_metrics`.
+
+    Feed timeseries chunks with `update`; `result()` returns the same run-level
+    metrics as calling `compute_run_metrics` on the concatenated series, while
+    memory stays constant in the run length.
+    """
+
+    _SIGMA = ["stress", "sigma_k"]
+    _ANOMALY = ["anomaly_proxy", "anomaly_index"]
+    _TRUTH = ["anomaly_ground_truth", "anomaly_gt"]
+    _TRACKED = _SIGMA + _ANOMALY + _TRUTH + ["expectation_mean", "entropy"]
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None) -> None:
+        config = config or {}
+        self.sigma_crit = float(config.get("sigma_crit", 0.8))
+        self.threshold = config.get("anomaly_threshold", 0.5)
+        self.moments: Dict[str, _Moments] = {}
+        self.calibration = np.zeros(7)
+
+    def update(self, chunk: Dict[str, Any]) -> None:
+        for key in self._TRACKED:
+            if key in chunk:
+                crit = self.sigma_crit if key in self._SIGMA else None
+                self.moments.setdefault(key, _Moments()).update(np.asarray(chunk[key], dtype=float), crit)
+        pred = _arr(chunk, self._ANOMALY)
+        truth = _arr(chunk, self._TRUTH)
+        if pred is not None and truth is not None and pred.size == truth.size:
+            self.calibration += _calibration_counts(pred, truth, threshold=self.threshold)
+
+    def _first(self, keys: List[str]) -> Optional[_Moments]:
+        for k in keys:
+            if k in self.moments:
+                return self.moments[k]
+        return None
+
+    def result(self) -> Dict[str, float]:
+        metrics: Dict[str, float] = {}
+        sigma = self._first(self._SIGMA)
+        anomaly_idx = self._first(self._ANOMALY)
+        expectation = self._first(["expectation_mean"])
+        entropy = self._first(["entropy"])
+        if sigma is not None and sigma.n > 0:
+            metrics["max_sigma"] = sigma.max
+            metrics["sigma_time_above_crit"] = sigma.above / sigma.n
+            metrics["sigma_mean"] = sigma.mean
+            metrics["sigma_std"] = sigma.std
+        if anomaly_idx is not None and anomaly_idx.n > 0:
+            metrics["anomaly_mean"] = anomaly_idx.mean
+            metrics["anomaly_std"] = anomaly_idx.std
+        if expectation is not None and expectation.n > 0:
+            metrics["expectation_mean"] = expectation.mean
+            metrics["expectation_std"] = expectation.std
+            metrics["quantum_instability"] = expectation.abs_sum / expectation.n
+        if entropy is not None and entropy.n > 0:
+            metrics["entropy_mean"] = entropy.mean
+            metrics["entropy_std"] = entropy.std
+        truth = self._first(self._TRUTH)
+        if truth is not None and anomaly_idx is not None and truth.n == anomaly_idx.n and self.calibration[6] > 0:
+            metrics.update(_calibration_from_counts(self.calibration))
+        metrics["metrics_schema_version"] = METRICS_SCHEMA_VERSION
+        return metrics
+
+
+class EnsembleAccumulator:
+    """
+    Streaming counterpart of `compute_ensemble_summary`, one run's metrics at a time.
+
+    Per key it keeps Welford moments and a `KLLSketch`, so memory does not grow
+    with the number of runs. `merge` combines accumulators filled by different
+    workers or shards (they pickle as plain state). `result()` reports the
+    summary's runs/mean/std/min/max/near_breakdown_runs plus approximate
+    p50/p95/p99; bootstrap CIs need the full table and are left to
+    `compute_ensemble_summary`.
+    """
+
+    QUANTILES = (0.5, 0.95, 0.99)
+    # Values buffered per key before they are folded into moments and sketch.
+    _BLOCK = 4096
+
+    def __init__(self, keys: Optional[List[str]] = None, k: int = 200, seed: int = 0) -> None:
+        self.keys = list(keys or _ENSEMBLE_KEYS)
+        self.k = int(k)
+        self.seed = int(seed)
+        self.runs = 0
+        self.moments: Dict[str, _Moments] = {key: _Moments() for key in self.keys}
+        self.sketches: Dict[str, KLLSketch] = {key: KLLSketch(self.k, self.seed + i) for i, key in enumerate(self.keys)}
+        self._pending: Dict[str, List[float]] = {key: [] for key in self.keys}
+
+    def update(self, run_metrics: Dict[str, float]) -> None:
+        self.runs += 1
+        for key in self.keys:
+            if key in run_metrics:
+                pending = self._pending[key]
+                pending.append(float(run_metrics[key]))
+                if len(pending) >= self._BLOCK:
+                    self._flush(key)
+
+    def _flush(self, key: str) -> None:
+        pending = self._pending[key]
+        if pending:
+            values = np.asarray(pending, dtype=float)
+            self.moments[key].update(values, 0.9 if key == "max_sigma" else None)
+            self.sketches[key].update(values)
+            pending.clear()
+
+    def merge(self, other: "EnsembleAccumulator") -> "EnsembleAccumulator":
+        """Fold `other` into this accumulator in place and return it."""
+        for key in other.keys:
+            if key not in self.moments:
+                self.keys.append(key)
+                self.moments[key] = _Moments()
+                self.sketches[key] = KLLSketch(self.k, self.seed + len(self.keys))
+                self._pending[key] = []
+            other._flush(key)
+            self._flush(key)
+            self.moments[key].merge(other.moments[key])
+            self.sketches[key].merge(other.sketches[key])
+        self.runs += other.runs
+        return self
+
+    def result(self) -> Dict[str, float]:
+        if not self.runs:
+            return {}
+        agg: Dict[str, float] = {"runs": self.runs}
+        for key in self.keys:
+            self._flush(key)
+            mom = self.moments[key]
+            if mom.n == 0:
+                continue
+            agg[f"{key}_mean"] = mom.mean
+            agg[f"{key}_std"] = mom.std
+            agg[f"{key}_min"] = mom.min
+            agg[f"{key}_max"] = mom.max
+            for q, value in zip(self.QUANTILES, self.sketches[key].quantile(self.QUANTILES)):
+                agg[f"{key}_p{int(round(q * 100))}"] = float(value)
+        if "max_sigma" in self.moments and self.moments["max_sigma"].n:
+            agg["near_breakdown_runs"] = self.moments["max_sigma"].above
+        return agg
+
+
+def compute_ensemble_summary(
+    run_metrics_list: List[Dict[str, float]], bootstrap: Optional[Dict[str, Any]] = None
+) -> Dict[str, float]:
     """
     Aggregate metrics across multiple runs.
-    Returns mean/std for sigma/anomaly/entropy when present, plus counts.
+    Returns mean/std/min/max, p50/p95/p99 and a bootstrap CI of the mean for
+    sigma/anomaly/entropy when present, plus counts. `bootstrap` is the config block read by
+    `bootstrap_settings` (n_boot, seed, method, alpha).
     """
     if not run_metrics_list:
         return {}
-    keys = ["max_sigma", "sigma_mean", "anomaly_mean", "entropy_mean", "quantum_instability"]
+    keys = _ENSEMBLE_KEYS
     agg: Dict[str, float] = {"runs": len(run_metrics_list)}
-    for key in keys:
-        vals = [m[key] for m in run_metrics_list if key in m]
-        if not vals:
-            continue
-        arr = np.array(vals, dtype=float)
+    table = np.array([[m.get(key, np.nan) for key in keys] for m in run_metrics_list], dtype=float)
+    present = [j for j, key in enumerate(keys) if not np.all(np.isnan(table[:, j]))]
+    for j in present:
+        key = keys[j]
+        arr = table[~np.isnan(table[:, j]), j]
         agg[f"{key}_mean"] = float(np.mean(arr))
         agg[f"{key}_std"] = float(np.std(arr))
         agg[f"{key}_min"] = float(np.min(arr))
         agg[f"{key}_max"] = float(np.max(arr))
+        for q, value in zip(EnsembleAccumulator.QUANTILES, np.quantile(arr, EnsembleAccumulator.QUANTILES)):
+            agg[f"{key}_p{int(round(q * 100))}"] = float(value)
     # Count near-breakdown runs (sigma > 0.9)
-    high_sigma = [m["max_sigma"] for m in run_metrics_list if "max_sigma" in m]
-    if high_sigma:
-        agg["near_breakdown_runs"] = int(np.sum(np.array(high_sigma) > 0.9))
-    # simple percentile bootstrap CI for anomaly_mean if available
-    anoms = [m["anomaly_mean"] for m in run_metrics_list if "anomaly_mean" in m]
-    if anoms:
-        agg.update(_bootstrap_ci(np.array(anoms, dtype=float), "anomaly_mean"))
+    high_sigma = table[:, 0][~np.isnan(table[:, 0])]
+    if len(high_sigma):
+        agg["near_breakdown_runs"] = int(np.sum(high_sigma > 0.9))
+    if present:
+        settings = bootstrap_settings(bootstrap)
+        low, high = mean_ci(table[:, present], **settings)
+        for i, j in enumerate(present):
+            agg[f"{keys[j]}_ci_low"] = float(low[i])
+            agg[f"{keys[j]}_ci_high"] = float(high[i])
+        agg["bootstrap_resamples"] = settings["n_boot"]
+        agg["bootstrap_method"] = settings["method"]
     return agg
 
 
 # Quantum metrics
+#
+# Statevectors are pure states over n qubits; qubit k is tensor axis k of
+# statevector.reshape([2] * n). Entropies of pure states come from the Schmidt
+# decomposition (SVD of the reshaped statevector) and never build the
+# 2^n x 2^n density matrix. Density matrices (noisy runs) go through
+# `partial_trace` and eigvalsh. `StateAnalysis` memoizes both per state.
 
 def quantum_entropy(statevector: np.ndarray) -> float:
+    """Von Neumann entropy; 0 for a pure statevector, eigvalsh spectrum for a density matrix."""
     if statevector is None:
         return 0.0
-    rho = _statevector_to_density(statevector)
-    eigvals = np.real(np.linalg.eigvals(rho))
-    eigvals = eigvals[eigvals > 1e-12]
-    return float(-np.sum(eigvals * np.log2(eigvals)))
+    state = np.asarray(statevector)
+    if state.ndim == 1:
+        return 0.0
+    return _entropy_from_density(state)
 
 
 def entanglement_entropy(statevector: np.ndarray, subsystem: list[int]) -> float:
     if statevector is None:
         return 0.0
-    rho = _statevector_to_density(statevector)
-    reduced = _partial_trace(rho, subsystem)
-    eigvals = np.real(np.linalg.eigvals(reduced))
-    eigvals = eigvals[eigvals > 1e-12]
-    return float(-np.sum(eigvals * np.log2(eigvals)))
+    return StateAnalysis(statevector).entropy(subsystem)
 
 
 def mutual_information(statevector: np.ndarray, A: list[int], B: list[int]) -> float:
     if statevector is None:
         return 0.0
-    rho = _statevector_to_density(statevector)
-    sA = entanglement_entropy(statevector, A)
-    sB = entanglement_entropy(statevector, B)
-    sAB = _entropy_from_density(_partial_trace(rho, A + B))
-    return float(sA + sB - sAB)
-
-
-def _statevector_to_density(statevector: np.ndarray) -> np.ndarray:
-    sv = np.array(statevector, dtype=complex)
-    return np.outer(sv, np.conjugate(sv))
-
-
-def _partial_trace(rho: np.ndarray, keep: list[int]) -> np.ndarray:
-    # Basic partial trace for small systems; keep qubits listed in keep.
-    dim = rho.shape[0]
-    n = int(np.log2(dim))
-    keep_set = set(keep)
-    reshaped = rho.reshape([2] * (2 * n))
-    axes_to_trace = []
-    for qubit in range(n):
-        if qubit not in keep_set:
-            axes_to_trace.extend([qubit, qubit + n])
-    reduced = np.trace(reshaped, axis1=axes_to_trace[0], axis2=axes_to_trace[1]) if axes_to_trace else rho
-    # If more than one pair to trace, iteratively trace
-    if len(axes_to_trace) > 2:
-        for i in range(2, len(axes_to_trace), 2):
-            reduced = np.trace(reduced, axis1=axes_to_trace[i] - i, axis2=axes_to_trace[i + 1] - i)
-    return reduced
+    return StateAnalysis(statevector).mutual_information(A, B)
+
+
+class StateAnalysis:
+    """
+    Entropy diagnostics of one statevector or density matrix with memoized subsystems.
+
+    Spectra and reduced density matrices are cached per subsystem in LRU maps of
+    `cache_size` entries. For a pure state a subsystem and its complement share
+    one spectrum entry, since both have the same nonzero spectrum. Reduced
+    density matrices order the kept qubits ascending.
+    """
+
+    def __init__(self, statevector: np.ndarray, cache_size: int = 256) -> None:
+        state = np.asarray(statevector, dtype=complex)
+        self.pure = state.ndim == 1 or 1 in state.shape
+        self.state = state.ravel() if self.pure else state
+        self.n_qubits = _n_qubits(self.state.shape[0])
+        self.cache_size = max(1, int(cache_size))
+        self._spectra: "OrderedDict[Tuple[int, ...], np.ndarray]" = OrderedDict()
+        self._densities: "OrderedDict[Tuple[int, ...], np.ndarray]" = OrderedDict()
+
+    def _subsystem(self, qubits) -> Tuple[int, ...]:
+        kept = tuple(sorted(set(int(q) for q in qubits)))
+        if kept and (kept[0] < 0 or kept[-1] >= self.n_qubits):
+            raise ValueError(f"subsystem qubits must lie in 0..{self.n_qubits - 1}")
+        return kept
+
+    def _matrix(self, kept: Tuple[int, ...]) -> np.ndarray:
+        rest = [q for q in range(self.n_qubits) if q not in kept]
+        tensor = self.state.reshape([2] * self.n_qubits)
+        return np.transpose(tensor, list(kept) + rest).reshape(1 << len(kept), -1)
+
+    def spectrum(self, qubits) -> np.ndarray:
+        """Eigenvalues of the reduced density matrix of `qubits` (squared Schmidt coefficients)."""
+        kept = self._subsystem(qubits)
+        key = kept
+        if self.pure:
+            complement = tuple(q for q in range(self.n_qubits) if q not in kept)
+            key = min(kept, complement, key=lambda sub: (len(sub), sub))
+        probs = _lru_get(self._spectra, key)
+        if probs is None:
+            if self.pure:
+                probs = np.linalg.svd(self._matrix(key), compute_uv=False) ** 2
+            else:
+                probs = np.linalg.eigvalsh(self.reduced_density(key))
+            _lru_put(self._spectra, key, probs, self.cache_size)
+        return probs
+
+    def reduced_density(self, qubits) -> np.ndarray:
+        """Reduced density matrix of `qubits`, shape (2^k, 2^k)."""
+        kept = self._subsystem(qubits)
+        rho = _lru_get(self._densities, kept)
+        if rho is None:
+            rho = partial_trace(self.state, kept)
+            _lru_put(self._densities, kept, rho, self.cache_size)
+        return rho
+
+    def entropy(self, qubits) -> float:
+        return _entropy_from_probabilities(self.spectrum(qubits))
+
+    def mutual_information(self, A, B) -> float:
+        return float(self.entropy(A) + self.entropy(B) - self.entropy(list(A) + list(B)))
+
+    def cut_entropies(self) -> np.ndarray:
+        """Entropy of every contiguous cut: entry k - 1 is S(qubits 0..k-1), for k = 1..n-1."""
+        return np.array([self.entropy(range(k)) for k in range(1, self.n_qubits)])
+
+    def pairwise_mutual_information(self) -> np.ndarray:
+        """(n, n) matrix of I(i : j) over all qubit pairs (zero diagonal); one batched eigvalsh per subsystem size."""
+        n = self.n_qubits
+        singles = np.stack([self.reduced_density([q]) for q in range(n)]) if n else np.zeros((0, 2, 2))
+        s1 = _batched_entropy(singles)
+        out = np.zeros((n, n))
+        i, j = np.triu_indices(n, k=1)
+        if len(i):
+            pairs = np.stack([self.reduced_density([a, b]) for a, b in zip(i, j)])
+            out[i, j] = s1[i] + s1[j] - _batched_entropy(pairs)
+            out[j, i] = out[i, j]
+        return out
+
+
+def _lru_get(cache: "OrderedDict", key):
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    return value
+
+
+def _lru_put(cache: "OrderedDict", key, value, size: int) -> None:
+    cache[key] = value
+    if len(cache) > size:
+        cache.popitem(last=False)
+
+
+def _batched_entropy(rhos: np.ndarray) -> np.ndarray:
+    probs = np.linalg.eigvalsh(rhos)
+    terms = np.where(probs > 1e-12, -probs * np.log2(np.where(probs > 1e-12, probs, 1.0)), 0.0)
+    return terms.sum(axis=-1)
+
+
+def _n_qubits(dim: int) -> int:
+    n = int(dim).bit_length() - 1
+    if dim < 1 or 1 << n != dim:
+        raise ValueError(f"state dimension {dim} is not a power of two")
+    return n
+
+
+def _entropy_from_probabilities(probs: np.ndarray) -> float:
+    probs = probs[probs > 1e-12]
+    return float(-np.sum(probs * np.log2(probs)))
+
+
+def partial_trace(state: np.ndarray, keep) -> np.ndarray:
+    """
+    Reduced density matrix (2^k, 2^k) of the qubits in `keep`, in the order given.
+
+    `state` is a statevector (2^n,) or a density matrix (2^n, 2^n). A statevector
+    is contracted with its conjugate over the traced qubits in one tensordot; a
+    density matrix has all traced index pairs summed in one einsum. Both cost
+    O(2^n * 2^k) and never build a larger intermediate than the input.
+    """
+    state = np.asarray(state)
+    if state.ndim not in (1, 2) or (state.ndim == 2 and state.shape[0] != state.shape[1]):
+        raise ValueError("partial_trace expects a statevector or a square density matrix")
+    n = _n_qubits(state.shape[0])
+    keep = [int(q) for q in keep]
+    if len(set(keep)) != len(keep) or any(q < 0 or q >= n for q in keep):
+        raise ValueError(f"keep must list distinct qubits in 0..{n - 1}")
+    traced = [q for q in range(n) if q not in keep]
+    dim = 1 << len(keep)
+    if state.ndim == 1:
+        tensor = state.reshape([2] * n)
+        rho = np.tensordot(tensor, tensor.conj(), axes=(traced, traced))
+        # Kept axes come out ascending for both the ket and the bra half.
+        order = list(np.argsort(keep))
+        inverse = list(np.argsort(order))
+        return rho.transpose(inverse + [len(keep) + i for i in inverse]).reshape(dim, dim)
+    labels_in = list(range(2 * n))
+    for q in traced:
+        labels_in[n + q] = q
+    labels_out = keep + [n + q for q in keep]
+    return np.einsum(state.reshape([2] * (2 * n)), labels_in, labels_out).reshape(dim, dim)
 
 
 def _entropy_from_density(rho: np.ndarray) -> float:
-    eigvals = np.real(np.linalg.eigvals(rho))
-    eigvals = eigvals[eigvals > 1e-12]
-    return float(-np.sum(eigvals * np.log2(eigvals)))
+    return _entropy_from_probabilities(np.linalg.eigvalsh(rho))
 
 
 def _arr(timeseries: Dict[str, Any], keys: List[str]):
     for k in keys:
         if k in timeseries:
-            return np.array(timeseries[k])
+            return np.asarray(timeseries[k])
     return None
 
 
-def _calibration_stats(pred: np.ndarray, truth: np.ndarray, threshold: float = 0.5) -> Dict[str, float]:
-    pred = np.array(pred, dtype=float)
-    truth = np.array(truth, dtype=float)
-    mse = float(np.mean((pred - truth) ** 2))
-    bias = float(np.mean(pred - truth))
+def _calibration_counts(pred: np.ndarray, truth: np.ndarray, threshold: float = 0.5) -> np.ndarray:
+    """Return [sq_err_sum, err_sum, tp, fp, fn, tn, n] so chunks can be summed."""
+    pred = np.asarray(pred, dtype=float)
+    truth = np.asarray(truth, dtype=float)
     # simple classification threshold
     pred_bin = pred >= threshold
     truth_bin = truth >= threshold
-    tp = float(np.sum(pred_bin & truth_bin))
-    fp = float(np.sum(pred_bin & ~truth_bin))
-    fn = float(np.sum(~pred_bin & truth_bin))
-    tn = float(np.sum(~pred_bin & ~truth_bin))
+    return np.array(
+        [
+            np.sum((pred - truth) ** 2),
+            np.sum(pred - truth),
+            np.sum(pred_bin & truth_bin),
+            np.sum(pred_bin & ~truth_bin),
+            np.sum(~pred_bin & truth_bin),
+            np.sum(~pred_bin & ~truth_bin),
+            len(pred),
+        ],
+        dtype=float,
+    )
+
+
+def _calibration_from_counts(counts: np.ndarray) -> Dict[str, Any]:
+    """Calibration metrics from `_calibration_counts`; a (7, n_runs) stack gives one array per metric."""
+    sq_err, err, tp, fp, fn, tn, n = np.asarray(counts, dtype=float)
     total = tp + fp + fn + tn + 1e-9
-    return {
-        "calib_mse": mse,
-        "calib_bias": bias,
+    stats = {
+        "calib_mse": sq_err / n,
+        "calib_bias": err / n,
         "calib_tp_rate": tp / (tp + fn + 1e-9),
         "calib_fp_rate": fp / (fp + tn + 1e-9),
         "calib_accuracy": (tp + tn) / total,
-        "calibration_samples": float(len(pred)),
+        "calibration_samples": n,
     }
+    return {key: float(value) for key, value in stats.items()} if np.ndim(n) == 0 else stats
 
 
-def _bootstrap_ci(arr: np.ndarray, prefix: str, n_boot: int = 200, alpha: float = 0.05) -> Dict[str, float]:
-    rng = np.random.default_rng(0)
-    n = len(arr)
-    boot_means = []
-    for _ in range(n_boot):
-        sample = rng.choice(arr, size=n, replace=True)
-        boot_means.append(np.mean(sample))
-    boot_means = np.sort(boot_means)
-    lo = boot_means[int((alpha / 2) * n_boot)]
-    hi = boot_means[int((1 - alpha / 2) * n_boot)]
-    return {f"{prefix}_ci_low": float(lo), f"{prefix}_ci_high": float(hi)}
+def _calibration_stats(pred: np.ndarray, truth: np.ndarray, threshold: float = 0.5) -> Dict[str, float]:
+    return _calibration_from_counts(_calibration_counts(pred, truth, threshold))
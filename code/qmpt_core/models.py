@@ -5,9 +5,11 @@ Minimal QMPT data models for patterns and layers.
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Iterator, Union
 import numpy as np
 
+from .sketch import FeatureSketch
+
 
 @dataclass
 class Pattern:
@@ -20,6 +22,124 @@ class Pattern:
     metadata: Dict[str, object] = field(default_factory=dict)
 
 
+@dataclass
+class PatternPopulation:
+    """
+    Array-backed pattern population: one row per pattern.
+
+    `features` is an (N, d) matrix; `impact` and `meta_consistency` hold the
+    metadata entries the estimators read (defaults 0.1 and 0.2), and
+    `has_features` marks rows whose Pattern.features was set. Estimator outputs
+    live in the `anomaly_score` / `reflexivity` / `self_operator` columns.
+    `sketch` optionally holds a JL projection of `features` (see `attach_sketch`).
+    """
+
+    layer_id: str
+    features: np.ndarray
+    impact: np.ndarray
+    meta_consistency: np.ndarray
+    pattern_ids: List[str]
+    has_features: np.ndarray
+    anomaly_score: Optional[np.ndarray] = None
+    reflexivity: Optional[np.ndarray] = None
+    self_operator: Optional[np.ndarray] = None
+    sketch: Optional[FeatureSketch] = None
+
+    @classmethod
+    def from_features(
+        cls,
+        layer_id: str,
+        features: np.ndarray,
+        impact: Optional[np.ndarray] = None,
+        meta_consistency: Optional[np.ndarray] = None,
+        pattern_ids: Optional[List[str]] = None,
+    ) -> "PatternPopulation":
+        features = np.asarray(features, dtype=float)
+        n = features.shape[0]
+        return cls(
+            layer_id=layer_id,
+            features=features,
+            impact=np.full(n, 0.1) if impact is None else np.asarray(impact, dtype=float),
+            meta_consistency=np.full(n, 0.2) if meta_consistency is None else np.asarray(meta_consistency, dtype=float),
+            pattern_ids=pattern_ids if pattern_ids is not None else [f"p{i}" for i in range(n)],
+            has_features=np.ones(n, dtype=bool),
+        )
+
+    @classmethod
+    def from_patterns(cls, patterns: List[Pattern]) -> "PatternPopulation":
+        n = len(patterns)
+        present = [p.features for p in patterns if p.features is not None]
+        dim = len(present[0]) if present else 0
+        features = np.zeros((n, dim))
+        has_features = np.zeros(n, dtype=bool)
+        for i, p in enumerate(patterns):
+            if p.features is not None:
+                features[i] = p.features
+                has_features[i] = True
+
+        def column(values: List[Optional[float]]) -> Optional[np.ndarray]:
+            if all(v is None for v in values):
+                return None
+            return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+        return cls(
+            layer_id=patterns[0].layer_id if patterns else "",
+            features=features,
+            impact=np.array([float(p.metadata.get("impact", 0.1)) for p in patterns], dtype=float),
+            meta_consistency=np.array([float(p.metadata.get("meta_consistency", 0.2)) for p in patterns], dtype=float),
+            pattern_ids=[p.pattern_id for p in patterns],
+            has_features=has_features,
+            anomaly_score=column([p.anomaly_score for p in patterns]),
+            reflexivity=column([p.reflexivity for p in patterns]),
+            self_operator=column([p.self_operator for p in patterns]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.pattern_ids)
+
+    def attach_sketch(self, target_dim: Optional[int] = None, eps: float = 0.1, seed: int = 0) -> FeatureSketch:
+        """
+        Store a JL sketch of `features`; the estimators then read the sketch instead
+        of the raw matrix. See `FeatureSketch.error` for the realised error.
+        """
+        self.sketch = FeatureSketch.build(self.features, target_dim, eps, seed)
+        return self.sketch
+
+    def to_patterns(self) -> List[Pattern]:
+        patterns: List[Pattern] = []
+        for i, pid in enumerate(self.pattern_ids):
+            metadata: Dict[str, object] = {}
+            if self.impact[i] != 0.1:
+                metadata["impact"] = float(self.impact[i])
+            if self.meta_consistency[i] != 0.2:
+                metadata["meta_consistency"] = float(self.meta_consistency[i])
+            patterns.append(
+                Pattern(
+                    pattern_id=pid,
+                    layer_id=self.layer_id,
+                    features=self.features[i] if self.has_features[i] else None,
+                    anomaly_score=_cell(self.anomaly_score, i),
+                    reflexivity=_cell(self.reflexivity, i),
+                    self_operator=_cell(self.self_operator, i),
+                    metadata=metadata,
+                )
+            )
+        return patterns
+
+    def write_back(self, patterns: List[Pattern]) -> None:
+        """Copy estimator columns onto the Pattern objects this population was built from."""
+        for i, p in enumerate(patterns):
+            p.anomaly_score = _cell(self.anomaly_score, i)
+            p.reflexivity = _cell(self.reflexivity, i)
+            p.self_operator = _cell(self.self_operator, i)
+
+
+def _cell(column: Optional[np.ndarray], i: int) -> Optional[float]:
+    if column is None or np.isnan(column[i]):
+        return None
+    return float(column[i])
+
+
 @dataclass
 class LayerState:
     t: float
@@ -29,9 +149,144 @@ class LayerState:
     macro: Dict[str, object] = field(default_factory=dict)
 
 
+MacroLabel = Tuple[Tuple[str, object], ...]
+
+
+class Trajectory:
+    """
+    Columnar layer trajectory.
+
+    Stores t/stress/protection/novelty in preallocated float arrays and the macro
+    dict of each state as a code into `labels` (one label per distinct macro).
+    Indexing and iteration yield `LayerState` snapshots, so code written against
+    the old List[LayerState] keeps working.
+    """
+
+    def __init__(self, capacity: int = 64) -> None:
+        capacity = max(1, int(capacity))
+        self._t = np.empty(capacity)
+        self._stress = np.empty(capacity)
+        self._protection = np.empty(capacity)
+        self._novelty = np.empty(capacity)
+        self._codes = np.empty(capacity, dtype=np.int32)
+        self.labels: List[MacroLabel] = []
+        self._label_index: Dict[MacroLabel, int] = {}
+        self._n = 0
+
+    @classmethod
+    def from_arrays(
+        cls,
+        t: np.ndarray,
+        stress: np.ndarray,
+        protection: np.ndarray,
+        novelty: np.ndarray,
+        codes: Optional[np.ndarray] = None,
+        labels: Optional[List[MacroLabel]] = None,
+    ) -> "Trajectory":
+        """Wrap existing 1-D arrays (no copy when they already are float64)."""
+        traj = cls.__new__(cls)
+        traj._t = np.asarray(t, dtype=float)
+        traj._stress = np.asarray(stress, dtype=float)
+        traj._protection = np.asarray(protection, dtype=float)
+        traj._novelty = np.asarray(novelty, dtype=float)
+        n = len(traj._t)
+        if codes is None:
+            traj._codes = np.zeros(n, dtype=np.int32)
+            labels = labels or [()]
+        else:
+            traj._codes = np.asarray(codes)
+        traj.labels = list(labels or [])
+        traj._label_index = {label: i for i, label in enumerate(traj.labels)}
+        traj._n = n
+        return traj
+
+    # ---- Columns ----
+    @property
+    def t(self) -> np.ndarray:
+        return self._t[: self._n]
+
+    @property
+    def stress(self) -> np.ndarray:
+        return self._stress[: self._n]
+
+    @property
+    def protection(self) -> np.ndarray:
+        return self._protection[: self._n]
+
+    @property
+    def novelty(self) -> np.ndarray:
+        return self._novelty[: self._n]
+
+    @property
+    def macro_codes(self) -> np.ndarray:
+        return self._codes[: self._n]
+
+    # ---- Writing ----
+    def macro_code(self, macro: Optional[Dict[str, object]]) -> int:
+        """Return the categorical code for a macro dict, registering it if new."""
+        label: MacroLabel = tuple((macro or {}).items())
+        code = self._label_index.get(label)
+        if code is None:
+            code = len(self.labels)
+            self.labels.append(label)
+            self._label_index[label] = code
+        return code
+
+    def reserve(self, capacity: int) -> None:
+        if capacity <= len(self._t):
+            return
+        for name in ("_t", "_stress", "_protection", "_novelty", "_codes"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[: self._n] = old[: self._n]
+            setattr(self, name, new)
+
+    def push(self, t: float, stress: float, protection: float, novelty: float, code: int = 0) -> None:
+        """Append one state given its macro code (see `macro_code`)."""
+        i = self._n
+        if i >= len(self._t):
+            self.reserve(max(2 * len(self._t), 1))
+        self._t[i] = t
+        self._stress[i] = stress
+        self._protection[i] = protection
+        self._novelty[i] = novelty
+        self._codes[i] = code
+        self._n = i + 1
+
+    def append(self, state: LayerState) -> None:
+        self.push(state.t, state.stress, state.protection, state.novelty, self.macro_code(state.macro))
+
+    # ---- LayerState view ----
+    def __len__(self) -> int:
+        return self._n
+
+    def __getitem__(self, idx: Union[int, slice]) -> Union[LayerState, List[LayerState]]:
+        if isinstance(idx, slice):
+            return [self._state(i) for i in range(*idx.indices(self._n))]
+        i = int(idx)
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError("trajectory index out of range")
+        return self._state(i)
+
+    def __iter__(self) -> Iterator[LayerState]:
+        for i in range(self._n):
+            yield self._state(i)
+
+    def _state(self, i: int) -> LayerState:
+        return LayerState(
+            t=float(self._t[i]),
+            stress=float(self._stress[i]),
+            protection=float(self._protection[i]),
+            novelty=float(self._novelty[i]),
+            macro=dict(self.labels[self._codes[i]]),
+        )
+
+
 @dataclass
 class Layer:
     layer_id: str
     description: str = ""
     patterns: List[Pattern] = field(default_factory=list)
-    trajectory: List[LayerState] = field(default_factory=list)
+    trajectory: Trajectory = field(default_factory=Trajectory)
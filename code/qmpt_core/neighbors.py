@@ -0,0 +1,376 @@
+"""
+Nearest-neighbour index over pattern feature vectors.
+
+`NeighborIndex` answers batched k-nearest-neighbour queries. It uses
+scipy.spatial.cKDTree when SciPy is installed. Otherwise it uses a balanced KD
+tree held in NumPy arrays. The tree is built one level at a time. A whole batch
+of queries is answered by a level-wise dual-tree walk that prunes node pairs by
+box distance against per-point bounds, so no step loops over single points.
+Inserted points go to a brute-force buffer. The buffer is folded into the tree
+once it grows past `rebuild_ratio` of the tree size.
+"""
+
+from __future__ import annotations
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree as _cKDTree
+
+    SCIPY_AVAILABLE = True
+except Exception:
+    _cKDTree = None  # type: ignore
+    SCIPY_AVAILABLE = False
+
+# Leaf pairs scanned per block.
+_PAIR_CHUNK = 1 << 14
+# Depth of the query subtrees walked one at a time.
+_SUBTREE_LEVELS = 10
+# Query rows per brute-force block against the insertion buffer.
+_BUFFER_CHUNK = 4096
+
+
+class _KDTree:
+    """
+    Balanced KD tree over `points`: level l has 2**l nodes, each a contiguous
+    range `bounds[l][i]:bounds[l][i + 1]` of `points[perm]`, split at the middle
+    along the node's widest dimension.
+    """
+
+    def __init__(self, points: np.ndarray, leaf_size: int) -> None:
+        n = len(points)
+        self.depth = max(0, int(np.ceil(np.log2(max(n, 1) / leaf_size))))
+        perm = np.arange(n)
+        pts = points
+        bounds = [np.array([0, n])]
+        self.split_dim: List[np.ndarray] = []
+        self.split_val: List[np.ndarray] = []
+        for _ in range(self.depth):
+            b = bounds[-1]
+            lo = np.minimum.reduceat(pts, b[:-1], axis=0)
+            hi = np.maximum.reduceat(pts, b[:-1], axis=0)
+            nodes = np.arange(len(b) - 1)
+            dim = np.argmax(hi - lo, axis=1)
+            span = (hi - lo)[nodes, dim]
+            node = np.repeat(nodes, np.diff(b))
+            frac = (pts[np.arange(n), dim[node]] - lo[node, dim[node]]) / np.where(span > 0, span, 1.0)[node]
+            # One sort orders every node by its split coordinate while keeping nodes apart.
+            order = np.argsort(node + 0.5 * frac)
+            perm, pts = perm[order], pts[order]
+            mid = (b[:-1] + b[1:]) // 2
+            self.split_dim.append(dim)
+            self.split_val.append(pts[mid, dim])
+            split = np.empty(2 * len(b) - 1, dtype=np.int64)
+            split[0::2] = b
+            split[1::2] = mid
+            bounds.append(split)
+        self.perm = perm
+        self.points = pts
+        self.bounds = bounds
+        self.lo = [np.minimum.reduceat(self.points, b[:-1], axis=0) if n else np.zeros((1, points.shape[1])) for b in bounds]
+        self.hi = [np.maximum.reduceat(self.points, b[:-1], axis=0) if n else np.zeros((1, points.shape[1])) for b in bounds]
+        self.counts = [np.diff(b) for b in bounds]
+
+    def nodes(self, level: int = -1) -> Tuple[np.ndarray, np.ndarray]:
+        """(n_nodes, width) slot matrix of positions into `points` for one level, and its validity mask."""
+        b = self.bounds[level]
+        width = int(np.max(np.diff(b))) if len(self.points) else 1
+        slots = b[:-1, None] + np.arange(width)
+        valid = slots < b[1:, None]
+        return np.minimum(slots, max(len(self.points) - 1, 0)), valid
+
+    def descend(self, x: np.ndarray, level: int) -> np.ndarray:
+        """Node at `level` whose split path each row of `x` follows."""
+        node = np.zeros(len(x), dtype=np.int64)
+        rows = np.arange(len(x))
+        for l in range(level):
+            node = 2 * node + (x[rows, self.split_dim[l][node]] >= self.split_val[l][node])
+        return node
+
+
+class NeighborIndex:
+    """
+    k-nearest-neighbour index with batched queries and incremental insertion.
+
+    `backend` is "scipy", "numpy" or None (SciPy when available). Distances are
+    Euclidean. Indices refer to insertion order: the initial points first, then
+    each `insert` batch.
+    """
+
+    def __init__(self, points: np.ndarray, leaf_size: int = 32, backend: Optional[str] = None, rebuild_ratio: float = 0.25) -> None:
+        points = np.asarray(points, dtype=float)
+        if points.ndim != 2:
+            raise ValueError("NeighborIndex needs an (n, d) array of points")
+        use_scipy = SCIPY_AVAILABLE if backend is None else backend == "scipy"
+        if use_scipy and not SCIPY_AVAILABLE:
+            raise ImportError("scipy is not installed")
+        self.backend = "scipy" if use_scipy else "numpy"
+        self.leaf_size = max(2, int(leaf_size))
+        self.rebuild_ratio = float(rebuild_ratio)
+        self._parts: List[np.ndarray] = [points]
+        self._indexed = 0
+        self._tree = None
+        self._rebuild()
+
+    def __len__(self) -> int:
+        return sum(len(part) for part in self._parts)
+
+    @property
+    def points(self) -> np.ndarray:
+        if len(self._parts) > 1:
+            self._parts = [np.concatenate(self._parts)]
+        return self._parts[0]
+
+    def insert(self, points: np.ndarray) -> None:
+        """Add points; they are searched by brute force until the next rebuild."""
+        points = np.asarray(points, dtype=float).reshape(-1, self.points.shape[1])
+        self._parts.append(points)
+        if len(self) - self._indexed > self.rebuild_ratio * max(self._indexed, 1):
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        points = self.points
+        self._indexed = len(points)
+        if self.backend == "scipy":
+            self._tree = _cKDTree(points, leafsize=self.leaf_size)
+        else:
+            self._tree = _KDTree(points, self.leaf_size)
+
+    def query(self, x: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k nearest indexed points of each row of `x`: (distances, indices), both
+        (n_queries, k) and sorted by distance. Missing neighbours are inf / -1.
+        """
+        x = np.asarray(x, dtype=float).reshape(-1, self.points.shape[1])
+        d2, idx = self._query_tree(x, k, self_query=False)
+        buffered = self.points[self._indexed :]
+        if len(buffered):
+            d2, idx = _merge_brute(x, buffered, self._indexed, d2, idx, k)
+        return _finish(d2, idx)
+
+    def query_self(self, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """k nearest neighbours of every indexed point, excluding the point itself."""
+        if len(self) != self._indexed:
+            self._rebuild()
+        d2, idx = self._query_tree(self.points, k, self_query=True)
+        return _finish(d2, idx)
+
+    # ---- Backends ----
+    def _query_tree(self, x: np.ndarray, k: int, self_query: bool) -> Tuple[np.ndarray, np.ndarray]:
+        k_eff = k + 1 if self_query else k
+        if self.backend == "scipy":
+            n_take = min(k_eff, self._indexed)
+            if n_take == 0:
+                return np.full((len(x), k), np.inf), np.full((len(x), k), -1)
+            dist, idx = self._tree.query(x, k=n_take)
+            dist, idx = dist.reshape(len(x), n_take), idx.reshape(len(x), n_take)
+            if self_query:
+                # Move each point's own entry to the end, then drop the last column.
+                order = np.argsort(idx == np.arange(len(x))[:, None], axis=1, kind="stable")
+                dist, idx = np.take_along_axis(dist, order, 1)[:, :-1], np.take_along_axis(idx, order, 1)[:, :-1]
+            d2 = np.full((len(x), k), np.inf)
+            out = np.full((len(x), k), -1)
+            d2[:, : dist.shape[1]] = dist ** 2
+            out[:, : idx.shape[1]] = np.where(np.isfinite(dist), idx, -1)
+            return d2, out
+        tree: _KDTree = self._tree  # type: ignore[assignment]
+        qtree = tree if self_query else _KDTree(x, self.leaf_size)
+        return _dual_knn(qtree, tree, k, self_query)
+
+
+def _finish(d2: np.ndarray, idx: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    order = np.argsort(d2, axis=1, kind="stable")
+    return np.sqrt(np.take_along_axis(d2, order, 1)), np.take_along_axis(idx, order, 1)
+
+
+def _merge_brute(x: np.ndarray, points: np.ndarray, offset: int, d2: np.ndarray, idx: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    pn = np.einsum("ij,ij->i", points, points)
+    ids = np.arange(offset, offset + len(points))
+    for s in range(0, len(x), _BUFFER_CHUNK):
+        q = x[s : s + _BUFFER_CHUNK]
+        cand = np.maximum(np.einsum("ij,ij->i", q, q)[:, None] + pn[None, :] - 2.0 * q @ points.T, 0.0)
+        all_d = np.concatenate([d2[s : s + len(q)], cand], axis=1)
+        all_i = np.concatenate([idx[s : s + len(q)], np.broadcast_to(ids, cand.shape)], axis=1)
+        keep = np.argpartition(all_d, k - 1, axis=1)[:, :k] if all_d.shape[1] > k else np.argsort(all_d, axis=1)[:, :k]
+        d2[s : s + len(q)] = np.take_along_axis(all_d, keep, 1)
+        idx[s : s + len(q)] = np.take_along_axis(all_i, keep, 1)
+    return d2, idx
+
+
+def _box_distances(qt: _KDTree, la: int, a: np.ndarray, dt: _KDTree, lb: int, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Squared min and max distances between query node boxes `a` and data node boxes `b`."""
+    qlo, qhi, dlo, dhi = qt.lo[la][a], qt.hi[la][a], dt.lo[lb][b], dt.hi[lb][b]
+    gap = np.maximum(0.0, np.maximum(dlo - qhi, qlo - dhi))
+    far = np.maximum(np.abs(qhi - dlo), np.abs(dhi - qlo))
+    return np.einsum("ij,ij->i", gap, gap), np.einsum("ij,ij->i", far, far)
+
+
+def _group_starts(keys: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+
+
+def _point_bounds(qt: _KDTree, dt: _KDTree, k: int) -> np.ndarray:
+    """
+    Upper bound on each query point's squared k-th neighbour distance: the k-th
+    closest point of the data node along its split path one level above the
+    deepest level whose nodes all hold k points.
+    """
+    levels = [l for l, counts in enumerate(dt.counts) if counts.min() >= k]
+    if not levels:
+        return np.full(len(qt.points), np.inf)
+    level = max(0, levels[-1] - 1)
+    slots, valid = dt.nodes(level)
+    node = dt.descend(qt.points, level)
+    d_norm = np.einsum("ij,ij->i", dt.points, dt.points)
+    out = np.empty(len(qt.points))
+    step = max(1, _BUFFER_CHUNK * 16 // slots.shape[1])
+    for s in range(0, len(out), step):
+        q = qt.points[s : s + step]
+        cand = slots[node[s : s + step]]
+        d2 = np.einsum("ij,ij->i", q, q)[:, None] + d_norm[cand] - 2.0 * np.einsum("id,iwd->iw", q, dt.points[cand])
+        d2[~valid[node[s : s + step]]] = np.inf
+        out[s : s + step] = np.partition(d2, k - 1, axis=1)[:, k - 1]
+    # Slack for rounding in the expanded distance formula.
+    return np.maximum(out, 0.0) * (1.0 + 1e-9) + 1e-12
+
+
+def _prune(
+    qt: _KDTree, la: int, a: np.ndarray, dt: _KDTree, lb: int, b: np.ndarray, k: int, limit: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Drop node pairs that cannot hold a k-nearest neighbour. A query node's k-th
+    distance is bounded by `limit` (per node) and by the closest data nodes (by max
+    distance) holding k points; pairs whose min distance exceeds the bound go.
+    """
+    mind, maxd = _box_distances(qt, la, a, dt, lb, b)
+    order = np.lexsort((maxd, a))
+    a, b, mind, maxd = a[order], b[order], mind[order], maxd[order]
+    starts = _group_starts(a)
+    sizes = np.diff(np.append(starts, len(a)))
+    counts = dt.counts[lb][b]
+    running = np.cumsum(counts)
+    running -= np.repeat(running[starts] - counts[starts], sizes)
+    bound = np.repeat(np.minimum.reduceat(np.where(running >= k, maxd, np.inf), starts), sizes)
+    bound = np.minimum(bound, limit[a])
+    keep = mind <= bound
+    return a[keep], b[keep]
+
+
+def _point_leaf_pairs(
+    q_pts: np.ndarray, q_bound: np.ndarray, lo: np.ndarray, hi: np.ndarray, a: np.ndarray, b: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Expand leaf pairs (query leaf a, data leaf b) to (a, slot in a, b) triples where
+    the query point lies within its bound of the data leaf's box.
+    """
+    q = q_pts[a]
+    gap = np.maximum(0.0, np.maximum(lo[b][:, None, :] - q, q - hi[b][:, None, :]))
+    p, m = np.nonzero(np.einsum("pmd,pmd->pm", gap, gap) <= q_bound[a])
+    return a[p], m, b[p]
+
+
+def _dual_knn(qt: _KDTree, dt: _KDTree, k: int, self_query: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Squared distances and indices of the k nearest data points for every query point.
+
+    Every query point gets an upper bound on its k-th distance from a cheap local
+    scan. A dual walk of query leaves against data leaves keeps the pairs that may
+    matter, and each query point then scans only the data leaves whose box lies
+    within its bound. Candidates inside the bound are sorted per point and the k
+    nearest kept.
+    """
+    nq = len(qt.points)
+    k_eff = k + 1 if self_query else k
+    out_d = np.full((nq, k), np.inf)
+    out_i = np.full((nq, k), -1, dtype=np.int64)
+    if nq == 0 or len(dt.points) == 0:
+        return out_d, out_i
+    point_bound = _point_bounds(qt, dt, k_eff)
+    node_bound = [np.maximum.reduceat(point_bound, bounds[:-1]) for bounds in qt.bounds]
+    q_slots, q_valid = qt.nodes()
+    d_slots, d_valid = dt.nodes()
+    q_pts = qt.points[q_slots]
+    q_bound = np.where(q_valid, point_bound[q_slots], -1.0)
+    d_pts = dt.points[d_slots]
+    # Query subtrees below `top` are walked one at a time to bound memory.
+    top = max(0, qt.depth - _SUBTREE_LEVELS)
+    for root in range(2 ** top):
+        a, b = _walk(qt, dt, root, top, k_eff, node_bound)
+        # Pairs are grouped by query leaf; chunks end on leaf boundaries so each point finishes in one chunk.
+        starts = np.append(_group_starts(a), len(a))
+        cuts = np.unique(np.append(starts[np.searchsorted(starts, np.arange(0, len(a), _PAIR_CHUNK))], len(a)))
+        for lo, hi in zip(cuts[:-1], cuts[1:]):
+            pa, m, pb = _point_leaf_pairs(q_pts, q_bound, dt.lo[-1], dt.hi[-1], a[lo:hi], b[lo:hi])
+            rows = q_slots[pa, m]
+            diff = d_pts[pb] - qt.points[rows][:, None, :]
+            d2 = np.einsum("pwd,pwd->pw", diff, diff)
+            hit = d_valid[pb] & (d2 <= point_bound[rows][:, None])
+            if self_query:
+                hit &= d_slots[pb] != rows[:, None]
+            p, j = np.nonzero(hit)
+            _keep_nearest(qt.perm[rows[p]], d2[p, j], dt.perm[d_slots[pb[p], j]], out_d, out_i)
+    return out_d, out_i
+
+
+def _walk(qt: _KDTree, dt: _KDTree, root: int, level: int, k: int, node_bound: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Dual walk from query node `root` at `level` against the data root, down to (query leaf, data leaf) pairs."""
+    a = np.array([root], dtype=np.int64)
+    b = np.zeros(1, dtype=np.int64)
+    la, lb = level, 0
+    while la < qt.depth or lb < dt.depth:
+        # The query side waits until the data side has caught up with its level,
+        # or until the data side has reached its leaves.
+        split_a = la < qt.depth and (la <= lb or lb >= dt.depth)
+        split_b = lb < dt.depth
+        if split_a and split_b:
+            a = np.repeat(2 * a, 4) + np.tile([0, 0, 1, 1], len(a))
+            b = np.repeat(2 * b, 4) + np.tile([0, 1, 0, 1], len(b))
+        elif split_a:
+            a, b = np.repeat(2 * a, 2) + np.tile([0, 1], len(a)), np.repeat(b, 2)
+        elif split_b:
+            a, b = np.repeat(a, 2), np.repeat(2 * b, 2) + np.tile([0, 1], len(b))
+        la, lb = la + split_a, lb + split_b
+        a, b = _prune(qt, la, a, dt, lb, b, k, node_bound[la])
+    return a, b
+
+
+def _keep_nearest(rows: np.ndarray, d2: np.ndarray, ids: np.ndarray, out_d: np.ndarray, out_i: np.ndarray) -> None:
+    """Write the k = out_d.shape[1] smallest candidates of each row into out_d / out_i."""
+    if not len(rows):
+        return
+    order = np.lexsort((ids, d2, rows))
+    rows, d2, ids = rows[order], d2[order], ids[order]
+    starts = _group_starts(rows)
+    rank = np.arange(len(rows)) - np.repeat(starts, np.diff(np.append(starts, len(rows))))
+    top = rank < out_d.shape[1]
+    out_d[rows[top], rank[top]] = d2[top]
+    out_i[rows[top], rank[top]] = ids[top]
+
+
+def knn_distance(distances: np.ndarray) -> np.ndarray:
+    """Mean distance to the k nearest neighbours (rows of `query_self` distances)."""
+    finite = np.where(np.isfinite(distances), distances, np.nan)
+    with np.errstate(invalid="ignore"):
+        out = np.nanmean(finite, axis=1) if finite.shape[1] else np.zeros(len(finite))
+    return np.nan_to_num(out, nan=0.0)
+
+
+def local_outlier_factor(distances: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """
+    LOF of every point from its k-neighbourhood: mean local reachability density of
+    the neighbours over the point's own. ~1 inside clusters, > 1 for local outliers.
+    """
+    n, k = distances.shape
+    if n == 0 or k == 0:
+        return np.ones(n)
+    valid = indices >= 0
+    safe = np.where(valid, indices, 0)
+    k_distance = distances[:, -1]
+    reach = np.maximum(distances, k_distance[safe])
+    reach = np.where(valid, reach, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lrd = 1.0 / (np.nanmean(reach, axis=1) + 1e-12)
+        lof = np.nanmean(np.where(valid, lrd[safe], np.nan), axis=1) / lrd
+    return np.nan_to_num(lof, nan=1.0)
@@ -0,0 +1,141 @@
+"""
+Noise providers for QMPT scenarios.
+
+A provider hands out the standard-normal terms of a scenario in blocks of steps:
+`draw(start, steps)` returns a (steps, n_terms) array, one row per step and one
+column per stochastic term. Scenarios scale the terms themselves, so the same
+provider can feed scalar, streaming and batched engines and they agree bit-for-bit.
+"""
+
+from __future__ import annotations
+
+import copy
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+class NoiseProvider:
+    """Base class; subclasses return standard normals of shape (steps, n_terms)."""
+
+    n_terms: int = 1
+
+    def draw(self, start: int, steps: int) -> np.ndarray:
+        raise NotImplementedError
+
+    def get_state(self) -> Dict[str, Any]:
+        """JSON-friendly state needed to continue drawing from the current position."""
+        return {}
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        pass
+
+
+class SequentialNoise(NoiseProvider):
+    """
+    One `default_rng(seed)` stream consumed in order.
+
+    Drawing k steps at once yields the same numbers as k scalar `rng.normal` calls,
+    so this reproduces the historical per-step draws. Blocks must be requested in order.
+    """
+
+    def __init__(self, seed: int, n_terms: int) -> None:
+        self.seed = int(seed)
+        self.n_terms = int(n_terms)
+        self.rng = np.random.default_rng(self.seed)
+        self.position = 0
+
+    def draw(self, start: int, steps: int) -> np.ndarray:
+        if start != self.position:
+            raise ValueError("SequentialNoise is drawn in order; use CounterNoise for random access")
+        self.position += steps
+        return self.rng.standard_normal((steps, self.n_terms))
+
+    def get_state(self) -> Dict[str, Any]:
+        return {"position": self.position, "bit_generator": copy.deepcopy(self.rng.bit_generator.state)}
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        self.position = int(state["position"])
+        self.rng.bit_generator.state = copy.deepcopy(state["bit_generator"])
+
+
+class CounterNoise(NoiseProvider):
+    """
+    Counter-based noise: Philox keyed by `key`, one counter block per `block_steps` steps.
+
+    Any step can be regenerated on demand from (key, step) alone, which lets
+    parallel or forked runs reproduce a stream without replaying it.
+    """
+
+    def __init__(self, key: int, n_terms: int, block_steps: int = 1024) -> None:
+        self.key = int(key)
+        self.n_terms = int(n_terms)
+        self.block_steps = max(1, int(block_steps))
+        self._cache: Dict[int, np.ndarray] = {}
+
+    def _block(self, index: int) -> np.ndarray:
+        block = self._cache.get(index)
+        if block is None:
+            # The block index sits in the top counter word, far from the words Philox increments.
+            gen = np.random.Generator(np.random.Philox(key=self.key, counter=index << 192))
+            block = gen.standard_normal((self.block_steps, self.n_terms))
+            if len(self._cache) >= 4:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[index] = block
+        return block
+
+    def draw(self, start: int, steps: int) -> np.ndarray:
+        out = np.empty((steps, self.n_terms))
+        filled = 0
+        while filled < steps:
+            step = start + filled
+            index, offset = divmod(step, self.block_steps)
+            take = min(steps - filled, self.block_steps - offset)
+            out[filled : filled + take] = self._block(index)[offset : offset + take]
+            filled += take
+        return out
+
+    def step(self, k: int) -> np.ndarray:
+        """Noise row of step k, regenerated independently of any other draw."""
+        return self.draw(k, 1)[0]
+
+
+class NoiseBank:
+    """
+    Per-step noise for many runs at once, drawn `chunk_steps` steps per provider call.
+
+    `next()` returns an (n_runs, n_terms) array for the next step.
+    """
+
+    def __init__(self, providers: Sequence[NoiseProvider], chunk_steps: int = 256) -> None:
+        self.providers: List[NoiseProvider] = list(providers)
+        self.chunk_steps = max(1, int(chunk_steps))
+        n_terms = self.providers[0].n_terms if self.providers else 0
+        self._buf = np.empty((len(self.providers), 0, n_terms))
+        self._start = 0
+        self._pos = 0
+
+    def next(self) -> np.ndarray:
+        if self._pos >= self._buf.shape[1]:
+            self._buf = np.stack([p.draw(self._start, self.chunk_steps) for p in self.providers])
+            self._start += self.chunk_steps
+            self._pos = 0
+        out = self._buf[:, self._pos, :]
+        self._pos += 1
+        return out
+
+
+def make_noise(config: Dict, seed: int, n_terms: int) -> NoiseProvider:
+    """
+    Build the provider selected by `config["noise"]`:
+    {"mode": "sequential"} (default) or {"mode": "counter", "key": int, "block_steps": int}.
+    The counter key defaults to the run seed.
+    """
+    noise_cfg = config.get("noise") or {}
+    mode = noise_cfg.get("mode", "sequential")
+    if mode == "sequential":
+        return SequentialNoise(seed, n_terms)
+    if mode == "counter":
+        key: Optional[int] = noise_cfg.get("key")
+        return CounterNoise(int(seed if key is None else key), n_terms, int(noise_cfg.get("block_steps", 1024)))
+    raise ValueError(f"Unknown noise mode {mode}")
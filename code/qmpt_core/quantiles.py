@@ -0,0 +1,93 @@
+"""
+Mergeable quantile sketch (KLL) for streaming ensemble metrics.
+
+Level h holds items of weight 2^h. When the sketch outgrows its budget, the
+lowest over-full level is sorted and every other item (random offset) moves up
+one level with twice the weight. Level capacities shrink geometrically (factor
+2/3) below the top level, so a sketch of parameter k keeps O(k) items and its
+rank error is about 1.7 / k with high probability, independent of how many
+values were added. Two sketches merge by concatenating their levels and
+compacting again, so shards can be summarized independently and combined.
+"""
+
+from __future__ import annotations
+
+from typing import List, Sequence
+
+import numpy as np
+
+_DECAY = 2.0 / 3.0
+
+
+class KLLSketch:
+    """Quantile sketch over a stream of floats; `k` trades memory for accuracy."""
+
+    def __init__(self, k: int = 200, seed: int = 0) -> None:
+        if k < 8:
+            raise ValueError("KLL sketch needs k >= 8")
+        self.k = int(k)
+        self.n = 0
+        self.levels: List[np.ndarray] = [np.zeros(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - 1 - level
+        return max(2, int(np.ceil(self.k * _DECAY ** depth)))
+
+    def _size(self) -> int:
+        return sum(len(items) for items in self.levels)
+
+    def _budget(self) -> int:
+        return sum(self._capacity(h) for h in range(len(self.levels)))
+
+    def update(self, values) -> None:
+        """Add a value or an array of values."""
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        """Fold `other` into this sketch in place and return it."""
+        if other.n == 0:
+            return self
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.zeros(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def _compress(self) -> None:
+        while self._size() > self._budget():
+            for h, items in enumerate(self.levels):
+                if len(items) >= self._capacity(h):
+                    break
+            if h + 1 == len(self.levels):
+                self.levels.append(np.zeros(0))
+            items = np.sort(items)
+            # An odd item out stays behind so weights are conserved exactly.
+            keep = items[: len(items) % 2]
+            pairs = items[len(keep):]
+            promoted = pairs[int(self._rng.integers(2))::2]
+            self.levels[h] = keep
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+
+    def quantile(self, q: Sequence[float]) -> np.ndarray:
+        """Approximate quantiles for probabilities `q` in [0, 1] (NaN when empty)."""
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        if self.n == 0:
+            return np.full(len(q), np.nan)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(lv), float(1 << h)) for h, lv in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        items, cum = items[order], np.cumsum(weights[order])
+        idx = np.searchsorted(cum, q * cum[-1], side="left")
+        return items[np.minimum(idx, len(items) - 1)]
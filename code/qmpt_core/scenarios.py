@@ -4,187 +4,1027 @@ QMPT scenarios for classical simulations.
 
 from __future__ import annotations
 
+import itertools
+
 import numpy as np
-from typing import Dict, Tuple, Any
+from dataclasses import dataclass, field
+from typing import Dict, Tuple, Any, List, Optional, Sequence, Iterator
 
-from .models import Pattern, Layer, LayerState
-from .metrics import estimate_anomaly, estimate_reflexivity, estimate_self_operator
+from .models import Pattern, PatternPopulation, Layer, Trajectory, MacroLabel
+from .metrics import estimate_anomaly, estimate_reflexivity, estimate_self_operator, PopulationAggregate
+from .noise import NoiseProvider, NoiseBank, make_noise
 
 
-def _build_patterns(layer_id: str, scenario: str, seed: int) -> list[Pattern]:
+def _build_population(layer_id: str, scenario: str, seed: int, n_patterns: int = 10) -> PatternPopulation:
     rng = np.random.default_rng(seed)
-    patterns: list[Pattern] = []
     # Base population
-    for i in range(10):
-        features = rng.normal(0, 0.5, size=4)
-        patterns.append(Pattern(pattern_id=f"p{i}", layer_id=layer_id, features=features))
+    features = rng.normal(0, 0.5, size=(n_patterns, 4))
+    impact = np.full(n_patterns, 0.1)
+    meta = np.full(n_patterns, 0.2)
+    ids = [f"p{i}" for i in range(n_patterns)]
 
     if scenario in {"single_anomaly_injection", "self_aware_anomaly"}:
-        features = rng.normal(3.0, 0.2, size=4)  # far from mean
-        metadata = {"impact": 0.8}
-        if scenario == "self_aware_anomaly":
-            metadata["meta_consistency"] = 0.9
-        patterns.append(Pattern(pattern_id="anom", layer_id=layer_id, features=features, metadata=metadata))
-    return patterns
+        anom = rng.normal(3.0, 0.2, size=(1, 4))  # far from mean
+        features = np.vstack([features, anom])
+        impact = np.append(impact, 0.8)
+        meta = np.append(meta, 0.9 if scenario == "self_aware_anomaly" else 0.2)
+        ids.append("anom")
+    return PatternPopulation.from_features(layer_id, features, impact, meta, ids)
+
+
+def _estimated_population(layer_id: str, scenario: str, seed: int, config: Dict) -> PatternPopulation:
+    population = _build_population(layer_id, scenario, seed, int(config.get("n_patterns", 10)))
+    estimate_anomaly(population, config.get("anomaly_method", "mean"), int(config.get("anomaly_k", 10)))
+    estimate_reflexivity(population)
+    estimate_self_operator(population)
+    return population
+
+
+def _update_layer_state(
+    stress: float, protection: float, novelty: float, aggregate: PopulationAggregate, z: List[float]
+) -> Tuple[float, float, float]:
+    anomaly_mean = aggregate.mean
+    stress = max(0.0, min(1.0, stress + 0.05 * z[0] + 0.1 * anomaly_mean))
+    protection = max(0.0, min(1.0, protection - 0.05 * anomaly_mean + 0.02 * z[1]))
+    novelty = max(0.0, min(1.0, novelty + 0.05 * z[2] + 0.05 * anomaly_mean))
+    return stress, protection, novelty
+
+
+STATE_KEYS = ("t", "stress", "protection", "novelty", "macro_code")
+
+
+def _substrate_noise(config: Dict, steps: int) -> np.ndarray:
+    """
+    Per-hop substrate noise of a transfer_cycle config as a float array of length `steps`.
+    `substrate_noise` may be a list, an array or any iterable (e.g. a generator);
+    hops past its end reuse its last value.
+    """
+    spec = config.get("substrate_noise")
+    if spec is None:
+        return np.full(steps, 0.05)
+    if isinstance(spec, np.ndarray):
+        values = spec.astype(float, copy=False).ravel()[:steps]
+    elif isinstance(spec, (list, tuple)):
+        values = np.asarray(spec[:steps], dtype=float)
+    else:
+        values = np.fromiter(itertools.islice(iter(spec), steps), dtype=float)
+    if len(values) < steps:
+        values = np.concatenate([values, np.full(steps - len(values), values[-1])])
+    return values
+
+
+def _clipped_walk(x0: float, a: np.ndarray, b: Optional[np.ndarray] = None, lo: float = 0.0, hi: float = 1.0) -> np.ndarray:
+    """
+    x[k] = clip(x[k-1] + a[k] (+ b[k]), lo, hi) with x[-1] = x0, for every k.
+
+    Unclipped stretches are running sums (np.add.accumulate adds in the same order
+    as the scalar loop, so results are bit-identical); each clip restarts the sum at
+    the bound, and stretches pinned at a bound are skipped in one vectorized test.
+    """
+    n = len(a)
+    out = np.empty(n)
+    x, k, width = float(x0), 0, 64
+    while k < n:
+        stop = min(n, k + width)
+        if b is None:
+            seq = np.empty(stop - k + 1)
+            seq[1:] = a[k:stop]
+            seq[0] = x
+            y = np.add.accumulate(seq)[1:]
+        else:
+            seq = np.empty(2 * (stop - k) + 1)
+            seq[1::2] = a[k:stop]
+            seq[2::2] = b[k:stop]
+            seq[0] = x
+            y = np.add.accumulate(seq)[2::2]
+        bad = (y < lo) | (y > hi)
+        if not bad.any():
+            out[k:stop] = y
+            x, k, width = float(y[-1]), stop, min(2 * width, 1 << 16)
+            continue
+        v = int(np.argmax(bad))
+        out[k : k + v] = y[:v]
+        x = lo if y[v] < lo else hi
+        out[k + v] = x
+        k, width = k + v + 1, 64
+        # Steps that start at the bound and are pushed past it stay there.
+        span = 16
+        while k < n:
+            stop = min(n, k + span)
+            u = x + a[k:stop] if b is None else (x + a[k:stop]) + b[k:stop]
+            pinned = u <= lo if x == lo else u >= hi
+            run = len(pinned) if pinned.all() else int(np.argmin(pinned))
+            out[k : k + run] = x
+            k += run
+            if run < len(pinned):
+                break
+            span *= 4
+    return out
+
+
+def _clipped_walks(x0: np.ndarray, a: np.ndarray, b: np.ndarray, lo: float = 0.0, hi: float = 1.0) -> np.ndarray:
+    """
+    `_clipped_walk` for n walks sharing the increments `a` (T,), with own terms `b` (n, T).
+
+    A few walks run one vectorized walk each; many walks step together instead,
+    one vectorized update per step, so dense clipping does not serialize them.
+    Either way each row equals the scalar loop bit for bit.
+    """
+    n, steps = b.shape
+    if n < 64:
+        out = np.empty((n, steps))
+        for i in range(n):
+            out[i] = _clipped_walk(float(x0[i]), a, b[i], lo, hi)
+        return out
+    b_t = np.ascontiguousarray(b.T)
+    out_t = np.empty((steps + 1, n))
+    out_t[0] = x0
+    for k in range(steps):
+        y = out_t[k + 1]
+        np.add(out_t[k], a[k], out=y)
+        np.add(y, b_t[k], out=y)
+        np.maximum(y, lo, out=y)
+        np.minimum(y, hi, out=y)
+    return np.ascontiguousarray(out_t[1:].T)
+
+
+# Standard-normal terms each scenario draws per step (see noise.NoiseProvider).
+NOISE_TERMS = {"anomaly_injection": 3, "collapse_recovery": 4, "transfer_cycle": 1}
+
+# Events each scenario can stop on (see StopRule).
+STOP_EVENTS = {"anomaly_injection": ("detection",), "collapse_recovery": ("collapse", "recovery")}
+
+
+@dataclass(frozen=True)
+class StopRule:
+    """
+    Declarative early termination from `config["stop_when"]`, e.g.
+    {"collapse": true, "after_steps": 20}: once any enabled event has fired, the
+    run ends `after_steps` steps later. Events per scenario are listed in STOP_EVENTS.
+    """
+
+    events: Tuple[str, ...]
+    after_steps: int = 0
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional["StopRule"]:
+        spec = config.get("stop_when")
+        if not spec:
+            return None
+        scenario = config.get("scenario", "baseline_layer")
+        allowed = STOP_EVENTS.get(scenario, ())
+        unknown = sorted(set(spec) - set(allowed) - {"after_steps"})
+        if unknown:
+            raise ValueError(f"stop_when for {scenario} supports {list(allowed)} and after_steps, got {unknown}")
+        return cls(tuple(event for event in allowed if spec.get(event)), max(0, int(spec.get("after_steps", 0))))
+
+    def first(self, **fired: bool) -> Optional[str]:
+        """First enabled event among those that have fired, in STOP_EVENTS order."""
+        for event in self.events:
+            if fired.get(event):
+                return event
+        return None
+
+
+@dataclass
+class ScenarioCheckpoint:
+    """
+    Mid-run state of a scenario after `step` steps.
+
+    `state` holds the kernel scalars (current state and running summary terms),
+    `noise_state` the provider position, and `columns` the series emitted so far
+    (initial row included). Resuming a stream from a checkpoint continues the run
+    exactly as if it had never stopped, for any config that agrees with the
+    checkpointed one on the first `step` steps.
+    """
+
+    scenario: str
+    step: int
+    state: Dict[str, Any]
+    noise_state: Dict[str, Any]
+    labels: List[MacroLabel]
+    columns: Dict[str, np.ndarray]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "scenario": self.scenario,
+            "step": self.step,
+            "state": dict(self.state),
+            "noise_state": self.noise_state,
+            "labels": [[list(item) for item in label] for label in self.labels],
+            "columns": {key: values.tolist() for key, values in self.columns.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ScenarioCheckpoint":
+        return cls(
+            scenario=data["scenario"],
+            step=int(data["step"]),
+            state=dict(data["state"]),
+            noise_state=data["noise_state"],
+            labels=[tuple((key, value) for key, value in label) for label in data["labels"]],
+            columns={
+                key: np.asarray(values, dtype=np.int32 if key == "macro_code" else float)
+                for key, values in data["columns"].items()
+            },
+        )
+
+
+class ScenarioStream:
+    """
+    Chunked execution of a classical scenario with bounded memory.
+
+    Iterating yields dicts of fresh 1-D arrays covering at most `chunk_size` steps:
+    the state columns in STATE_KEYS (the first chunk also carries the initial
+    state) plus scenario series such as anomaly_proxy or capacity. Macro codes
+    index into `labels`, as in `Trajectory`. Once exhausted, `summary` holds the
+    scalar summary of `run_scenario` (without its timeseries entry).
+
+    Stochastic terms come from `noise` (a NoiseProvider with NOISE_TERMS columns)
+    or, by default, from the provider selected by `config["noise"]`.
+
+    A stream started from `resume` (a ScenarioCheckpoint) continues that run and
+    yields only the steps after it; `stop` ends the stream early so `checkpoint()`
+    can capture the state at that step.
+
+    With `config["stop_when"]` (see StopRule) the run halts once the rule fires;
+    the last chunk is cut there and the summary reports `stop_step` (steps
+    simulated) and `stop_reason` (the event, or "horizon").
+    """
+
+    def __init__(
+        self,
+        config: Dict,
+        chunk_size: Optional[int] = 4096,
+        noise: Optional[NoiseProvider] = None,
+        resume: Optional[ScenarioCheckpoint] = None,
+        stop: Optional[int] = None,
+    ) -> None:
+        self.config = config
+        self.layer_id = config.get("layer_id", "Lk")
+        self.scenario = config.get("scenario", "baseline_layer")
+        _check_single_layer(self.scenario)
+        self.seed = int(config.get("seed", 42))
+        self.horizon = int(config.get("horizon", 50))
+        self.dt = float(config.get("dt", 1.0))
+        if self.scenario == "transfer_cycle":
+            self.steps = len(config.get("substrates", ["S1", "S2"]))
+        else:
+            self.steps = self.horizon
+        self.chunk_size = max(1, int(chunk_size)) if chunk_size else max(1, self.steps)
+        self.labels: List[MacroLabel] = []
+        self._label_index: Dict[MacroLabel, int] = {}
+        self.population: Optional[PatternPopulation] = None
+        self.aggregate: Optional[PopulationAggregate] = None
+        self.summary: Optional[Dict[str, Any]] = None
+        self.n_terms = NOISE_TERMS.get(self.scenario, 3)
+        if noise is not None and noise.n_terms != self.n_terms:
+            raise ValueError(f"{self.scenario} needs a noise provider with {self.n_terms} terms")
+        self._noise_override = noise
+        self.noise: Optional[NoiseProvider] = None
+        if resume is not None:
+            if resume.scenario != self.scenario:
+                raise ValueError(f"Checkpoint of {resume.scenario} cannot resume {self.scenario}")
+            self.labels = list(resume.labels)
+            self._label_index = {label: code for code, label in enumerate(self.labels)}
+        self.resume = resume
+        self.end = self.steps if stop is None else max(0, min(self.steps, int(stop)))
+        if resume is not None and resume.state.get("halted"):
+            self.end = resume.step
+        self.stop_rule = StopRule.from_config(config)
+        self.state: Dict[str, Any] = {}
+
+    def __iter__(self) -> Iterator[Dict[str, np.ndarray]]:
+        self.noise = self._noise_override or make_noise(self.config, self.seed, self.n_terms)
+        if self.resume is not None:
+            self.noise.set_state(self.resume.noise_state)
+        if self.scenario == "anomaly_injection":
+            kernel = self._anomaly_injection()
+        elif self.scenario == "collapse_recovery":
+            kernel = self._collapse_recovery()
+        elif self.scenario == "transfer_cycle":
+            kernel = self._transfer_cycle()
+        else:
+            kernel = self._baseline()
+        self.summary = yield from kernel
+
+    @property
+    def patterns(self) -> List[Pattern]:
+        return self.population.to_patterns() if self.population is not None else []
+
+    def checkpoint(self, columns: Dict[str, np.ndarray]) -> ScenarioCheckpoint:
+        """Capture the state after the last yielded step; `columns` are the series up to it."""
+        if self.noise is None:
+            raise RuntimeError("Stream has not been run")
+        return ScenarioCheckpoint(
+            scenario=self.scenario,
+            step=self.state["step"],
+            state=dict(self.state),
+            noise_state=self.noise.get_state(),
+            labels=list(self.labels),
+            columns=columns,
+        )
+
+    # ---- Helpers ----
+    def _code(self, macro: Dict[str, object]) -> int:
+        label: MacroLabel = tuple(macro.items())
+        code = self._label_index.get(label)
+        if code is None:
+            code = self._label_index[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+    def _resumed(self, **initial: Any) -> Dict[str, Any]:
+        """Kernel scalars: `initial` for a fresh run, the checkpointed values on resume."""
+        state = dict(initial)
+        if self.resume is not None:
+            state.update(self.resume.state)
+        return state
+
+    def _save(self, step: int, **state: Any) -> None:
+        self.state = {"step": step, **state}
+
+    def _halt(self, chunk: Dict[str, np.ndarray], off: int, n: int, step: int) -> Dict[str, np.ndarray]:
+        """End the run after `step` (the n-th step of `chunk`) and cut the chunk there."""
+        self.end = step + 1
+        return {key: values[: n + off] for key, values in chunk.items()}
+
+    def _stop_summary(self, halted: bool, stop_reason: Optional[str]) -> Dict[str, Any]:
+        if self.stop_rule is None:
+            return {}
+        step = self.state["step"] if self.state else (self.resume.step if self.resume is not None else 0)
+        return {"stop_step": step, "stop_reason": stop_reason if halted else "horizon"}
+
+    def _chunks(self, initial: Tuple[float, float, float, float, int], raw: bool = False) -> Iterator[Tuple[Dict[str, np.ndarray], int, int, int, Any]]:
+        """
+        Yield (chunk, row offset, first step, n steps, noise rows); only the first
+        chunk of a fresh run holds `initial`. Noise for the whole chunk is drawn in
+        one call and handed over as nested lists for scalar loops, or as the
+        (n, n_terms) array when `raw`.
+        """
+        start = self.resume.step if self.resume is not None else 0
+        while True:
+            n = max(0, min(self.chunk_size, self.end - start))
+            off = 1 if start == 0 and self.resume is None else 0
+            if n == 0 and not off:
+                return
+            chunk = {key: np.empty(n + off) for key in STATE_KEYS[:-1]}
+            chunk["macro_code"] = np.empty(n + off, dtype=np.int32)
+            if off:
+                for key, value in zip(STATE_KEYS, initial):
+                    chunk[key][0] = value
+            zs = self.noise.draw(start, n)
+            yield chunk, off, start, n, zs if raw else zs.tolist()
+            start += n
+            if start >= self.end:
+                return
+
+    # ---- Kernels ----
+    def _baseline(self):
+        population = _estimated_population(self.layer_id, self.scenario, self.seed, self.config)
+        self.population = population
+        self.aggregate = aggregate = PopulationAggregate.from_population(population)
+        stable = self._code({"regime": "stable"})
+        upgrade = self._code({"regime": "upgrade"})
+        dt = self.dt
+        st = self._resumed(t=0.0, stress=0.2, protection=0.8, novelty=0.1, stress_max=0.2, protection_min=0.8)
+        t, stress, protection, novelty = st["t"], st["stress"], st["protection"], st["novelty"]
+        stress_max, protection_min = st["stress_max"], st["protection_min"]
+        for chunk, off, start, n, zs in self._chunks((t, stress, protection, novelty, stable)):
+            c_t, c_s, c_p, c_n, c_m = (chunk[key] for key in STATE_KEYS)
+            for j in range(off, n + off):
+                c_m[j] = upgrade if aggregate.mean > 0.6 else stable
+                stress, protection, novelty = _update_layer_state(stress, protection, novelty, aggregate, zs[j - off])
+                t = t + dt
+                c_t[j], c_s[j], c_p[j], c_n[j] = t, stress, protection, novelty
+            stress_max = max(stress_max, float(np.max(c_s)))
+            protection_min = min(protection_min, float(np.min(c_p)))
+            self._save(
+                start + n, t=t, stress=stress, protection=protection, novelty=novelty,
+                stress_max=stress_max, protection_min=protection_min,
+            )
+            yield chunk
+        return {
+            "scenario": self.scenario,
+            "seed": self.seed,
+            "stress_max": stress_max,
+            "protection_min": protection_min,
+            "anomaly_mean": aggregate.mean,
+            **self._stop_summary(False, None),
+        }
 
+    def _anomaly_injection(self):
+        cfg, dt = self.config, self.dt
+        inject_step = int(cfg.get("inject_step", self.horizon // 3))
+        anomaly_level = float(cfg.get("anomaly_level", 0.8))
+        threshold = float(cfg.get("anomaly_threshold", 0.5))
+        stable = self._code({"regime": "stable"})
+        upgrade = self._code({"regime": "upgrade"})
+        rule = self.stop_rule
+        st = self._resumed(
+            stress=0.2, protection=0.8, novelty=0.1, detection_latency=-1, false_positives=0, false_negatives=0,
+            stop_at=None, stop_reason=None, halted=False,
+        )
+        stress, protection, novelty = st["stress"], st["protection"], st["novelty"]
+        detection_latency = st["detection_latency"]
+        false_positives = st["false_positives"]
+        false_negatives = st["false_negatives"]
+        stop_at, stop_reason, halted = st["stop_at"], st["stop_reason"], st["halted"]
+        for chunk, off, start, n, zs in self._chunks((0.0, stress, protection, novelty, stable)):
+            c_t, c_s, c_p, c_n, c_m = (chunk[key] for key in STATE_KEYS)
+            anomaly_gt = np.empty(n)
+            anomaly_est = np.empty(n)
+            for j in range(n):
+                step = start + j
+                z = zs[j]
+                stress = stress + 0.03 * z[0]
+                protection = protection + 0.02 * z[1]
+                novelty = novelty + 0.02 * z[2]
+                is_anom = step >= inject_step
+                anomaly_gt[j] = 1.0 if is_anom else 0.0
+                if is_anom:
+                    stress += anomaly_level * 0.2
+                    protection -= anomaly_level * 0.1
+                    novelty += anomaly_level * 0.05
+                stress = max(0.0, min(1.0, stress))
+                protection = max(0.0, min(1.0, protection))
+                novelty = max(0.0, min(1.0, novelty))
+                anomaly_est[j] = max(0.0, min(1.0, 0.3 * stress + 0.4 * (1 - protection) + 0.3 * novelty))
+                i = j + off
+                c_t[i], c_s[i], c_p[i], c_n[i] = (step + 1) * dt, stress, protection, novelty
+                c_m[i] = upgrade if is_anom else stable
+                if rule is not None:
+                    if stop_at is None:
+                        stop_reason = rule.first(detection=is_anom and anomaly_est[j] >= threshold)
+                        if stop_reason:
+                            stop_at = step + rule.after_steps
+                    if step == stop_at:
+                        n, halted = j + 1, True
+                        chunk = self._halt(chunk, off, n, step)
+                        anomaly_gt, anomaly_est = anomaly_gt[:n], anomaly_est[:n]
+                        break
+            det_mask = anomaly_est >= threshold
+            hits = det_mask & (anomaly_gt > 0)
+            if detection_latency < 0 and np.any(hits):
+                detection_latency = int((start + int(np.argmax(hits))) * dt)
+            false_positives += int(np.sum(det_mask & (anomaly_gt == 0)))
+            false_negatives += int(np.sum((~det_mask) & (anomaly_gt == 1)))
+            chunk["anomaly_ground_truth"] = anomaly_gt
+            chunk["anomaly_proxy"] = anomaly_est
+            self._save(
+                start + n, stress=stress, protection=protection, novelty=novelty, detection_latency=detection_latency,
+                false_positives=false_positives, false_negatives=false_negatives,
+                stop_at=stop_at, stop_reason=stop_reason, halted=halted,
+            )
+            yield chunk
+        return {
+            "scenario": "anomaly_injection",
+            "seed": self.seed,
+            "inject_step": inject_step,
+            "anomaly_level": anomaly_level,
+            "detection_latency": detection_latency,
+            "false_positives": false_positives,
+            "false_negatives": false_negatives,
+            "anomaly_threshold": threshold,
+            **self._stop_summary(halted, stop_reason),
+        }
 
-def _update_layer_state(prev: LayerState, anomaly_mean: float, rng: np.random.Generator, dt: float) -> LayerState:
-    stress = max(0.0, min(1.0, prev.stress + rng.normal(0, 0.05) + 0.1 * anomaly_mean))
-    protection = max(0.0, min(1.0, prev.protection - 0.05 * anomaly_mean + rng.normal(0, 0.02)))
-    novelty = max(0.0, min(1.0, prev.novelty + rng.normal(0, 0.05) + 0.05 * anomaly_mean))
-    macro = {"regime": "upgrade" if anomaly_mean > 0.6 else "stable"}
-    return LayerState(t=prev.t + dt, stress=stress, protection=protection, novelty=novelty, macro=macro)
+    def _collapse_recovery(self):
+        cfg, dt = self.config, self.dt
+        recovery = bool(cfg.get("recovery", True))
+        anomaly_boost = float(cfg.get("anomaly_boost", 0.2))
+        stable = self._code({"regime": "stable"})
+        collapse = self._code({"regime": "collapse"})
+        rule = self.stop_rule
+        st = self._resumed(
+            stress=0.5, protection=0.6, novelty=0.2, capacity=1.0, collapse_time=None, recovery_time=None, capacity_min=None,
+            stop_at=None, stop_reason=None, halted=False,
+        )
+        stress, protection, novelty = st["stress"], st["protection"], st["novelty"]
+        collapse_time = st["collapse_time"]
+        recovery_time = st["recovery_time"]
+        capacity = st["capacity"]
+        capacity_min = st["capacity_min"]
+        stop_at, stop_reason, halted = st["stop_at"], st["stop_reason"], st["halted"]
+        for chunk, off, start, n, zs in self._chunks((0.0, stress, protection, novelty, stable)):
+            c_t, c_s, c_p, c_n, c_m = (chunk[key] for key in STATE_KEYS)
+            capacity_traj = np.empty(n)
+            for j in range(n):
+                step = start + j
+                z = zs[j]
+                stress = max(0.0, min(1.2, stress + 0.08 + 0.02 * z[0]))
+                capacity = max(0.0, min(1.0, capacity - 0.06 + 0.02 * z[1]))
+                if stress > 0.9 and collapse_time is None:
+                    collapse_time = (step + 1) * dt
+                if recovery and stress > 0.8:
+                    stress -= anomaly_boost * 0.2
+                    capacity += anomaly_boost * 0.1
+                if recovery and capacity < 0.5:
+                    capacity += 0.05
+                    stress -= 0.05
+                if recovery_time is None and collapse_time and capacity > 0.8:
+                    recovery_time = (step + 1) * dt
 
+                protection = max(0.0, min(1.0, protection - 0.05 + capacity * 0.1 + 0.02 * z[2]))
+                novelty = max(0.0, min(1.0, novelty + 0.02 * z[3]))
+                i = j + off
+                c_t[i], c_s[i], c_p[i], c_n[i] = (step + 1) * dt, stress, protection, novelty
+                c_m[i] = collapse if stress > 0.9 else stable
+                capacity_traj[j] = capacity
+                if rule is not None:
+                    if stop_at is None:
+                        stop_reason = rule.first(collapse=collapse_time is not None, recovery=recovery_time is not None)
+                        if stop_reason:
+                            stop_at = step + rule.after_steps
+                    if step == stop_at:
+                        n, halted = j + 1, True
+                        chunk = self._halt(chunk, off, n, step)
+                        capacity_traj = capacity_traj[:n]
+                        break
+            if n:
+                low = float(np.min(capacity_traj))
+                capacity_min = low if capacity_min is None else min(capacity_min, low)
+            chunk["capacity"] = capacity_traj
+            self._save(
+                start + n, stress=stress, protection=protection, novelty=novelty, capacity=capacity,
+                collapse_time=collapse_time, recovery_time=recovery_time, capacity_min=capacity_min,
+                stop_at=stop_at, stop_reason=stop_reason, halted=halted,
+            )
+            yield chunk
+        return {
+            "scenario": "collapse_recovery",
+            "seed": self.seed,
+            "collapse_time": collapse_time if collapse_time is not None else -1,
+            "recovery_time": recovery_time if recovery_time is not None else -1,
+            "capacity_min": capacity_min if capacity_min is not None else 0.0,
+            **self._stop_summary(halted, stop_reason),
+        }
 
-def run_scenario(config: Dict) -> Tuple[Layer, Dict]:
+    def _transfer_cycle(self):
+        substrates = self.config.get("substrates", ["S1", "S2"])
+        noise = _substrate_noise(self.config, self.steps)
+        dt = self.dt
+        st = self._resumed(
+            stress=0.3, protection=0.7, novelty=0.2, pattern_fidelity=1.0,
+            continuity_min=float("inf"), continuity_sum=0.0, continuity_low=0,
+        )
+        stress, protection, novelty = st["stress"], st["protection"], st["novelty"]
+        pattern_fidelity = st["pattern_fidelity"]
+        continuity_min = st["continuity_min"]
+        continuity_sum = st["continuity_sum"]
+        continuity_low = st["continuity_low"]
+        codes: Dict[Any, int] = {}
+        for chunk, off, start, n, zs in self._chunks((0.0, stress, protection, novelty, self._code({"regime": "stable"})), raw=True):
+            # Every hop is a clipped running sum, so whole chunks go through _clipped_walk.
+            n_s = noise[start : start + n]
+            continuity = _clipped_walk(pattern_fidelity, -n_s, 0.01 * zs[:, 0])
+            chunk["t"][off:] = np.arange(start + 1, start + n + 1) * dt
+            chunk["stress"][off:] = _clipped_walk(stress, n_s)
+            chunk["protection"][off:] = _clipped_walk(protection, -(n_s * 0.5))
+            chunk["novelty"][off:] = _clipped_walk(novelty, n_s * 0.2)
+            for i, name in enumerate(substrates[start : start + n], off):
+                code = codes.get(name)
+                if code is None:
+                    code = codes[name] = self._code({"substrate": name})
+                chunk["macro_code"][i] = code
+            if n:
+                pattern_fidelity = float(continuity[-1])
+                stress, protection, novelty = (float(chunk[key][-1]) for key in STATE_KEYS[1:4])
+                continuity_min = min(continuity_min, float(np.min(continuity)))
+                continuity_sum += float(np.sum(continuity))
+                continuity_low += int(np.sum(continuity < 0.7))
+            chunk["continuity"] = continuity
+            self._save(
+                start + n, stress=stress, protection=protection, novelty=novelty, pattern_fidelity=pattern_fidelity,
+                continuity_min=continuity_min, continuity_sum=continuity_sum, continuity_low=continuity_low,
+            )
+            yield chunk
+        return {
+            "scenario": "transfer_cycle",
+            "seed": self.seed,
+            "substrates": substrates,
+            "continuity_min": continuity_min,
+            "continuity_mean": continuity_sum / len(substrates),
+            "identity_loss_prob": continuity_low / len(substrates),
+            **self._stop_summary(False, None),
+        }
+
+
+def _join_columns(resume: Optional[ScenarioCheckpoint], chunks: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    parts = ([resume.columns] if resume is not None else []) + chunks
+    if len(parts) == 1:
+        return dict(parts[0])
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def checkpoint_scenario(config: Dict, step: int, resume: Optional[ScenarioCheckpoint] = None) -> ScenarioCheckpoint:
+    """Run `config` up to `step` (from `resume` if given) and capture its state there."""
+    stream = ScenarioStream(config, chunk_size=None, resume=resume, stop=step)
+    chunks = list(stream)
+    if not stream.state:
+        # Nothing ran past the resume point.
+        return resume  # type: ignore[return-value]
+    return stream.checkpoint(_join_columns(resume, chunks))
+
+
+def _check_single_layer(scenario: str) -> None:
+    # Multi-layer scenarios would otherwise fall through to baseline_layer.
+    if scenario == "coupled_layers":
+        raise ValueError("coupled_layers is a multi-layer scenario; run it with qmpt_core.hierarchy.run_hierarchy")
+
+
+def run_scenario(config: Dict, resume: Optional[ScenarioCheckpoint] = None) -> Tuple[Layer, Dict]:
+    """Run a classical scenario; with `resume`, continue from a checkpoint of an equivalent prefix."""
+    stream = ScenarioStream(config, chunk_size=None, resume=resume)
+    chunks = list(stream)
+    columns = _join_columns(resume, chunks)
+    trajectory = Trajectory.from_arrays(
+        columns["t"], columns["stress"], columns["protection"], columns["novelty"], columns["macro_code"], stream.labels
+    )
+    layer = Layer(layer_id=stream.layer_id, description=stream.scenario, patterns=stream.patterns, trajectory=trajectory)
+    summary: Dict[str, Any] = dict(stream.summary or {})
+    extra = {key: values for key, values in columns.items() if key not in STATE_KEYS}
+    if extra:
+        summary["timeseries"] = extra
+    return layer, summary
+
+
+# Batched multi-seed engine
+
+_NOISE_CHUNK = 256
+
+
+@dataclass
+class BatchResult:
+    """
+    Stacked trajectories for many seeds of one scenario config.
+
+    State arrays have shape (n_seeds, steps + 1) and include the initial state;
+    extra series in `timeseries` have shape (n_seeds, steps). Macros are stored
+    as codes into `macro_labels`, as in `Trajectory`. When a stop rule cut runs
+    short, `lengths[i]` is the number of valid state rows of seed i and later
+    columns are undefined.
+    `summaries[i]` matches what `run_scenario` returns for `seeds[i]`.
+    """
+
+    scenario: str
+    layer_id: str
+    seeds: np.ndarray
+    t: np.ndarray
+    stress: np.ndarray
+    protection: np.ndarray
+    novelty: np.ndarray
+    macro_labels: Tuple[MacroLabel, ...]
+    macro_codes: np.ndarray
+    summaries: List[Dict[str, Any]]
+    timeseries: Dict[str, np.ndarray] = field(default_factory=dict)
+    populations: Optional[List[PatternPopulation]] = None
+    lengths: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.seeds)
+
+    def run(self, i: int) -> Tuple[Layer, Dict[str, Any]]:
+        """Rebuild the (layer, summary) pair of the scalar path for seed index i."""
+        patterns = self.populations[i].to_patterns() if self.populations is not None else []
+        rows = slice(None) if self.lengths is None else slice(0, int(self.lengths[i]))
+        trajectory = Trajectory.from_arrays(
+            (self.t if self.t.ndim == 1 else self.t[i])[rows],
+            self.stress[i, rows],
+            self.protection[i, rows],
+            self.novelty[i, rows],
+            self.macro_codes[i, rows],
+            list(self.macro_labels),
+        )
+        layer = Layer(layer_id=self.layer_id, description=self.scenario, patterns=patterns, trajectory=trajectory)
+        return layer, dict(self.summaries[i])
+
+
+def _noise_bank(config: Dict, seeds: np.ndarray, n_terms: int) -> NoiseBank:
+    return NoiseBank([make_noise(config, int(seed), n_terms) for seed in seeds], _NOISE_CHUNK)
+
+
+class _BatchStop:
+    """Per-seed StopRule bookkeeping for the batched kernels."""
+
+    def __init__(self, rule: Optional[StopRule], n: int, horizon: int) -> None:
+        self.rule = rule
+        self.horizon = horizon
+        self.stop_at = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+        self.reason = np.full(n, -1, dtype=np.int64)
+        self.steps = horizon
+
+    def active(self, k: int) -> np.ndarray:
+        """Seeds still running at step k."""
+        return k <= self.stop_at
+
+    def update(self, k: int, **fired: np.ndarray) -> bool:
+        """Record events fired at step k; True once every seed has halted."""
+        if self.rule is None:
+            return False
+        pending = self.reason < 0
+        for code, event in enumerate(self.rule.events):
+            new = pending & fired[event]
+            self.reason[new] = code
+            self.stop_at[new] = k + self.rule.after_steps
+            pending &= ~new
+        if np.all(self.stop_at <= k):
+            self.steps = k + 1
+            return True
+        return False
+
+    def lengths(self) -> np.ndarray:
+        """Simulated steps per seed."""
+        return np.minimum(self.stop_at, self.steps - 1) + 1
+
+    def valid(self) -> np.ndarray:
+        """(n, steps) mask of simulated steps."""
+        return np.arange(self.steps) < self.lengths()[:, None]
+
+    def summary(self, i: int) -> Dict[str, Any]:
+        if self.rule is None:
+            return {}
+        halted = self.stop_at[i] < self.horizon
+        return {
+            "stop_step": int(self.lengths()[i]),
+            "stop_reason": self.rule.events[self.reason[i]] if halted else "horizon",
+        }
+
+
+def run_scenario_batch(config: Dict, seeds: Sequence[int]) -> BatchResult:
+    """
+    Run one scenario config for many seeds at once.
+
+    All seeds advance together as (n_seeds,) arrays per step; each seed keeps its
+    own noise provider (see `config["noise"]`), so every trajectory and summary
+    equals the scalar `run_scenario` result for that seed.
+    """
     layer_id = config.get("layer_id", "Lk")
     scenario = config.get("scenario", "baseline_layer")
-    seed = int(config.get("seed", 42))
+    _check_single_layer(scenario)
     horizon = int(config.get("horizon", 50))
     dt = float(config.get("dt", 1.0))
-    rng = np.random.default_rng(seed)
+    seeds_arr = np.asarray([int(s) for s in seeds], dtype=np.int64)
+    if seeds_arr.size == 0:
+        raise ValueError("run_scenario_batch needs at least one seed")
 
     if scenario == "anomaly_injection":
-        return _run_anomaly_injection(config, layer_id, seed, horizon, dt, rng)
+        return _batch_anomaly_injection(config, layer_id, seeds_arr, horizon, dt)
     if scenario == "collapse_recovery":
-        return _run_collapse_recovery(config, layer_id, seed, horizon, dt, rng)
+        return _batch_collapse_recovery(config, layer_id, seeds_arr, horizon, dt)
     if scenario == "transfer_cycle":
-        return _run_transfer_cycle(config, layer_id, seed, horizon, dt, rng)
-
-    patterns = _build_patterns(layer_id, scenario, seed)
-    estimate_anomaly(patterns)
-    estimate_reflexivity(patterns)
-    estimate_self_operator(patterns)
-
-    layer = Layer(layer_id=layer_id, description=scenario, patterns=patterns)
-    state0 = LayerState(t=0.0, stress=0.2, protection=0.8, novelty=0.1, macro={"regime": "stable"})
-    layer.trajectory.append(state0)
-
-    for _ in range(horizon):
-        anomaly_mean = float(np.mean([p.anomaly_score or 0.0 for p in patterns]))
-        next_state = _update_layer_state(layer.trajectory[-1], anomaly_mean, rng, dt)
-        layer.trajectory.append(next_state)
-
-    summary = {
-        "scenario": scenario,
-        "seed": seed,
-        "stress_max": max(s.stress for s in layer.trajectory),
-        "protection_min": min(s.protection for s in layer.trajectory),
-        "anomaly_mean": float(np.mean([p.anomaly_score or 0.0 for p in patterns])),
-    }
-    return layer, summary
+        return _batch_transfer_cycle(config, layer_id, seeds_arr, dt)
+    return _batch_baseline(config, scenario, layer_id, seeds_arr, horizon, dt)
+
+
+def _alloc_states(n: int, horizon: int, stress0: float, protection0: float, novelty0: float):
+    stress = np.empty((n, horizon + 1))
+    protection = np.empty((n, horizon + 1))
+    novelty = np.empty((n, horizon + 1))
+    stress[:, 0] = stress0
+    protection[:, 0] = protection0
+    novelty[:, 0] = novelty0
+    return stress, protection, novelty
 
 
-def _run_anomaly_injection(config: Dict, layer_id: str, seed: int, horizon: int, dt: float, rng) -> Tuple[Layer, Dict[str, Any]]:
+def _batch_baseline(config: Dict, scenario: str, layer_id: str, seeds: np.ndarray, horizon: int, dt: float) -> BatchResult:
+    n = len(seeds)
+    stop = _BatchStop(StopRule.from_config(config), n, horizon)
+    populations: List[PatternPopulation] = []
+    anomaly_mean = np.empty(n)
+    for i, seed in enumerate(seeds):
+        population = _estimated_population(layer_id, scenario, int(seed), config)
+        populations.append(population)
+        anomaly_mean[i] = PopulationAggregate.from_population(population).mean
+
+    stress, protection, novelty = _alloc_states(n, horizon, 0.2, 0.8, 0.1)
+    noise = _noise_bank(config, seeds, 3)
+    for k in range(horizon):
+        z = noise.next()
+        stress[:, k + 1] = np.clip(stress[:, k] + 0.05 * z[:, 0] + 0.1 * anomaly_mean, 0.0, 1.0)
+        protection[:, k + 1] = np.clip(protection[:, k] - 0.05 * anomaly_mean + 0.02 * z[:, 1], 0.0, 1.0)
+        novelty[:, k + 1] = np.clip(novelty[:, k] + 0.05 * z[:, 2] + 0.05 * anomaly_mean, 0.0, 1.0)
+
+    t = np.cumsum(np.concatenate([[0.0], np.full(horizon, dt)]))
+    macro_codes = np.zeros((n, horizon + 1), dtype=np.int8)
+    macro_codes[anomaly_mean > 0.6, 1:] = 1
+    stress_max = stress.max(axis=1)
+    protection_min = protection.min(axis=1)
+    summaries = [
+        {
+            "scenario": scenario,
+            "seed": int(seeds[i]),
+            "stress_max": float(stress_max[i]),
+            "protection_min": float(protection_min[i]),
+            "anomaly_mean": float(anomaly_mean[i]),
+            **stop.summary(i),
+        }
+        for i in range(n)
+    ]
+    return BatchResult(
+        scenario=scenario,
+        layer_id=layer_id,
+        seeds=seeds,
+        t=t,
+        stress=stress,
+        protection=protection,
+        novelty=novelty,
+        macro_labels=((("regime", "stable"),), (("regime", "upgrade"),)),
+        macro_codes=macro_codes,
+        summaries=summaries,
+        populations=populations,
+    )
+
+
+def _batch_anomaly_injection(config: Dict, layer_id: str, seeds: np.ndarray, horizon: int, dt: float) -> BatchResult:
     inject_step = int(config.get("inject_step", horizon // 3))
     anomaly_level = float(config.get("anomaly_level", 0.8))
     threshold = float(config.get("anomaly_threshold", 0.5))
-    layer = Layer(layer_id=layer_id, description="anomaly_injection")
-    state0 = LayerState(t=0.0, stress=0.2, protection=0.8, novelty=0.1, macro={"regime": "stable"})
-    layer.trajectory.append(state0)
-    anomaly_gt = []
-    anomaly_est = []
-    for step in range(horizon):
-        current = layer.trajectory[-1]
-        stress = current.stress + rng.normal(0, 0.03)
-        protection = current.protection + rng.normal(0, 0.02)
-        novelty = current.novelty + rng.normal(0, 0.02)
-        is_anom = step >= inject_step
-        anomaly_gt.append(1.0 if is_anom else 0.0)
-        if is_anom:
-            stress += anomaly_level * 0.2
-            protection -= anomaly_level * 0.1
-            novelty += anomaly_level * 0.05
-        stress = float(np.clip(stress, 0.0, 1.0))
-        protection = float(np.clip(protection, 0.0, 1.0))
-        novelty = float(np.clip(novelty, 0.0, 1.0))
-        est = float(np.clip(0.3 * stress + 0.4 * (1 - protection) + 0.3 * novelty, 0.0, 1.0))
-        anomaly_est.append(est)
-        layer.trajectory.append(LayerState(t=(step + 1) * dt, stress=stress, protection=protection, novelty=novelty, macro={"regime": "upgrade" if is_anom else "stable"}))
-
-    anomaly_est_arr = np.array(anomaly_est)
-    gt_arr = np.array(anomaly_gt)
-    det_mask = anomaly_est_arr >= threshold
-    detection_latency = -1
-    if np.any(det_mask & (gt_arr > 0)):
-        detection_latency = int(np.argmax(det_mask & (gt_arr > 0)) * dt)
-    summary = {
-        "scenario": "anomaly_injection",
-        "seed": seed,
-        "inject_step": inject_step,
-        "anomaly_level": anomaly_level,
-        "detection_latency": detection_latency,
-        "false_positives": int(np.sum(det_mask & (gt_arr == 0))),
-        "false_negatives": int(np.sum((~det_mask) & (gt_arr == 1))),
-        "anomaly_threshold": threshold,
-        "timeseries": {"anomaly_ground_truth": gt_arr, "anomaly_proxy": anomaly_est_arr},
-    }
-    return layer, summary
+    n = len(seeds)
+    stop = _BatchStop(StopRule.from_config(config), n, horizon)
+    stress, protection, novelty = _alloc_states(n, horizon, 0.2, 0.8, 0.1)
+    anomaly_est = np.empty((n, horizon))
+    noise = _noise_bank(config, seeds, 3)
+    for k in range(horizon):
+        z = noise.next()
+        s = stress[:, k] + 0.03 * z[:, 0]
+        p = protection[:, k] + 0.02 * z[:, 1]
+        v = novelty[:, k] + 0.02 * z[:, 2]
+        if k >= inject_step:
+            s += anomaly_level * 0.2
+            p -= anomaly_level * 0.1
+            v += anomaly_level * 0.05
+        stress[:, k + 1] = np.clip(s, 0.0, 1.0)
+        protection[:, k + 1] = np.clip(p, 0.0, 1.0)
+        novelty[:, k + 1] = np.clip(v, 0.0, 1.0)
+        anomaly_est[:, k] = np.clip(0.3 * stress[:, k + 1] + 0.4 * (1 - protection[:, k + 1]) + 0.3 * novelty[:, k + 1], 0.0, 1.0)
+        if stop.update(k, detection=(anomaly_est[:, k] >= threshold) if k >= inject_step else np.zeros(n, dtype=bool)):
+            break
+
+    steps = stop.steps
+    stress, protection, novelty = stress[:, : steps + 1], protection[:, : steps + 1], novelty[:, : steps + 1]
+    anomaly_est = anomaly_est[:, :steps]
+    lengths = stop.lengths()
+    valid = stop.valid()
+    gt = (np.arange(steps) >= inject_step).astype(float)
+    gt_rows = np.broadcast_to(gt, (n, steps))
+    det_mask = anomaly_est >= threshold
+    hit = det_mask & (gt > 0) & valid
+    has_hit = hit.any(axis=1)
+    # A zero-length horizon has no steps to hit (argmax of an empty axis raises).
+    first_hit = np.argmax(hit, axis=1) if steps else np.zeros(n, dtype=np.int64)
+    false_pos = np.sum(det_mask & (gt == 0) & valid, axis=1)
+    false_neg = np.sum(~det_mask & (gt == 1) & valid, axis=1)
+    summaries = [
+        {
+            "scenario": "anomaly_injection",
+            "seed": int(seeds[i]),
+            "inject_step": inject_step,
+            "anomaly_level": anomaly_level,
+            "detection_latency": int(first_hit[i] * dt) if has_hit[i] else -1,
+            "false_positives": int(false_pos[i]),
+            "false_negatives": int(false_neg[i]),
+            "anomaly_threshold": threshold,
+            **stop.summary(i),
+            "timeseries": {"anomaly_ground_truth": gt_rows[i, : lengths[i]], "anomaly_proxy": anomaly_est[i, : lengths[i]]},
+        }
+        for i in range(n)
+    ]
+    macro_codes = np.zeros((n, steps + 1), dtype=np.int8)
+    macro_codes[:, 1:] = gt.astype(np.int8)
+    return BatchResult(
+        scenario="anomaly_injection",
+        layer_id=layer_id,
+        seeds=seeds,
+        t=np.arange(steps + 1) * dt,
+        stress=stress,
+        protection=protection,
+        novelty=novelty,
+        macro_labels=((("regime", "stable"),), (("regime", "upgrade"),)),
+        macro_codes=macro_codes,
+        summaries=summaries,
+        timeseries={"anomaly_ground_truth": gt_rows, "anomaly_proxy": anomaly_est},
+        lengths=lengths + 1 if stop.rule is not None else None,
+    )
 
 
-def _run_collapse_recovery(config: Dict, layer_id: str, seed: int, horizon: int, dt: float, rng) -> Tuple[Layer, Dict[str, Any]]:
+def _batch_collapse_recovery(config: Dict, layer_id: str, seeds: np.ndarray, horizon: int, dt: float) -> BatchResult:
     recovery = bool(config.get("recovery", True))
     anomaly_boost = float(config.get("anomaly_boost", 0.2))
-    layer = Layer(layer_id=layer_id, description="collapse_recovery")
-    state0 = LayerState(t=0.0, stress=0.5, protection=0.6, novelty=0.2, macro={"regime": "stable"})
-    layer.trajectory.append(state0)
-    collapse_time = None
-    recovery_time = None
-    capacity = 1.0
-    capacity_traj = []
-    for step in range(horizon):
-        current = layer.trajectory[-1]
-        stress = float(np.clip(current.stress + 0.08 + rng.normal(0, 0.02), 0.0, 1.2))
-        capacity = float(np.clip(capacity - 0.06 + rng.normal(0, 0.02), 0.0, 1.0))
-        if stress > 0.9 and collapse_time is None:
-            collapse_time = (step + 1) * dt
-        if recovery and stress > 0.8:
-            stress -= anomaly_boost * 0.2
-            capacity += anomaly_boost * 0.1
-        if recovery and capacity < 0.5:
-            capacity += 0.05
-            stress -= 0.05
-        if recovery_time is None and collapse_time and capacity > 0.8:
-            recovery_time = (step + 1) * dt
-
-        protection = float(np.clip(current.protection - 0.05 + capacity * 0.1 + rng.normal(0, 0.02), 0.0, 1.0))
-        novelty = float(np.clip(current.novelty + rng.normal(0, 0.02), 0.0, 1.0))
-        layer.trajectory.append(LayerState(t=(step + 1) * dt, stress=stress, protection=protection, novelty=novelty, macro={"regime": "collapse" if stress > 0.9 else "stable"}))
-        capacity_traj.append(capacity)
-    summary = {
-        "scenario": "collapse_recovery",
-        "seed": seed,
-        "collapse_time": collapse_time if collapse_time is not None else -1,
-        "recovery_time": recovery_time if recovery_time is not None else -1,
-        "capacity_min": float(min(capacity_traj)) if capacity_traj else 0.0,
-        "timeseries": {"capacity": np.array(capacity_traj)},
-    }
-    return layer, summary
+    n = len(seeds)
+    stop = _BatchStop(StopRule.from_config(config), n, horizon)
+    stress, protection, novelty = _alloc_states(n, horizon, 0.5, 0.6, 0.2)
+    capacity_traj = np.empty((n, horizon))
+    capacity = np.ones(n)
+    collapse_time = np.full(n, -1.0)
+    recovery_time = np.full(n, -1.0)
+    collapsed = np.zeros(n, dtype=bool)
+    recovered = np.zeros(n, dtype=bool)
+    noise = _noise_bank(config, seeds, 4)
+    for k in range(horizon):
+        z = noise.next()
+        now = (k + 1) * dt
+        s = np.clip(stress[:, k] + 0.08 + 0.02 * z[:, 0], 0.0, 1.2)
+        capacity = np.clip(capacity - 0.06 + 0.02 * z[:, 1], 0.0, 1.0)
+        active = stop.active(k)
+        new_collapse = (s > 0.9) & ~collapsed & active
+        collapse_time[new_collapse] = now
+        collapsed |= new_collapse
+        if recovery:
+            boost = s > 0.8
+            s = np.where(boost, s - anomaly_boost * 0.2, s)
+            capacity = np.where(boost, capacity + anomaly_boost * 0.1, capacity)
+            low = capacity < 0.5
+            capacity = np.where(low, capacity + 0.05, capacity)
+            s = np.where(low, s - 0.05, s)
+        new_recovery = ~recovered & collapsed & (collapse_time != 0) & (capacity > 0.8) & active
+        recovery_time[new_recovery] = now
+        recovered |= new_recovery
+        stress[:, k + 1] = s
+        protection[:, k + 1] = np.clip(protection[:, k] - 0.05 + capacity * 0.1 + 0.02 * z[:, 2], 0.0, 1.0)
+        novelty[:, k + 1] = np.clip(novelty[:, k] + 0.02 * z[:, 3], 0.0, 1.0)
+        capacity_traj[:, k] = capacity
+        if stop.update(k, collapse=collapsed, recovery=recovered):
+            break
+
+    steps = stop.steps
+    stress, protection, novelty = stress[:, : steps + 1], protection[:, : steps + 1], novelty[:, : steps + 1]
+    capacity_traj = capacity_traj[:, :steps]
+    lengths = stop.lengths()
+    capacity_min = np.where(stop.valid(), capacity_traj, np.inf).min(axis=1) if steps else np.zeros(n)
+    summaries = [
+        {
+            "scenario": "collapse_recovery",
+            "seed": int(seeds[i]),
+            "collapse_time": float(collapse_time[i]) if collapsed[i] else -1,
+            "recovery_time": float(recovery_time[i]) if recovered[i] else -1,
+            "capacity_min": float(capacity_min[i]),
+            **stop.summary(i),
+            "timeseries": {"capacity": capacity_traj[i, : lengths[i]]},
+        }
+        for i in range(n)
+    ]
+    macro_codes = np.zeros((n, steps + 1), dtype=np.int8)
+    macro_codes[:, 1:] = stress[:, 1:] > 0.9
+    return BatchResult(
+        scenario="collapse_recovery",
+        layer_id=layer_id,
+        seeds=seeds,
+        t=np.arange(steps + 1) * dt,
+        stress=stress,
+        protection=protection,
+        novelty=novelty,
+        macro_labels=((("regime", "stable"),), (("regime", "collapse"),)),
+        macro_codes=macro_codes,
+        summaries=summaries,
+        timeseries={"capacity": capacity_traj},
+        lengths=lengths + 1 if stop.rule is not None else None,
+    )
 
 
-def _run_transfer_cycle(config: Dict, layer_id: str, seed: int, horizon: int, dt: float, rng) -> Tuple[Layer, Dict[str, Any]]:
+def _batch_transfer_cycle(config: Dict, layer_id: str, seeds: np.ndarray, dt: float) -> BatchResult:
     substrates = config.get("substrates", ["S1", "S2"])
-    noise = config.get("substrate_noise", [0.05 for _ in substrates])
-    continuity = []
-    layer = Layer(layer_id=layer_id, description="transfer_cycle")
-    state0 = LayerState(t=0.0, stress=0.3, protection=0.7, novelty=0.2, macro={"regime": "stable"})
-    layer.trajectory.append(state0)
-    pattern_fidelity = 1.0
-    for step in range(len(substrates)):
-        n = float(noise[step] if step < len(noise) else noise[-1])
-        pattern_fidelity = float(np.clip(pattern_fidelity - n + rng.normal(0, 0.01), 0.0, 1.0))
-        continuity.append(pattern_fidelity)
-        stress = float(np.clip(layer.trajectory[-1].stress + n, 0.0, 1.0))
-        protection = float(np.clip(layer.trajectory[-1].protection - n * 0.5, 0.0, 1.0))
-        novelty = float(np.clip(layer.trajectory[-1].novelty + n * 0.2, 0.0, 1.0))
-        layer.trajectory.append(LayerState(t=(step + 1) * dt, stress=stress, protection=protection, novelty=novelty, macro={"substrate": substrates[step]}))
-    summary = {
-        "scenario": "transfer_cycle",
-        "seed": seed,
-        "substrates": substrates,
-        "continuity_min": float(min(continuity)),
-        "continuity_mean": float(np.mean(continuity)),
-        "identity_loss_prob": float(np.mean(np.array(continuity) < 0.7)),
-        "timeseries": {"continuity": np.array(continuity)},
-    }
-    return layer, summary
+    steps = len(substrates)
+    noise = _substrate_noise(config, steps)
+    n = len(seeds)
+    stop = _BatchStop(StopRule.from_config(config), n, steps)
+    # Substrate noise is shared by all seeds, so the state chains are computed once.
+    chains = [
+        np.concatenate([[x0], _clipped_walk(x0, a)])
+        for x0, a in ((0.3, noise), (0.7, -(noise * 0.5)), (0.2, noise * 0.2))
+    ]
+    stress, protection, novelty = (np.broadcast_to(chain, (n, steps + 1)) for chain in chains)
+
+    z = np.stack([make_noise(config, int(seed), 1).draw(0, steps)[:, 0] for seed in seeds])
+    continuity = _clipped_walks(np.ones(n), -noise, 0.01 * z)
+
+    labels: Dict[MacroLabel, int] = {(("regime", "stable"),): 0}
+    row = np.zeros(steps + 1, dtype=np.int32)
+    for k, name in enumerate(substrates, 1):
+        row[k] = labels.setdefault((("substrate", name),), len(labels))
+    summaries = [
+        {
+            "scenario": "transfer_cycle",
+            "seed": int(seeds[i]),
+            "substrates": substrates,
+            "continuity_min": float(np.min(continuity[i])),
+            "continuity_mean": float(np.sum(continuity[i])) / steps,
+            "identity_loss_prob": int(np.sum(continuity[i] < 0.7)) / steps,
+            **stop.summary(i),
+            "timeseries": {"continuity": continuity[i]},
+        }
+        for i in range(n)
+    ]
+    return BatchResult(
+        scenario="transfer_cycle",
+        layer_id=layer_id,
+        seeds=seeds,
+        t=np.arange(steps + 1) * dt,
+        stress=stress,
+        protection=protection,
+        novelty=novelty,
+        macro_labels=tuple(labels),
+        macro_codes=np.broadcast_to(row, (n, steps + 1)),
+        summaries=summaries,
+        timeseries={"continuity": continuity},
+    )
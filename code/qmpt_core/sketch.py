@@ -0,0 +1,108 @@
+"""
+Johnson-Lindenstrauss sketches of high-dimensional pattern features.
+
+A Gaussian random projection P (d x m, entries N(0, 1/m)) keeps every pairwise
+distance and norm of n points within a factor (1 +- eps) with high probability
+once m >= 4 ln n / (eps^2 / 2 - eps^3 / 3). The estimators only need norms,
+distances to the mean and per-row feature variance. The sketch carries the exact
+row sums so that var(x) = |x|^2 / d - (sum(x) / d)^2 can be rebuilt from it.
+"""
+
+from __future__ import annotations
+
+import functools
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+# Rows sampled when measuring the realised sketch error.
+_ERROR_SAMPLE = 64
+
+
+def jl_dimension(n: int, eps: float) -> int:
+    """Target dimension that preserves n points' pairwise distances within 1 +- eps."""
+    if not 0.0 < eps < 1.0:
+        raise ValueError("sketch eps must be in (0, 1)")
+    return int(np.ceil(4.0 * np.log(max(n, 2)) / (eps ** 2 / 2.0 - eps ** 3 / 3.0)))
+
+
+@dataclass
+class FeatureSketch:
+    """
+    Projected features (n, target_dim) stored next to the raw (n, dim) matrix.
+
+    `error` holds the eps bound the dimension was chosen for (None when the
+    dimension was given) and the worst relative error of norms and pairwise
+    distances measured on a sample of rows.
+    """
+
+    features: np.ndarray
+    row_sums: np.ndarray
+    dim: int
+    seed: int
+    eps: Optional[float] = None
+    error: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def target_dim(self) -> int:
+        return int(self.features.shape[1])
+
+    @classmethod
+    def build(
+        cls, features: np.ndarray, target_dim: Optional[int] = None, eps: float = 0.1, seed: int = 0
+    ) -> "FeatureSketch":
+        """Sketch `features` to `target_dim` columns, or to the JL dimension for `eps` when not given."""
+        features = np.asarray(features, dtype=float)
+        n, dim = features.shape
+        bound: Optional[float] = None
+        if target_dim is None:
+            target_dim, bound = jl_dimension(n, eps), eps
+        sketch = cls(
+            features=features @ projection(dim, int(target_dim), seed),
+            row_sums=features.sum(axis=1),
+            dim=dim,
+            seed=int(seed),
+            eps=bound,
+        )
+        sketch.error = sketch.measure_error(features)
+        return sketch
+
+    def apply(self, features: np.ndarray) -> np.ndarray:
+        """Project further rows with the same matrix."""
+        return np.asarray(features, dtype=float) @ projection(self.dim, self.target_dim, self.seed)
+
+    def row_variance(self) -> np.ndarray:
+        """Per-row variance of the raw features, rebuilt from sketched norms and exact row sums."""
+        sq = np.einsum("ij,ij->i", self.features, self.features)
+        return np.maximum(sq / self.dim - (self.row_sums / self.dim) ** 2, 0.0)
+
+    def measure_error(self, features: np.ndarray) -> Dict[str, Any]:
+        """Worst relative error of norms and pairwise distances over a fixed sample of rows."""
+        n = len(features)
+        rows = np.random.default_rng(self.seed).choice(n, size=min(n, _ERROR_SAMPLE), replace=False) if n else np.zeros(0, int)
+        raw, sk = features[rows], self.features[rows]
+        norm_raw, norm_sk = np.linalg.norm(raw, axis=1), np.linalg.norm(sk, axis=1)
+        i, j = np.triu_indices(len(rows), k=1)
+        dist_raw = np.linalg.norm(raw[i] - raw[j], axis=1)
+        dist_sk = np.linalg.norm(sk[i] - sk[j], axis=1)
+        return {
+            "eps": self.eps,
+            "target_dim": self.target_dim,
+            "norm_max_rel_error": _max_rel(norm_sk, norm_raw),
+            "distance_max_rel_error": _max_rel(dist_sk, dist_raw),
+        }
+
+
+@functools.lru_cache(maxsize=4)
+def projection(dim: int, target_dim: int, seed: int) -> np.ndarray:
+    """Gaussian JL matrix (dim, target_dim) with N(0, 1/target_dim) entries, fixed by the seed (read-only, cached)."""
+    rng = np.random.default_rng(seed)
+    out = rng.standard_normal((dim, target_dim)) / np.sqrt(target_dim)
+    out.flags.writeable = False
+    return out
+
+
+def _max_rel(approx: np.ndarray, exact: np.ndarray) -> float:
+    ok = exact > 0
+    return float(np.max(np.abs(approx[ok] / exact[ok] - 1.0))) if np.any(ok) else 0.0
@@ -0,0 +1,102 @@
+"""
+Prefix-sharing execution of classical scenario sweeps.
+
+Runs in a sweep often agree for many steps: an anomaly_injection sweep over
+inject_step or anomaly_level is identical until the earliest injection. Each
+config is reduced to a static part (everything that affects every step) and a
+per-step drive sequence (the exogenous input of each step). Configs with the
+same static part form a prefix tree over their drives; every shared prefix is
+simulated once, checkpointed, and the branches resume from the checkpoint.
+Results are identical to running each config on its own.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from .models import Layer
+from .scenarios import ScenarioCheckpoint, _substrate_noise, checkpoint_scenario, run_scenario
+
+RunOutput = Tuple[Layer, Dict[str, Any]]
+
+# Config keys that only enter a run through its drive sequence.
+_DRIVE_KEYS = {
+    "anomaly_injection": ("horizon", "inject_step", "anomaly_level"),
+    "transfer_cycle": ("horizon", "substrates", "substrate_noise"),
+}
+_END = object()
+
+
+def _split(config: Dict[str, Any]) -> Tuple[str, List[Hashable]]:
+    """Return (static key, drive sequence) of a config; the sequence has one entry per step."""
+    scenario = config.get("scenario", "baseline_layer")
+    horizon = int(config.get("horizon", 50))
+    static = {key: value for key, value in config.items() if key not in _DRIVE_KEYS.get(scenario, ("horizon",))}
+    drive: List[Hashable]
+    if scenario == "anomaly_injection":
+        inject_step = max(0, min(horizon, int(config.get("inject_step", horizon // 3))))
+        level = float(config.get("anomaly_level", 0.8))
+        drive = [None] * inject_step + [level] * (horizon - inject_step)
+    elif scenario == "transfer_cycle":
+        substrates = config.get("substrates", ["S1", "S2"])
+        noise = _substrate_noise(config, len(substrates)).tolist()
+        drive = [(str(s), n_s) for s, n_s in zip(substrates, noise)]
+    else:
+        drive = [None] * horizon
+    return json.dumps(static, sort_keys=True, default=str), drive
+
+
+def _common_prefix(drives: Sequence[List[Hashable]], start: int) -> int:
+    end = min(len(d) for d in drives)
+    first = drives[0]
+    step = start
+    while step < end and all(d[step] == first[step] for d in drives[1:]):
+        step += 1
+    return step
+
+
+def run_sweep(configs: Sequence[Dict[str, Any]]) -> List[RunOutput]:
+    """
+    Run classical scenario configs, simulating each shared prefix once.
+    Returns one (layer, summary) per config, in order.
+    """
+    results: List[Optional[RunOutput]] = [None] * len(configs)
+    groups: Dict[str, List[int]] = {}
+    drives: List[List[Hashable]] = []
+    configs = list(configs)
+    for i, cfg in enumerate(configs):
+        if cfg.get("scenario") == "transfer_cycle" and cfg.get("substrate_noise") is not None:
+            # Materialize iterables once; every branch re-reads the noise.
+            configs[i] = cfg = {**cfg, "substrate_noise": _substrate_noise(cfg, len(cfg.get("substrates", ["S1", "S2"])))}
+        static, drive = _split(cfg)
+        groups.setdefault(static, []).append(i)
+        drives.append(drive)
+    for members in groups.values():
+        _run_node(configs, drives, members, None, 0, results)
+    return results  # type: ignore[return-value]
+
+
+def _run_node(
+    configs: Sequence[Dict[str, Any]],
+    drives: List[List[Hashable]],
+    members: List[int],
+    resume: Optional[ScenarioCheckpoint],
+    start: int,
+    results: List[Optional[RunOutput]],
+) -> None:
+    if len(members) == 1:
+        results[members[0]] = run_scenario(configs[members[0]], resume=resume)
+        return
+    step = _common_prefix([drives[i] for i in members], start)
+    if step > start or resume is None:
+        resume = checkpoint_scenario(configs[members[0]], step, resume=resume)
+    branches: Dict[Any, List[int]] = {}
+    for i in members:
+        branches.setdefault(drives[i][step] if step < len(drives[i]) else _END, []).append(i)
+    for key, branch in branches.items():
+        if key is _END:
+            for i in branch:
+                results[i] = run_scenario(configs[i], resume=resume)
+        else:
+            _run_node(configs, drives, branch, resume, step, results)
@@ -153,6 +153,7 @@ def run_quantum_transfer_chain(config: Dict, backend: QuantumBackend) -> Tuple[D
 
     fidelity_arr = []
     ent_arr = []
+    cut_arr = []
     t_arr = []
     # initial state |1 0 0 ...>
     qc = QuantumCircuit(n_qubits)
@@ -169,15 +170,19 @@ def run_quantum_transfer_chain(config: Dict, backend: QuantumBackend) -> Tuple[D
         qres = backend.run_circuit(qc_step, shots=shots, seed=seed + step)
         current_sv = qres.statevector
         fidelity = float(np.abs(np.vdot(initial_sv, current_sv)) ** 2)
-        ent = core_metrics.entanglement_entropy(current_sv, [0])
+        analysis = core_metrics.StateAnalysis(current_sv)
+        ent = analysis.entropy([0])
         fidelity_arr.append(fidelity)
         ent_arr.append(ent)
+        cut_arr.append(analysis.cut_entropies())
         t_arr.append(step)
 
     timeseries = {
         "t": np.array(t_arr, dtype=float),
         "fidelity": np.array(fidelity_arr, dtype=float),
         "entanglement": np.array(ent_arr, dtype=float),
+        # (steps, n_qubits - 1): entropy of each contiguous cut 0..k-1 | k..n-1.
+        "cut_entropy": np.array(cut_arr, dtype=float).reshape(len(cut_arr), max(n_qubits - 1, 0)),
     }
     summary = {
         "backend": backend.name,
@@ -186,6 +191,7 @@ def run_quantum_transfer_chain(config: Dict, backend: QuantumBackend) -> Tuple[D
         "fidelity_final": float(fidelity_arr[-1]) if fidelity_arr else 0.0,
         "fidelity_min": float(np.min(fidelity_arr)) if fidelity_arr else 0.0,
         "entanglement_mean": float(np.mean(ent_arr)) if ent_arr else 0.0,
+        "cut_entropy_max": float(np.max(cut_arr)) if cut_arr and n_qubits > 1 else 0.0,
     }
     return summary, timeseries
 
@@ -17,8 +17,16 @@ from typing import Dict, Any, Protocol, Optional, List, Tuple
 
 import numpy as np
 
-from code.qmpt_core import scenarios as classical_scenarios, io as core_io, metrics as core_metrics
-from code.qmpt_core.expressions import evaluate_derived
+from code.qmpt_core import (
+    scenarios as classical_scenarios,
+    sweeps as classical_sweeps,
+    hierarchy as classical_hierarchy,
+    calibration as core_calibration,
+    datasets as core_datasets,
+    io as core_io,
+    metrics as core_metrics,
+)
+from code.qmpt_core.models import Layer
 from .quantum import scenarios as quantum_scenarios
 from .quantum.backends import LocalSimulatorBackend, DummyQuantumBackend, QuantumBackend
 from .quantum.encodings import layer_to_circuit
@@ -45,31 +53,91 @@ class RunResult:
 
 
 class Backend(Protocol):
-    def run(self, run_id: str, cfg: Dict[str, Any], log_path: Path, result_dir: Path) -> RunResult:
+    def run(self, run_id: str, cfg: Dict[str, Any], log_path: Path, result_dir: Path, store: Optional[core_datasets.DatasetWriter] = None) -> RunResult:
         ...
 
 
+def _write_run(
+    store: Optional[core_datasets.DatasetWriter],
+    run_id: str,
+    result_dir: Path,
+    summary: Dict[str, Any],
+    timeseries: Dict[str, Any],
+    cfg: Dict[str, Any],
+    extra: Optional[Dict[str, Any]] = None,
+    patterns=None,
+) -> Tuple[Dict[str, Any], Path]:
+    """Persist a run into the dataset store when given, else into its result directory; returns (metrics, results path)."""
+    if store is not None:
+        return store.append(run_id, summary, timeseries, cfg, extra, patterns), store.run_path(run_id)
+    return core_io.write_run_results(result_dir, summary, timeseries, cfg, extra, patterns), result_dir
+
+
 class ClassicalBackend:
-    def run(self, run_id: str, cfg: Dict[str, Any], log_path: Path, result_dir: Path) -> RunResult:
+    def run(self, run_id: str, cfg: Dict[str, Any], log_path: Path, result_dir: Path, store: Optional[core_datasets.DatasetWriter] = None) -> RunResult:
+        self.write_log(run_id, cfg, log_path)
+        if cfg.get("scenario") == "coupled_layers":
+            return self._run_hierarchy(run_id, cfg, log_path, result_dir, store)
+        stream_cfg = cfg.get("streaming") or {}
+        if stream_cfg.get("enabled"):
+            # Streamed runs are long single runs and keep their own series/ directory.
+            return self._run_streaming(run_id, cfg, log_path, result_dir, int(stream_cfg.get("chunk_size", 65536)))
+        layer, summary = classical_scenarios.run_scenario(cfg)
+        return self.record(run_id, cfg, layer, summary, log_path, result_dir, store)
+
+    def _run_hierarchy(
+        self, run_id: str, cfg: Dict[str, Any], log_path: Path, result_dir: Path, store: Optional[core_datasets.DatasetWriter] = None
+    ) -> RunResult:
+        """K coupled layers in one run; timeseries.npz holds (T + 1, K) series per key."""
+        result = classical_hierarchy.run_hierarchy(cfg)
+        metrics, results_path = _write_run(store, run_id, result_dir, result.summary, result.timeseries(), cfg, extra={"backend": "classical"})
+        return RunResult(
+            run_id=run_id,
+            status="ok",
+            metrics=metrics,
+            log_path=log_path,
+            results_path=results_path,
+            backend=BackendType.CLASSICAL,
+        )
+
+    def _run_streaming(self, run_id: str, cfg: Dict[str, Any], log_path: Path, result_dir: Path, chunk_size: int) -> RunResult:
+        """Long horizons: chunks go straight to result_dir/series/*.npy, metrics are folded online."""
+        stream = classical_scenarios.ScenarioStream(cfg, chunk_size=chunk_size)
+        metrics = core_io.save_run_stream(run_id, stream, result_dir, cfg, extra={"backend": "classical"})
+        return RunResult(
+            run_id=run_id,
+            status="ok",
+            metrics=metrics,
+            log_path=log_path,
+            results_path=result_dir,
+            backend=BackendType.CLASSICAL,
+        )
+
+    def write_log(self, run_id: str, cfg: Dict[str, Any], log_path: Path) -> None:
         with log_path.open("w", encoding="utf-8") as logf:
             logf.write(f"run_id={run_id}\nbackend=classical\n")
             logf.write(f"config={json.dumps(cfg)}\n")
 
-        layer, summary = classical_scenarios.run_scenario(cfg)
+    def record(
+        self,
+        run_id: str,
+        cfg: Dict[str, Any],
+        layer,
+        summary: Dict[str, Any],
+        log_path: Path,
+        result_dir: Path,
+        store: Optional[core_datasets.DatasetWriter] = None,
+    ) -> RunResult:
+        """Persist an already simulated layer (e.g. one row of a batched run)."""
         summary["backend"] = "classical"
-        core_io.save_run_results(run_id, layer, summary, result_dir, cfg)
-        metrics = json.loads((result_dir / "metrics.json").read_text(encoding="utf-8"))
-        derived_cfg = cfg.get("derived_metrics") or {}
-        derived = evaluate_derived(metrics, derived_cfg) if derived_cfg else {}
-        if derived:
-            metrics["derived"] = derived
-            (result_dir / "metrics.json").write_text(json.dumps(metrics, indent=2), encoding="utf-8")
+        timeseries = core_io.layer_timeseries(layer, summary)
+        metrics, results_path = _write_run(store, run_id, result_dir, summary, timeseries, cfg, patterns=layer.patterns)
         return RunResult(
             run_id=run_id,
             status="ok",
             metrics=metrics,
             log_path=log_path,
-            results_path=result_dir,
+            results_path=results_path,
             backend=BackendType.CLASSICAL,
         )
 
@@ -82,32 +150,20 @@ class QuantumBackendWrapper:
         if not getattr(self.engine, "is_available", True):
             self.engine = DummyQuantumBackend()
 
-    def run(self, run_id: str, cfg: Dict[str, Any], log_path: Path, result_dir: Path) -> RunResult:
+    def run(self, run_id: str, cfg: Dict[str, Any], log_path: Path, result_dir: Path, store: Optional[core_datasets.DatasetWriter] = None) -> RunResult:
         summary, timeseries = quantum_scenarios.run_quantum_scenario(cfg, self.engine, log_path, result_dir)
         summary["backend"] = "quantum_local" if self.engine.is_available else "quantum_dummy"
-        self._write_results(result_dir, timeseries, summary, cfg)
-        metrics = json.loads((result_dir / "metrics.json").read_text(encoding="utf-8"))
+        metrics, results_path = _write_run(store, run_id, result_dir, summary, timeseries, cfg)
         status = summary.get("status", "ok" if self.engine.is_available else "unavailable")
         return RunResult(
             run_id=run_id,
             status=status,
             metrics=metrics,
             log_path=log_path,
-            results_path=result_dir,
+            results_path=results_path,
             backend=BackendType.QUANTUM,
         )
 
-    def _write_results(self, result_dir: Path, timeseries: Dict[str, Any], summary: Dict[str, Any], cfg: Dict[str, Any]) -> None:
-        result_dir.mkdir(parents=True, exist_ok=True)
-        np.savez(result_dir / "timeseries.npz", **timeseries)
-        derived = core_metrics.compute_run_metrics(timeseries, cfg)
-        merged = {**summary, **derived}
-        exprs = cfg.get("derived_metrics") or {}
-        derived_expr = evaluate_derived(merged, exprs) if exprs else {}
-        if derived_expr:
-            merged["derived"] = derived_expr
-        (result_dir / "metrics.json").write_text(json.dumps(merged, indent=2), encoding="utf-8")
-
 
 class HybridBackend:
     """
@@ -120,7 +176,7 @@ class HybridBackend:
         if not getattr(self.q_backend, "is_available", True):
             self.q_backend = DummyQuantumBackend()
 
-    def run(self, run_id: str, cfg: Dict[str, Any], log_path: Path, result_dir: Path) -> RunResult:
+    def run(self, run_id: str, cfg: Dict[str, Any], log_path: Path, result_dir: Path, store: Optional[core_datasets.DatasetWriter] = None) -> RunResult:
         with log_path.open("w", encoding="utf-8") as logf:
             logf.write("Hybrid backend\n")
             logf.write(f"run_id={run_id}\n")
@@ -190,22 +246,14 @@ class HybridBackend:
             "horizon": horizon,
             "probe_interval": probe_every,
         }
-        result_dir.mkdir(parents=True, exist_ok=True)
-        np.savez(result_dir / "timeseries.npz", **timeseries)
-        derived = core_metrics.compute_run_metrics(timeseries, cfg)
-        summary.update(derived)
-        exprs = cfg.get("derived_metrics") or {}
-        d = evaluate_derived(summary, exprs) if exprs else {}
-        if d:
-            summary["derived"] = d
-        (result_dir / "metrics.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+        metrics, results_path = _write_run(store, run_id, result_dir, summary, timeseries, cfg)
         status = "ok" if getattr(self.q_backend, "is_available", True) else "degraded"
         return RunResult(
             run_id=run_id,
             status=status,
-            metrics=summary,
+            metrics=metrics,
             log_path=log_path,
-            results_path=result_dir,
+            results_path=results_path,
             backend=BackendType.HYBRID,
         )
 
@@ -228,7 +276,66 @@ class SimulationRunner:
         cfg = self._load_experiment_config(config_path)
         return self.run_config(cfg, backend, config_path=config_path)
 
-    def run_config(self, cfg: Dict[str, Any], backend: BackendType, config_path: Optional[Path] = None, dataset_id: Optional[str] = None) -> RunResult:
+    def run_config(
+        self,
+        cfg: Dict[str, Any],
+        backend: BackendType,
+        config_path: Optional[Path] = None,
+        dataset_id: Optional[str] = None,
+        store: Optional[core_datasets.DatasetWriter] = None,
+    ) -> RunResult:
+        cfg, run_id, log_path, result_dir = self._prepare_run(cfg, backend, config_path)
+        backend_impl = self.backends.get(backend, HybridBackend())
+        result = backend_impl.run(run_id, cfg, log_path, result_dir, store)
+        return self._finish_run(result, cfg, dataset_id)
+
+    def run_batched(
+        self,
+        run_cfgs: List[Dict[str, Any]],
+        config_path: Optional[Path] = None,
+        dataset_id: Optional[str] = None,
+        store: Optional[core_datasets.DatasetWriter] = None,
+    ) -> List[RunResult]:
+        """
+        Run classical configs that differ only by seed through the batched engine,
+        then persist each seed as a regular run.
+        """
+        seeds = [int(rcfg.get("seed", 42)) for rcfg in run_cfgs]
+        batch = classical_scenarios.run_scenario_batch(run_cfgs[0], seeds)
+        return self._record_classical(run_cfgs, [batch.run(i) for i in range(len(run_cfgs))], config_path, dataset_id, store)
+
+    def run_shared_prefix(
+        self,
+        run_cfgs: List[Dict[str, Any]],
+        config_path: Optional[Path] = None,
+        dataset_id: Optional[str] = None,
+        store: Optional[core_datasets.DatasetWriter] = None,
+    ) -> List[RunResult]:
+        """
+        Run a classical sweep, simulating prefixes shared between configs once
+        (see qmpt_core.sweeps), then persist each config as a regular run.
+        """
+        outputs = classical_sweeps.run_sweep(run_cfgs)
+        return self._record_classical(run_cfgs, outputs, config_path, dataset_id, store)
+
+    def _record_classical(
+        self,
+        run_cfgs: List[Dict[str, Any]],
+        outputs: List[Tuple[Layer, Dict[str, Any]]],
+        config_path: Optional[Path],
+        dataset_id: Optional[str],
+        store: Optional[core_datasets.DatasetWriter] = None,
+    ) -> List[RunResult]:
+        classical: ClassicalBackend = self.backends[BackendType.CLASSICAL]  # type: ignore[assignment]
+        results: List[RunResult] = []
+        for rcfg, (layer, summary) in zip(run_cfgs, outputs):
+            cfg, run_id, log_path, result_dir = self._prepare_run(rcfg, BackendType.CLASSICAL, config_path)
+            classical.write_log(run_id, cfg, log_path)
+            result = classical.record(run_id, cfg, layer, summary, log_path, result_dir, store)
+            results.append(self._finish_run(result, cfg, dataset_id))
+        return results
+
+    def _prepare_run(self, cfg: Dict[str, Any], backend: BackendType, config_path: Optional[Path]) -> Tuple[Dict[str, Any], str, Path, Path]:
         cfg = copy.deepcopy(cfg)
         cfg.setdefault("scenario", "baseline_layer" if backend == BackendType.CLASSICAL else "layer_stress_probe")
         cfg.setdefault("backend", backend.value)
@@ -239,11 +346,11 @@ class SimulationRunner:
         logs_dir.mkdir(parents=True, exist_ok=True)
         results_root.mkdir(parents=True, exist_ok=True)
         log_path = logs_dir / f"{run_id}.log"
+        # Created by the writer, so runs kept in a dataset store leave no empty directory.
         result_dir = results_root / run_id
-        result_dir.mkdir(parents=True, exist_ok=True)
+        return cfg, run_id, log_path, result_dir
 
-        backend_impl = self.backends.get(backend, HybridBackend())
-        result = backend_impl.run(run_id, cfg, log_path, result_dir)
+    def _finish_run(self, result: RunResult, cfg: Dict[str, Any], dataset_id: Optional[str]) -> RunResult:
         result.git_commit = self._safe_git_commit()
         result.config_hash = self._config_hash(cfg)
         result.dataset_id = dataset_id
@@ -267,22 +374,67 @@ class SimulationRunner:
         base_config_rel = str(config_path.relative_to(base)) if config_path else "inline"
 
         run_cfgs = self._expand_ensemble(cfg)
+        # "columnar" (default): runs go to one shared store under lab/datasets/<id>/;
+        # "directories": one lab/results/<run_id>/ directory per run.
+        store_mode = ensemble_cfg.get("store", "columnar")
+        if store_mode not in ("columnar", "directories"):
+            raise ValueError(f"Unknown ensemble store {store_mode}")
+        store = core_datasets.DatasetWriter(datasets_root) if store_mode == "columnar" else None
+        try:
+            results = self._run_ensemble_members(cfg, run_cfgs, backend, config_path, dataset_id, store)
+        finally:
+            if store is not None:
+                store.close()
+
+        self._write_dataset_manifest(datasets_root, dataset_id, base_config_rel, cfg, results)
+        return dataset_id, results
+
+    def _run_ensemble_members(
+        self,
+        cfg: Dict[str, Any],
+        run_cfgs: List[Dict[str, Any]],
+        backend: BackendType,
+        config_path: Optional[Path],
+        dataset_id: str,
+        store: Optional[core_datasets.DatasetWriter],
+    ) -> List[RunResult]:
+        ensemble_cfg = cfg.get("ensemble", {})
         executor_type = cfg.get("executor", {}).get("type", "local_sequential")
         max_workers = int(cfg.get("executor", {}).get("max_workers", 4))
         results: List[RunResult] = []
-        if executor_type == "local_parallel" and len(run_cfgs) > 1:
+        # The batched and shared-prefix engines simulate single layers; coupled_layers runs go through run_config.
+        single_layer = all(rcfg.get("scenario") != "coupled_layers" for rcfg in run_cfgs)
+        if (
+            executor_type == "local_batched"
+            and backend == BackendType.CLASSICAL
+            and ensemble_cfg.get("mode", "repeat") == "repeat"
+            and single_layer
+        ):
+            results = self.run_batched(run_cfgs, config_path, dataset_id, store)
+        elif (
+            backend == BackendType.CLASSICAL
+            and ensemble_cfg.get("mode") == "sweep"
+            and ensemble_cfg.get("share_prefix", True)
+            and executor_type != "local_parallel"
+            and not (cfg.get("streaming") or {}).get("enabled")
+            and single_layer
+            and all(rcfg.get("backend", backend.value) == BackendType.CLASSICAL.value for rcfg in run_cfgs)
+        ):
+            results = self.run_shared_prefix(run_cfgs, config_path, dataset_id, store)
+        elif executor_type == "local_parallel" and len(run_cfgs) > 1:
             from concurrent.futures import ThreadPoolExecutor
 
             with ThreadPoolExecutor(max_workers=max_workers) as pool:
-                futures = [pool.submit(self.run_config, rcfg, BackendType(rcfg.get("backend", backend.value)), config_path, dataset_id) for rcfg in run_cfgs]
+                futures = [
+                    pool.submit(self.run_config, rcfg, BackendType(rcfg.get("backend", backend.value)), config_path, dataset_id, store)
+                    for rcfg in run_cfgs
+                ]
                 for fut in futures:
                     results.append(fut.result())
         else:
             for rcfg in run_cfgs:
-                results.append(self.run_config(rcfg, BackendType(rcfg.get("backend", backend.value)), config_path, dataset_id))
-
-        self._write_dataset_manifest(datasets_root, dataset_id, base_config_rel, cfg, results)
-        return dataset_id, results
+                results.append(self.run_config(rcfg, BackendType(rcfg.get("backend", backend.value)), config_path, dataset_id, store))
+        return results
 
     # ---- Helpers ----
     def _write_dataset_manifest(self, ds_root: Path, dataset_id: str, base_config: str, base_cfg: Dict[str, Any], results: List[RunResult]) -> None:
@@ -294,6 +446,9 @@ class SimulationRunner:
             "config_template": base_config,
             "runs": [],
         }
+        store = core_datasets.DatasetStore(ds_root) if core_datasets.DatasetStore.exists(ds_root) else None
+        if store is not None:
+            manifest["store"] = {"layout": "columnar", "runs": len(store), "keys": store.keys, "metrics": store.metric_names}
         metrics_list = []
         for r in results:
             entry = {
@@ -302,19 +457,32 @@ class SimulationRunner:
                 "scenario": base_cfg.get("scenario"),
                 "seed": r.metrics.get("seed", base_cfg.get("seed")),
                 "params": {},
-                "metrics_path": str(r.results_path / "metrics.json"),
-                "timeseries_path": str(r.results_path / "timeseries.npz"),
+                "results_path": str(r.results_path),
             }
+            if store is not None and r.run_id in store:
+                entry["store_index"] = store.index(r.run_id)
+            else:
+                entry["metrics_path"] = str(r.results_path / "metrics.json")
+                # Streamed runs keep their series as series/<key>.npy instead of timeseries.npz.
+                series_dir = r.results_path / "series"
+                entry["timeseries_path"] = str(series_dir if series_dir.is_dir() else r.results_path / "timeseries.npz")
             manifest["runs"].append(entry)
             metrics_list.append(r.metrics)
         ds_root.mkdir(parents=True, exist_ok=True)
-        (ds_root / "dataset_manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
-        ensemble_metrics = core_metrics.compute_ensemble_summary(metrics_list)
+        core_io.write_json(ds_root / "dataset_manifest.json", manifest)
+        ensemble_metrics = core_metrics.compute_ensemble_summary(metrics_list, base_cfg.get("ensemble", {}).get("bootstrap"))
+        # ROC / best-threshold calibration over the stored series of all runs.
+        keys = core_calibration.PRED_KEYS + core_calibration.TRUTH_KEYS
+        stored = [
+            store.series(r.run_id, keys) if store is not None and r.run_id in store else core_io.load_run_series(r.results_path, keys)
+            for r in results
+        ]
+        ensemble_metrics.update(core_calibration.calibrate_runs(stored, base_cfg))
         ensemble_metrics["metrics_schema_version"] = core_metrics.METRICS_SCHEMA_VERSION
-        (ds_root / "ensemble_metrics.json").write_text(json.dumps(ensemble_metrics, indent=2), encoding="utf-8")
+        core_io.write_json(ds_root / "ensemble_metrics.json", ensemble_metrics)
         ens_dir = ds_root / "ensembles" / dataset_id
         ens_dir.mkdir(parents=True, exist_ok=True)
-        (ens_dir / "metrics.json").write_text(json.dumps(ensemble_metrics, indent=2), encoding="utf-8")
+        core_io.write_json(ens_dir / "metrics.json", ensemble_metrics)
 
     def _expand_ensemble(self, cfg: Dict[str, Any]) -> List[Dict[str, Any]]:
         ens = cfg.get("ensemble", {})
@@ -6,11 +6,13 @@ from __future__ import annotations
 
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional, List
+from typing import TYPE_CHECKING, Optional, List
 
 from .core_config import IDEConfig
 from .core_runs import RunRegistry, RunRecord
-from .sim_runner import SimulationRunner
+
+if TYPE_CHECKING:  # sim_runner imports repo_root from here
+    from .sim_runner import SimulationRunner
 
 
 def repo_root() -> Path:
@@ -21,6 +21,8 @@ except Exception:
 
 import numpy as np
 
+from code.qmpt_core.datasets import load_run
+
 from .state import AppState
 
 
@@ -43,12 +45,15 @@ class PlotPanel(ttk.Frame):
         if plt is None or not self.state.config.matplotlib_enabled:
             self._write("Plotting disabled (matplotlib not available).")
             return
-        npz_path = result_dir / "timeseries.npz"
-        if not npz_path.exists():
+        try:
+            run = load_run(result_dir)
+            data = run.series()
+        except Exception:
+            data = {}
+        if not data:
             self._write("No timeseries available to plot.")
             return
-        data = np.load(npz_path)
-        series_keys = [k for k in data.files if k != "t"]
+        series_keys = [k for k in data if k != "t"]
         if not series_keys:
             backend = getattr(self.state.current_run, "backend", "")
             if backend == "quantum":
@@ -74,6 +79,12 @@ class PlotPanel(ttk.Frame):
             ax = [ax]
         for idx, key in enumerate(selected):
             y = data[key]
+            if y.ndim == 2:
+                # Per-layer series of a coupled run: layer mean with the min/max band.
+                x = t if t is not None and len(t) == len(y) else np.arange(len(y))
+                ax[idx].fill_between(x, y.min(axis=1), y.max(axis=1), alpha=0.2)
+                y = y.mean(axis=1)
+                key = f"{key} (mean of {data[key].shape[1]} layers)"
             if t is not None and len(t) == len(y):
                 ax[idx].plot(t, y, label=key)
                 ax[idx].set_xlabel("t")
@@ -82,7 +93,12 @@ class PlotPanel(ttk.Frame):
             ax[idx].set_ylabel(key)
             ax[idx].legend()
         fig.tight_layout()
-        img_path = result_dir / "plot.png"
+        if run.store_root is not None:
+            # Runs in a dataset store have no directory of their own.
+            img_path = run.store_root / "plots" / f"{run.run_id}.png"
+            img_path.parent.mkdir(parents=True, exist_ok=True)
+        else:
+            img_path = result_dir / "plot.png"
         fig.savefig(img_path)
         plt.close(fig)
         note = f"Plot saved to {img_path}"
@@ -90,7 +106,8 @@ class PlotPanel(ttk.Frame):
         ds_note = ""
         ds_id = getattr(self.state.current_run, "dataset_id", None)
         if ds_id:
-            ds_metrics = result_dir.parents[2] / "datasets" / ds_id / "ensemble_metrics.json"
+            ds_root = run.store_root or result_dir.parents[1] / "datasets" / ds_id
+            ds_metrics = ds_root / "ensemble_metrics.json"
             if ds_metrics.exists():
                 try:
                     import json
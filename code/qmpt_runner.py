@@ -21,7 +21,7 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--ensemble-enabled", action="store_true", help="Force ensemble mode")
     p.add_argument("--n-runs", type=int, help="Ensemble repeat count override")
     p.add_argument("--dataset-description", type=str, default="", help="Dataset description")
-    p.add_argument("--executor", choices=["local_sequential", "local_parallel"], help="Executor override")
+    p.add_argument("--executor", choices=["local_sequential", "local_parallel", "local_batched"], help="Executor override")
     p.add_argument("--examples", choices=["quantum"], help="List available example configs")
     p.add_argument("--name", help="Run specific example by basename (without .json)")
     return p.parse_args()
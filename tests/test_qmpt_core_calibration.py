@@ -0,0 +1,40 @@
+import json
+
+import numpy as np
+
+from code.qmpt_core.calibration import calibrate_runs, calibration_curve
+from code.qmpt_core.io import load_run_series, save_run_results
+from code.qmpt_core.scenarios import run_scenario
+
+
+def test_curve_matches_per_threshold_counts() -> None:
+    rng = np.random.default_rng(2)
+    offsets = np.array([0, 20, 20, 45, 46])
+    pred = np.round(rng.uniform(size=offsets[-1]), 1)
+    truth = (rng.uniform(size=offsets[-1]) > 0.6).astype(float)
+    curve = calibration_curve(pred, truth, offsets, dt=0.5)
+    assert np.all(np.diff(curve.thresholds) < 0)
+    for g, threshold in enumerate(curve.thresholds):
+        flagged, positive = pred >= threshold, truth >= 0.5
+        assert curve.tp[g] == np.sum(flagged & positive) and curve.fp[g] == np.sum(flagged & ~positive)
+        hits = [np.flatnonzero(flagged[a:b] & positive[a:b]) for a, b in zip(offsets[:-1], offsets[1:])]
+        latencies = [0.5 * h[0] for h in hits if len(h)]
+        assert curve.detected[g] == len(latencies)
+        assert np.isclose(curve.latency[g], np.mean(latencies)) if latencies else np.isnan(curve.latency[g])
+    pos, neg = pred[truth >= 0.5], pred[truth < 0.5]
+    ranks = (pos[:, None] > neg[None, :]) + 0.5 * (pos[:, None] == neg[None, :])
+    assert np.isclose(curve.auc(), ranks.mean())
+
+
+def test_run_calibration_from_stored_series(tmp_path) -> None:
+    cfg = {"scenario": "anomaly_injection", "horizon": 60, "seed": 3, "anomaly_threshold": 0.5}
+    layer, summary = run_scenario(cfg)
+    save_run_results("r", layer, dict(summary), tmp_path, cfg)
+    metrics = json.loads((tmp_path / "metrics.json").read_text(encoding="utf-8"))
+    stored = load_run_series(tmp_path, ["anomaly_proxy", "anomaly_ground_truth", "missing"])
+    assert set(stored) == {"anomaly_proxy", "anomaly_ground_truth"}
+    assert metrics["calib_auc"] == calibrate_runs([stored], cfg)["calib_auc"]
+
+    curve = calibration_curve(stored["anomaly_proxy"], stored["anomaly_ground_truth"])
+    at_threshold = np.flatnonzero(curve.thresholds >= 0.5)[-1]
+    assert int(curve.latency[at_threshold]) == summary["detection_latency"]
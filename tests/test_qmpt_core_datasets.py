@@ -0,0 +1,74 @@
+import json
+
+import numpy as np
+
+from code.qmpt_core.datasets import DatasetStore, DatasetWriter, load_run
+from code.qmpt_core.hierarchy import run_hierarchy
+from code.qmpt_core.io import layer_timeseries, save_run_results
+from code.qmpt_core.scenarios import run_scenario
+
+
+def test_dataset_store_roundtrip(tmp_path) -> None:
+    cfgs = [{"scenario": "anomaly_injection", "horizon": 30, "seed": s} for s in (1, 2)]
+    cfgs.append({"scenario": "baseline_layer", "horizon": 12, "seed": 3, "derived_metrics": {"s_mean": "mean(stress)"}})
+    expected = []
+    with DatasetWriter(tmp_path / "ds") as writer:
+        for i, cfg in enumerate(cfgs):
+            layer, summary = run_scenario(cfg)
+            timeseries = layer_timeseries(layer, summary)
+            metrics = writer.append(f"run{i}", summary, timeseries, cfg, patterns=layer.patterns)
+            expected.append((timeseries, metrics, len(layer.patterns)))
+
+    store = DatasetStore(tmp_path / "ds")
+    assert store.run_ids == ["run0", "run1", "run2"] and "anomaly_proxy" in store.keys
+    assert sorted(p.name for p in (tmp_path / "ds").iterdir()) == [
+        "columns", "metrics.npy", "offsets.npy", "records.jsonl", "records.npy", "store.json"
+    ]
+    for i, (timeseries, metrics, n_patterns) in enumerate(expected):
+        series = store.series(f"run{i}")
+        assert set(series) == {k for k, v in timeseries.items() if np.asarray(v).dtype.kind in "biuf"}
+        assert all(np.array_equal(series[k], timeseries[k]) for k in series)
+        assert isinstance(series["stress"], np.memmap)
+        assert store.metrics(i) == json.loads(json.dumps(metrics)) and len(store.patterns(i)) == n_patterns
+    # The baseline run has no anomaly series: an empty range in the shared column.
+    offsets = store.offsets("anomaly_proxy")
+    assert offsets[3] == offsets[2] == len(store.column("anomaly_proxy")) and "anomaly_proxy" not in store.series(2)
+    table = store.metrics_table()
+    assert table.shape == (3, len(store.metric_names))
+    assert np.isnan(table[:2, store.metric_names.index("calib_auc")]).sum() == 0 and np.isnan(table[2, store.metric_names.index("calib_auc")])
+
+    run = load_run(store.run_path("run2"))
+    assert run.store_root == store.root and run.metrics["derived"]["s_mean"] == expected[2][1]["derived"]["s_mean"]
+    assert list(run.series(["stress"])) == ["stress"]
+
+
+def test_dataset_store_layer_rows_and_directory_runs(tmp_path) -> None:
+    result = run_hierarchy({"scenario": "coupled_layers", "horizon": 10, "seed": 1, "n_layers": 3})
+    with DatasetWriter(tmp_path / "ds") as writer:
+        writer.append("h0", result.summary, result.timeseries())
+        writer.append("h1", result.summary, result.timeseries())
+    stress = DatasetStore(tmp_path / "ds").series("h1", ["stress"])["stress"]
+    assert stress.shape == result.stress.shape and np.array_equal(stress, result.stress)
+
+    layer, summary = run_scenario({"scenario": "baseline_layer", "horizon": 8, "seed": 2})
+    metrics = save_run_results("d", layer, summary, tmp_path / "d")
+    run = load_run(tmp_path / "d")
+    assert run.store_root is None and run.metrics == metrics and len(run.series()["stress"]) == 9
+
+
+def test_dataset_store_keeps_heterogeneous_runs(tmp_path) -> None:
+    # A sweep over n_layers changes the row shape of the per-layer series; dtypes may change too.
+    results = [run_hierarchy({"scenario": "coupled_layers", "horizon": 10, "seed": 1, "n_layers": k}) for k in (3, 4, 3)]
+    counts = [np.arange(5), np.arange(5) / 2, np.arange(3)]
+    with DatasetWriter(tmp_path / "ds") as writer:
+        for i, (result, count) in enumerate(zip(results, counts)):
+            writer.append(f"h{i}", result.summary, dict(result.timeseries(), count=count))
+    store = DatasetStore(tmp_path / "ds")
+    for i, (result, count) in enumerate(zip(results, counts)):
+        series = store.series(f"h{i}", ["stress", "count"])
+        assert series["stress"].shape == result.stress.shape and np.array_equal(series["stress"], result.stress)
+        assert series["count"].dtype == count.dtype and np.array_equal(series["count"], count)
+        assert isinstance(series["stress"], np.memmap)
+    # Runs that fit the shared column stay in it; the others have empty ranges there.
+    assert store.column("stress").shape == (22, 3) and list(np.diff(store.offsets("stress"))) == [11, 0, 11]
+    assert (tmp_path / "ds" / "columns" / "stress" / "1.npy").exists()
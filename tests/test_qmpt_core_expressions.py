@@ -0,0 +1,117 @@
+import numpy as np
+
+from code.qmpt_core.expressions import (
+    compile_derived,
+    compile_expression,
+    derived_fields,
+    evaluate_derived,
+    evaluate_derived_batch,
+    metrics_columns,
+)
+
+
+def test_compiled_expressions_are_cached_and_validated() -> None:
+    compiled = compile_expression("max(max_sigma, 0.5) - sigma_mean / 2")
+    assert compile_expression("max(max_sigma, 0.5) - sigma_mean / 2") is compiled
+    assert compiled.names == {"max_sigma", "sigma_mean"}
+    assert compiled({"max_sigma": 0.9, "sigma_mean": 0.4}) == 0.9 - 0.2
+
+    errors: dict = {}
+    derived = evaluate_derived(
+        {"a": 2, "b": 0},
+        {"ok": "abs(-a) ** 2 % 3", "zero": "a / b", "unknown": "c + 1", "attr": "a.real", "text": "'x'"},
+        errors,
+    )
+    assert derived == {"ok": 1}
+    assert errors["unknown"] == "Unknown variable c"
+    assert errors["zero"].startswith("ZeroDivisionError")
+    assert "Illegal expression element" in errors["attr"] and "Unsupported constant" in errors["text"]
+    assert derived_fields({"a": 1}, {"b": "a + 1", "c": "d"}) == {"derived": {"b": 2}, "derived_errors": {"c": "Unknown variable d"}}
+
+
+def test_batch_evaluation_matches_per_run() -> None:
+    runs = [{"max_sigma": 0.9, "sigma_mean": 0.3}, {"max_sigma": 0.4, "sigma_mean": 0.4}, {"max_sigma": 0.7}]
+    exprs = {"gap": "max_sigma - sigma_mean", "peak": "min(max_sigma, 0.8) * 2", "const": "1 + 1"}
+    batch = evaluate_derived_batch(metrics_columns(runs), exprs)
+    for i, run in enumerate(runs[:2]):
+        single = evaluate_derived(run, exprs)
+        assert all(np.isclose(batch[name][i], value) for name, value in single.items())
+    assert np.isnan(batch["gap"][2]) and np.isclose(batch["peak"][2], 1.4)
+    assert np.array_equal(batch["const"], [2.0, 2.0, 2.0])
+
+    # Series functions would reduce across runs; they are reported, not evaluated.
+    errors: dict = {}
+    exprs = {"a": "mean(m)", "b": "a + 1", "c": "where(m > 1, m, 0)"}
+    batch = evaluate_derived_batch({"m": np.array([1.0, 2.0, 3.0])}, exprs, errors)
+    assert list(batch) == ["c"] and np.array_equal(batch["c"], [0.0, 2.0, 3.0])
+    assert errors == {
+        "a": "Series function mean() is not supported over metric columns",
+        "b": "Depends on failed derived metric a",
+    }
+
+
+def test_derived_graph_order_cycles_and_shared_terms() -> None:
+    exprs = {
+        "ratio": "gap / max_sigma",
+        "gap": "max_sigma - sigma_mean",
+        "double_gap": "(max_sigma - sigma_mean) * 2",
+        "loop_a": "loop_b + 1",
+        "loop_b": "loop_a * 2",
+        "after_loop": "loop_a + gap",
+    }
+    program = compile_derived(exprs)
+    assert compile_derived(dict(exprs)) is program
+    assert program.order.index("gap") < program.order.index("ratio")
+    assert program.names == {"max_sigma", "sigma_mean"}
+    # gap, double_gap and ratio share the subtraction and the max_sigma load.
+    assert sum(1 for kind, _, _ in program.ops if kind == "load") == 2
+    assert program.outputs["gap"] in [args[0] for kind, _, args in program.ops if kind == "apply" and len(args) == 2]
+
+    errors: dict = {}
+    derived = evaluate_derived({"max_sigma": 0.8, "sigma_mean": 0.6}, exprs, errors)
+    assert list(derived) == ["ratio", "gap", "double_gap"]
+    assert np.isclose(derived["gap"], 0.2) and np.isclose(derived["ratio"], 0.25) and np.isclose(derived["double_gap"], 0.4)
+    assert evaluate_derived({"a": 2}, {"a": "a * 10", "b": "a + 1"}) == {"a": 20, "b": 21}
+    assert errors["loop_a"] == errors["loop_b"] == "Cycle in derived metrics: after_loop, loop_a, loop_b"
+
+    errors = {}
+    derived = evaluate_derived({"max_sigma": 0.0, "sigma_mean": 0.5}, {"gap": "max_sigma - sigma_mean", "ratio": "gap / max_sigma"}, errors)
+    assert derived == {"gap": -0.5} and errors["ratio"].startswith("ZeroDivisionError")
+
+    # Dependents of a formula that failed to parse report the failure, not a cycle.
+    program = compile_derived({"a": "1 +", "b": "a*2", "c": "b+m"})
+    assert program.order == [] and set(program.errors) == {"a", "b", "c"}
+    assert program.errors["b"] == "Depends on failed derived metric a"
+    assert program.errors["c"] == "Depends on failed derived metric b"
+
+
+def test_series_functions_load_only_referenced_series() -> None:
+    sigma = np.array([0.2, 0.5, 0.9, 0.4, 0.7])
+    stored = {"sigma": sigma, "anomaly_proxy": np.array([0.0, 0.1, 0.8, 0.2, 0.9]), "unused": np.zeros(5)}
+    requested = []
+
+    def loader(keys):
+        requested.append(list(keys))
+        return {k: stored[k] for k in keys if k in stored}
+
+    exprs = {
+        "sigma_p90": "quantile(sigma, 0.9)",
+        "peak_step": "argmax(sigma)",
+        "smooth_peak": "peak(rolling_mean(sigma, 2))",
+        "flagged_mean": "mean(masked(sigma, (anomaly_proxy > 0.5) & (sigma > 0.6)))",
+        "scaled": "cumsum(sigma) / horizon",
+        "clipped": "sum(where(sigma > 0.5, 0.5, sigma))",
+    }
+    errors: dict = {}
+    fields = derived_fields({"horizon": 2, "sigma": 1.0}, exprs, loader)
+    derived = evaluate_derived({"horizon": 2}, exprs, errors, loader)
+    assert requested[-1] == ["anomaly_proxy", "sigma"] and not errors
+    assert np.isclose(derived["sigma_p90"], np.quantile(sigma, 0.9)) and derived["peak_step"] == 2
+    assert np.isclose(derived["smooth_peak"], 0.7) and np.isclose(derived["flagged_mean"], 0.8)
+    assert np.allclose(derived["scaled"], np.cumsum(sigma) / 2) and np.isclose(derived["clipped"], 2.1)
+    # A scalar metric shadows the series of the same name, so only anomaly_proxy is loaded.
+    assert requested[0] == ["anomaly_proxy"] and fields["derived_errors"]["sigma_p90"] == "expected a series, got a scalar"
+
+    errors = {}
+    evaluate_derived({}, {"w": "rolling_max(sigma, 9)", "c": "0 < sigma < 1", "q": "quantile(sigma)"}, errors, stored)
+    assert "window 9" in errors["w"] and "Chained" in errors["c"] and "at least 2" in errors["q"]
@@ -0,0 +1,24 @@
+import numpy as np
+
+from code.qmpt_core.hierarchy import CSRMatrix, coupling_edges, run_hierarchy
+
+
+def test_csr_matches_dense_product() -> None:
+    rows, cols, weights = coupling_edges({"coupling": {"topology": "random", "degree": 4}}, 40, seed=1)
+    matrix = CSRMatrix.from_coo(rows, cols, weights, (40, 40))
+    dense = np.zeros((40, 40))
+    np.add.at(dense, (rows, cols), weights)
+    x = np.random.default_rng(0).random(40)
+    assert np.allclose(matrix @ x, dense @ x)
+    assert np.allclose(dense.sum(axis=1), 0.05)
+
+
+def test_coupled_layers_spill_from_injected_layer() -> None:
+    cfg = {"n_layers": 200, "horizon": 60, "coupling": {"topology": "chain", "strength": 0.08}, "inject": {"layers": [0], "step": 5}}
+    result = run_hierarchy(cfg)
+    assert result.stress.shape == (61, 200) and result.t.shape == (61,)
+    excess = result.anomaly[-20:].mean(axis=0)
+    assert excess[0] > excess[1] > excess[5]
+    assert result.summary["n_layers"] == 200 and result.summary["peak_layer"] == "L0"
+    layer = result.layer(3)
+    assert np.array_equal(layer.trajectory.stress, result.stress[:, 3])
@@ -0,0 +1,23 @@
+import json
+
+import numpy as np
+
+from code.qmpt_core.io import load_run_series, save_run_results, write_run_results
+from code.qmpt_core.scenarios import run_scenario
+
+
+def test_write_run_results_single_atomic_write(tmp_path) -> None:
+    cfg = {"scenario": "anomaly_injection", "horizon": 40, "seed": 5, "derived_metrics": {"p95": "quantile(anomaly_proxy, 0.95)"}}
+    layer, summary = run_scenario(cfg)
+    metrics = save_run_results("r", layer, dict(summary), tmp_path, cfg)
+    assert metrics == json.loads((tmp_path / "metrics.json").read_text(encoding="utf-8"))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["metrics.json", "patterns.json", "timeseries.npz"]
+    proxy = load_run_series(tmp_path, ["anomaly_proxy"])["anomaly_proxy"]
+    assert np.isclose(metrics["derived"]["p95"], np.quantile(proxy, 0.95)) and "calib_auc" in metrics
+
+    series = {"t": np.arange(4.0), "stress": np.array([0.1, 0.4, 0.9, 0.3]), "label": np.array(["a", "b", "c", "d"])}
+    out = tmp_path / "q"
+    metrics = write_run_results(out, {"backend": "quantum_dummy"}, series, {"derived_metrics": {"peak_at": "argmax(stress)"}})
+    assert metrics["backend"] == "quantum_dummy" and metrics["derived"] == {"peak_at": 2}
+    assert sorted(load_run_series(out)) == ["stress", "t"]
+    assert sorted(p.name for p in out.iterdir()) == ["metrics.json", "timeseries.npz"]
@@ -0,0 +1,281 @@
+import numpy as np
+
+from code.qmpt_core.bootstrap import bootstrap_means, mean_ci
+from code.qmpt_core.metrics import (
+    EnsembleAccumulator,
+    MahalanobisScorer,
+    PopulationAggregate,
+    StateAnalysis,
+    compute_ensemble_summary,
+    compute_run_metrics,
+    compute_run_metrics_batch,
+    entanglement_entropy,
+    estimate_anomaly,
+    estimate_reflexivity,
+    estimate_self_operator,
+    mutual_information,
+    partial_trace,
+    quantum_entropy,
+)
+from code.qmpt_core.models import Pattern, PatternPopulation
+from code.qmpt_core.neighbors import NeighborIndex
+
+
+def _patterns() -> list:
+    rng = np.random.default_rng(0)
+    patterns = [Pattern(pattern_id=f"p{i}", layer_id="L", features=rng.normal(0, 0.5, size=4)) for i in range(6)]
+    patterns.append(Pattern(pattern_id="anom", layer_id="L", features=np.full(4, 3.0), metadata={"impact": 0.8, "meta_consistency": 0.9}))
+    patterns.append(Pattern(pattern_id="blank", layer_id="L"))
+    return patterns
+
+
+def test_population_estimators_match_pattern_list() -> None:
+    patterns = _patterns()
+    population = PatternPopulation.from_patterns(patterns)
+    for estimator in (estimate_anomaly, estimate_reflexivity, estimate_self_operator):
+        estimator(patterns)
+        estimator(population)
+    assert np.allclose(population.anomaly_score, [p.anomaly_score for p in patterns])
+    assert np.allclose(population.reflexivity, [p.reflexivity for p in patterns])
+    assert np.allclose(population.self_operator, [p.self_operator for p in patterns])
+    assert patterns[-1].anomaly_score == 0.1
+    assert patterns[-1].reflexivity == 0.2
+    assert patterns[-2].anomaly_score == max(p.anomaly_score for p in patterns)
+
+
+def test_knn_and_lof_anomaly_methods() -> None:
+    for method in ("knn", "lof"):
+        patterns = _patterns()
+        population = PatternPopulation.from_patterns(patterns)
+        estimate_anomaly(patterns, method=method, k=3)
+        estimate_anomaly(population, method=method, k=3)
+        assert np.allclose(population.anomaly_score, [p.anomaly_score for p in patterns])
+        assert patterns[-1].anomaly_score == 0.1
+        assert patterns[-2].anomaly_score == max(p.anomaly_score for p in patterns)
+
+
+def test_mahalanobis_scorer_online_updates() -> None:
+    rng = np.random.default_rng(2)
+    features = rng.normal(size=(120, 20)) @ rng.normal(size=(20, 20))
+    scorer = MahalanobisScorer(20, ridge=1e-9)
+    for row in features[:40]:
+        scorer.add(row)  # rank-1 updates
+    scorer.add(features[40:100])  # refactor
+    for row in features[:5]:
+        scorer.remove(row)  # rank-1 downdates
+    kept = features[5:100]
+    inv = np.linalg.inv(np.cov(kept.T))
+    centered = features[100:] - kept.mean(axis=0)
+    expected = np.sqrt(np.einsum("ij,jk,ik->i", centered, inv, centered))
+    assert scorer.count == 95
+    assert np.allclose(scorer.score(features[100:]), expected)
+
+    # Narrow features (the 4-feature patterns) still take the rank-1 path for small batches.
+    narrow = MahalanobisScorer.from_features(features[:30, :4], ridge=1e-9)
+    refactors = []
+    narrow._refactor = lambda: refactors.append(1)
+    narrow.add(features[30:33, :4])
+    narrow.remove(features[:2, :4])
+    kept = features[2:33, :4]
+    centered = features[100:, :4] - kept.mean(axis=0)
+    expected = np.sqrt(np.einsum("ij,jk,ik->i", centered, np.linalg.inv(np.cov(kept.T)), centered))
+    assert not refactors and np.allclose(narrow.score(features[100:, :4]), expected)
+
+    patterns = _patterns()
+    reference = MahalanobisScorer.from_features(rng.normal(0, 0.5, size=(200, 4)))
+    estimate_anomaly(patterns, method="mahalanobis", scorer=reference)
+    assert patterns[-2].anomaly_score == max(p.anomaly_score for p in patterns)
+
+
+def test_sketched_population_tracks_raw_estimators() -> None:
+    rng = np.random.default_rng(3)
+    features = rng.normal(0, 0.5, size=(60, 3000))
+    raw = PatternPopulation.from_features("L", features)
+    sketched = PatternPopulation.from_features("L", features)
+    sketch = sketched.attach_sketch(eps=0.3, seed=1)
+    assert sketch.target_dim < 3000
+    assert sketch.error["eps"] == 0.3
+    assert sketch.error["distance_max_rel_error"] < 0.3
+    for estimator in (estimate_anomaly, estimate_reflexivity, estimate_self_operator):
+        estimator(raw)
+        estimator(sketched)
+    assert np.allclose(sketched.anomaly_score, raw.anomaly_score, rtol=0.3)
+    assert np.allclose(sketched.reflexivity, raw.reflexivity, atol=0.01)
+    assert np.allclose(sketched.self_operator, raw.self_operator, rtol=0.1)
+
+
+def test_neighbor_index_matches_brute_force() -> None:
+    rng = np.random.default_rng(1)
+    points = rng.normal(size=(2000, 3))
+    points[:500] = np.round(points[:500], 1)  # duplicates and ties
+    index = NeighborIndex(points, backend="numpy")
+    dist, idx = index.query_self(5)
+    full = np.linalg.norm(points[:, None] - points[None], axis=2)
+    np.fill_diagonal(full, np.inf)
+    assert np.allclose(dist, np.sort(full, axis=1)[:, :5])
+    assert np.allclose(full[np.arange(len(points))[:, None], idx], dist)
+
+    index.insert(rng.normal(size=(50, 3)))
+    queries = rng.normal(size=(40, 3))
+    dist, idx = index.query(queries, 4)
+    full = np.linalg.norm(queries[:, None] - index.points[None], axis=2)
+    assert np.allclose(dist, np.sort(full, axis=1)[:, :4])
+    assert np.allclose(full[np.arange(len(queries))[:, None], idx], dist)
+
+    # More queries than indexed points: the query tree is deeper than the data tree.
+    small = NeighborIndex(points[:100], backend="numpy")
+    queries = rng.normal(size=(300, 3))
+    dist, idx = small.query(queries, 3)
+    full = np.linalg.norm(queries[:, None] - points[None, :100], axis=2)
+    assert np.allclose(dist, np.sort(full, axis=1)[:, :3])
+    assert np.allclose(full[np.arange(len(queries))[:, None], idx], dist)
+
+
+def test_population_round_trip() -> None:
+    patterns = _patterns()
+    back = PatternPopulation.from_patterns(patterns).to_patterns()
+    assert [p.pattern_id for p in back] == [p.pattern_id for p in patterns]
+    assert back[-1].features is None
+    assert back[-2].metadata == {"impact": 0.8, "meta_consistency": 0.9}
+    assert np.array_equal(back[0].features, patterns[0].features)
+
+
+def test_population_aggregate_incremental_updates() -> None:
+    scores = np.array([0.2, 0.4, 0.9])
+    agg = PopulationAggregate(scores)
+    assert np.isclose(agg.mean, scores.mean())
+    agg.add([1.5, 0.1])
+    agg.remove(0.4)
+    agg.mutate(0.9, 0.3)
+    expected = np.array([0.2, 0.3, 1.5, 0.1])
+    assert agg.count == 4
+    assert np.isclose(agg.mean, expected.mean())
+    assert np.isclose(agg.std, expected.std())
+
+
+def test_pure_state_entropies() -> None:
+    bell = np.array([1, 0, 0, 1]) / np.sqrt(2)
+    assert np.isclose(entanglement_entropy(bell, [0]), 1.0)
+    assert np.isclose(mutual_information(bell, [0], [1]), 2.0)
+    assert quantum_entropy(bell) == 0.0
+    assert np.isclose(quantum_entropy(np.eye(4) / 4), 2.0)
+
+    # |0> (x) Bell(1, 2): qubit 0 is a product factor, qubits 1 and 2 are maximally entangled.
+    state = np.kron([1, 0], bell)
+    assert np.isclose(entanglement_entropy(state, [0]), 0.0)
+    assert np.isclose(entanglement_entropy(state, [2]), 1.0)
+    assert np.isclose(entanglement_entropy(state, [0, 2]), 1.0)
+    assert np.isclose(mutual_information(state, [0], [1]), 0.0)
+
+
+def test_state_analysis_batched_queries() -> None:
+    state = np.kron([1, 0], np.array([1, 0, 0, 1]) / np.sqrt(2))
+    analysis = StateAnalysis(state, cache_size=2)
+    assert np.allclose(analysis.cut_entropies(), [0.0, 1.0])
+    expected = np.zeros((3, 3))
+    expected[1, 2] = expected[2, 1] = 2.0
+    assert np.allclose(analysis.pairwise_mutual_information(), expected)
+    assert np.allclose(analysis.reduced_density([1, 2]), np.outer([1, 0, 0, 1], [1, 0, 0, 1]) / 2)
+    assert len(analysis._spectra) <= 2 and len(analysis._densities) <= 2
+
+
+def _reference_partial_trace(rho: np.ndarray, keep: list) -> np.ndarray:
+    n = int(np.log2(len(rho)))
+    dim = 1 << len(keep)
+    out = np.zeros((dim, dim), dtype=complex)
+    for i in range(len(rho)):
+        for j in range(len(rho)):
+            bi = [(i >> (n - 1 - q)) & 1 for q in range(n)]
+            bj = [(j >> (n - 1 - q)) & 1 for q in range(n)]
+            if all(bi[q] == bj[q] for q in range(n) if q not in keep):
+                r = int("".join(str(bi[q]) for q in keep) or "0", 2)
+                c = int("".join(str(bj[q]) for q in keep) or "0", 2)
+                out[r, c] += rho[i, j]
+    return out
+
+
+def test_partial_trace_statevector_and_density() -> None:
+    rng = np.random.default_rng(3)
+    state = rng.normal(size=16) + 1j * rng.normal(size=16)
+    state /= np.linalg.norm(state)
+    rho = np.outer(state, state.conj())
+    mixed = 0.7 * rho + 0.3 * np.eye(16) / 16
+    for keep in ([0], [2], [3, 1], [0, 2, 3], [], [0, 1, 2, 3]):
+        assert np.allclose(partial_trace(state, keep), _reference_partial_trace(rho, keep))
+        assert np.allclose(partial_trace(mixed, keep), _reference_partial_trace(mixed, keep))
+
+    analysis = StateAnalysis(mixed)
+    assert not analysis.pure
+    assert np.isclose(analysis.entropy([0, 1, 2, 3]), quantum_entropy(mixed))
+    assert np.isclose(entanglement_entropy(rho, [1, 3]), entanglement_entropy(state, [1, 3]))
+    assert np.isclose(mutual_information(rho, [0], [2]), mutual_information(state, [0], [2]))
+
+
+def test_bootstrap_mean_ci() -> None:
+    rng = np.random.default_rng(5)
+    values = rng.normal(loc=[0.0, 3.0], scale=[1.0, 0.5], size=(400, 2))
+    boot = bootstrap_means(values, 300, seed=1)
+    assert boot.shape == (300, 2)
+    assert np.allclose(boot.std(axis=0), values.std(axis=0) / 20, rtol=0.2)
+    for method in ("percentile", "bca"):
+        low, high = mean_ci(values, n_boot=500, seed=2, method=method)
+        assert np.all(low < values.mean(axis=0)) and np.all(values.mean(axis=0) < high)
+
+    runs = [{"max_sigma": 0.5 + 0.01 * i, "anomaly_mean": 0.1 * (i % 3)} for i in range(20)] + [{"max_sigma": 0.95}]
+    summary = compute_ensemble_summary(runs, {"n_boot": 200, "seed": 4, "method": "bca"})
+    assert summary == compute_ensemble_summary(runs, {"n_boot": 200, "seed": 4, "method": "bca"})
+    assert summary["max_sigma_ci_low"] < summary["max_sigma_mean"] < summary["max_sigma_ci_high"]
+    assert summary["anomaly_mean_ci_low"] < summary["anomaly_mean_mean"] < summary["anomaly_mean_ci_high"]
+    assert summary["bootstrap_resamples"] == 200 and summary["near_breakdown_runs"] == 1
+
+
+def test_ensemble_accumulator_merges_shards() -> None:
+    rng = np.random.default_rng(6)
+    runs = [{"max_sigma": float(v), "anomaly_mean": float(a)} for v, a in zip(rng.uniform(0.5, 1.0, 3000), rng.lognormal(size=3000))]
+    runs += [{"entropy_mean": 0.3}]
+    shards = [EnsembleAccumulator(seed=i) for i in range(3)]
+    for i, run in enumerate(runs):
+        shards[i % 3].update(run)
+    merged = shards[0].merge(shards[1]).merge(shards[2]).result()
+    exact = compute_ensemble_summary(runs)
+    assert merged["runs"] == exact["runs"] == len(runs)
+    assert merged["near_breakdown_runs"] == exact["near_breakdown_runs"]
+    for key in ("max_sigma", "anomaly_mean", "entropy_mean"):
+        for stat in ("mean", "std", "min", "max"):
+            assert np.isclose(merged[f"{key}_{stat}"], exact[f"{key}_{stat}"])
+    values = np.array([run["anomaly_mean"] for run in runs if "anomaly_mean" in run])
+    for q in (50, 95, 99):
+        assert abs(np.mean(values <= merged[f"anomaly_mean_p{q}"]) - q / 100) < 0.02
+
+
+def test_run_metrics_batch_matches_per_run() -> None:
+    rng = np.random.default_rng(8)
+    config = {"sigma_crit": 0.6, "anomaly_threshold": 0.4}
+    lengths = np.array([5, 0, 12, 1, 7])
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    flat = {key: rng.uniform(size=offsets[-1]) for key in ("stress", "anomaly_proxy", "anomaly_ground_truth", "entropy")}
+    batch = compute_run_metrics_batch(flat, config, offsets=offsets)
+    for i, (a, b) in enumerate(zip(offsets[:-1], offsets[1:])):
+        if a == b:
+            assert all(np.isnan(values[i]) for key, values in batch.items() if key != "calibration_samples")
+            continue
+        single = compute_run_metrics({key: values[a:b] for key, values in flat.items()}, config)
+        for key, value in single.items():
+            if key != "metrics_schema_version":
+                assert np.isclose(batch[key][i], value), key
+
+    # Leading, middle and trailing empty runs leave their neighbours intact.
+    lengths = np.array([0, 5, 0, 0, 3, 0])
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    flat = {"stress": np.arange(8.0)}
+    batch = compute_run_metrics_batch(flat, config, offsets=offsets)
+    assert np.array_equal(batch["max_sigma"], [np.nan, 4.0, np.nan, np.nan, 7.0, np.nan], equal_nan=True)
+    assert np.array_equal(batch["sigma_mean"], [np.nan, 2.0, np.nan, np.nan, 6.0, np.nan], equal_nan=True)
+    batch = compute_run_metrics_batch({"stress": np.arange(5.0)}, config, offsets=[0, 5, 5])
+    assert batch["max_sigma"][0] == 4.0 and batch["sigma_mean"][0] == 2.0
+
+    stacked = {"stress": rng.uniform(size=(4, 9)), "expectation_mean": rng.normal(size=(4, 9))}
+    batch = compute_run_metrics_batch(stacked, config)
+    single = compute_run_metrics({key: values[2] for key, values in stacked.items()}, config)
+    assert set(batch) == set(single) - {"metrics_schema_version"}
+    assert all(np.isclose(batch[key][2], single[key]) for key in batch)
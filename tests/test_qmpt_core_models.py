@@ -0,0 +1,26 @@
+import numpy as np
+
+from code.qmpt_core.models import LayerState, Trajectory
+
+
+def test_trajectory_layer_state_view() -> None:
+    traj = Trajectory(capacity=2)
+    for i in range(5):
+        traj.append(LayerState(t=float(i), stress=0.1 * i, protection=0.5, novelty=0.2, macro={"regime": "stable" if i < 3 else "upgrade"}))
+    assert len(traj) == 5
+    assert traj.labels == [(("regime", "stable"),), (("regime", "upgrade"),)]
+    assert np.array_equal(traj.t, np.arange(5.0))
+    assert np.array_equal(traj.macro_codes, [0, 0, 0, 1, 1])
+    last = traj[-1]
+    assert isinstance(last, LayerState)
+    assert last.stress == 0.1 * 4
+    assert last.macro == {"regime": "upgrade"}
+    assert [s.t for s in traj[1:3]] == [1.0, 2.0]
+    assert max(s.stress for s in traj) == traj.stress.max()
+
+
+def test_trajectory_from_arrays_is_zero_copy() -> None:
+    stress = np.linspace(0.0, 1.0, 4)
+    traj = Trajectory.from_arrays(np.arange(4.0), stress, stress, stress)
+    assert np.shares_memory(traj.stress, stress)
+    assert traj[2].macro == {}
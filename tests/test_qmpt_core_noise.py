@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from code.qmpt_core.noise import CounterNoise, SequentialNoise, make_noise
+from code.qmpt_core.scenarios import run_scenario, run_scenario_batch
+
+
+def test_sequential_noise_matches_scalar_draws() -> None:
+    rng = np.random.default_rng(3)
+    expected = [[rng.normal(0, 1.0) for _ in range(2)] for _ in range(5)]
+    noise = SequentialNoise(3, 2)
+    drawn = np.vstack([noise.draw(0, 2), noise.draw(2, 3)])
+    assert np.array_equal(drawn, expected)
+    with pytest.raises(ValueError):
+        noise.draw(0, 1)
+
+
+def test_counter_noise_random_access() -> None:
+    noise = CounterNoise(key=7, n_terms=3, block_steps=8)
+    full = noise.draw(0, 30)
+    assert np.array_equal(CounterNoise(7, 3, 8).step(17), full[17])
+    assert np.array_equal(CounterNoise(7, 3, 8).draw(5, 20), full[5:25])
+    assert not np.array_equal(CounterNoise(8, 3, 8).draw(0, 30), full)
+
+
+def test_counter_mode_batch_matches_scalar() -> None:
+    cfg = {"scenario": "collapse_recovery", "horizon": 40, "noise": {"mode": "counter", "block_steps": 16}}
+    batch = run_scenario_batch(cfg, [4, 5])
+    layer, _ = run_scenario({**cfg, "seed": 5})
+    assert np.array_equal(batch.stress[1], layer.trajectory.stress)
+    assert isinstance(make_noise(cfg, 5, 4), CounterNoise)
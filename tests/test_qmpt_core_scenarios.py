@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from code.qmpt_core.io import save_run_stream
+from code.qmpt_core.metrics import compute_run_metrics
+from code.qmpt_core.scenarios import ScenarioCheckpoint, ScenarioStream, checkpoint_scenario, run_scenario, run_scenario_batch
+from code.qmpt_core.sweeps import run_sweep
+
+
+def _assert_same_summary(a: dict, b: dict) -> None:
+    assert a.keys() == b.keys()
+    for key in a:
+        if key == "timeseries":
+            for name in a[key]:
+                assert np.array_equal(a[key][name], b[key][name])
+        else:
+            assert a[key] == b[key]
+
+
+def test_batch_matches_scalar_runs() -> None:
+    cfgs = [
+        {"scenario": "baseline_layer", "horizon": 30},
+        {"scenario": "anomaly_injection", "horizon": 30, "inject_step": 10},
+        {"scenario": "anomaly_injection", "horizon": 0},
+        {"scenario": "collapse_recovery", "horizon": 30},
+        {"scenario": "transfer_cycle", "substrates": ["S1", "S2", "S3"]},
+    ]
+    seeds = [1, 2, 3]
+    for cfg in cfgs:
+        batch = run_scenario_batch(cfg, seeds)
+        assert batch.stress.shape[0] == len(seeds)
+        for i, seed in enumerate(seeds):
+            layer, summary = run_scenario({**cfg, "seed": seed})
+            b_layer, b_summary = batch.run(i)
+            _assert_same_summary(summary, b_summary)
+            assert [vars(s) for s in layer.trajectory] == [vars(s) for s in b_layer.trajectory]
+
+
+def test_stream_metrics_match_full_run(tmp_path) -> None:
+    cfg = {"scenario": "anomaly_injection", "horizon": 200, "seed": 5}
+    streamed = save_run_stream("r", ScenarioStream(cfg, chunk_size=32), tmp_path, cfg)
+    layer, summary = run_scenario(cfg)
+    full = compute_run_metrics({"stress": layer.trajectory.stress, **summary["timeseries"]}, cfg)
+    for key, value in full.items():
+        assert np.isclose(streamed[key], value) if isinstance(value, float) else streamed[key] == value
+    assert streamed["detection_latency"] == summary["detection_latency"]
+    stress = np.load(tmp_path / "series" / "stress.npy", mmap_mode="r")
+    assert np.array_equal(stress, layer.trajectory.stress)
+
+
+def test_sweep_forks_shared_prefix() -> None:
+    cfgs = [
+        {"scenario": "anomaly_injection", "horizon": 40, "seed": 2, "inject_step": step, "anomaly_level": level}
+        for step in (5, 12, 30)
+        for level in (0.4, 0.8)
+    ]
+    cfgs.append({"scenario": "transfer_cycle", "substrates": ["S1", "S2", "S3"], "substrate_noise": [0.05, 0.1]})
+    cfgs.append({"scenario": "transfer_cycle", "substrates": ["S1", "S2", "S4"], "substrate_noise": [0.05, 0.1]})
+    for cfg, (layer, summary) in zip(cfgs, run_sweep(cfgs)):
+        ref_layer, ref_summary = run_scenario(cfg)
+        _assert_same_summary(ref_summary, summary)
+        assert [vars(s) for s in layer.trajectory] == [vars(s) for s in ref_layer.trajectory]
+
+
+def test_checkpoint_round_trip() -> None:
+    cfg = {"scenario": "collapse_recovery", "horizon": 60, "seed": 3}
+    ckpt = ScenarioCheckpoint.from_dict(checkpoint_scenario(cfg, 25).to_dict())
+    assert ckpt.step == 25 and len(ckpt.columns["stress"]) == 26
+    layer, summary = run_scenario(cfg, resume=ckpt)
+    ref_layer, ref_summary = run_scenario(cfg)
+    _assert_same_summary(ref_summary, summary)
+    assert np.array_equal(layer.trajectory.stress, ref_layer.trajectory.stress)
+
+
+def test_stop_when_truncates_scalar_and_batch() -> None:
+    cfg = {"scenario": "collapse_recovery", "horizon": 200, "stop_when": {"collapse": True, "after_steps": 5}}
+    seeds = [0, 1, 2]
+    batch = run_scenario_batch(cfg, seeds)
+    for i, seed in enumerate(seeds):
+        layer, summary = run_scenario({**cfg, "seed": seed})
+        assert summary["stop_reason"] == "collapse"
+        assert summary["stop_step"] == len(layer.trajectory) - 1 < 200
+        assert summary["stop_step"] == summary["collapse_time"] + 5
+        b_layer, b_summary = batch.run(i)
+        _assert_same_summary(summary, b_summary)
+        assert np.array_equal(layer.trajectory.stress, b_layer.trajectory.stress)
+    chunks = list(ScenarioStream({**cfg, "seed": 0}, chunk_size=4))
+    assert sum(len(c["stress"]) for c in chunks) == len(run_scenario({**cfg, "seed": 0})[0].trajectory)
+
+
+def test_transfer_cycle_long_chain_batch_and_generator_noise() -> None:
+    hops = 2000
+    noise = np.random.default_rng(0).normal(0.0, 0.03, hops)
+    cfg = {"scenario": "transfer_cycle", "substrates": [f"S{i % 4}" for i in range(hops)], "substrate_noise": noise}
+    batch = run_scenario_batch(cfg, list(range(70)))
+    for i in (0, 69):
+        layer, summary = run_scenario({**cfg, "seed": i, "substrate_noise": (float(x) for x in noise)})
+        b_layer, b_summary = batch.run(i)
+        _assert_same_summary(summary, b_summary)
+        assert [vars(s) for s in layer.trajectory] == [vars(s) for s in b_layer.trajectory]
+    assert 0.0 in batch.stress[0] or 1.0 in batch.stress[0]
+
+
+def test_single_layer_engines_reject_coupled_layers() -> None:
+    cfg = {"scenario": "coupled_layers", "horizon": 5}
+    for run in (lambda: run_scenario(cfg), lambda: run_scenario_batch(cfg, [1, 2]), lambda: run_sweep([cfg])):
+        with pytest.raises(ValueError, match="run_hierarchy"):
+            run()
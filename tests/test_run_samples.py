@@ -109,3 +109,42 @@ def test_quantum_examples(tmp_path: Path) -> None:
         assert "metrics_schema_version" in metrics
         if "derived" in metrics:
             assert isinstance(metrics["derived"], dict)
+
+
+def test_coupled_layers_ensembles_run_hierarchy(tmp_path: Path) -> None:
+    from code.qmpt_core.datasets import load_run
+
+    base = {"backend": "classical", "scenario": "coupled_layers", "n_layers": 4, "horizon": 12, "seed": 3}
+    runner = SimulationRunner(RunRegistry(tmp_path / "runs.jsonl"))
+    ensembles = [
+        {**base, "executor": {"type": "local_batched"}, "ensemble": {"enabled": True, "mode": "repeat", "n_runs": 2}},
+        {**base, "ensemble": {"enabled": True, "mode": "sweep", "param_grid": {"anomaly_decay": [0.8, 0.9]}}},
+    ]
+    for cfg in ensembles:
+        _, results = runner.run_ensemble(None, BackendType.CLASSICAL, base_cfg=cfg)
+        assert len(results) == 2
+        for res in results:
+            assert res.metrics["scenario"] == "coupled_layers" and res.metrics["n_layers"] == 4
+            series = load_run(res.results_path).series()
+            assert series["stress"].shape == (13, 4) and "anomaly_proxy" in series
+
+
+def test_streamed_ensemble_manifest_points_at_written_series(tmp_path: Path) -> None:
+    from code.qmpt_core.datasets import load_run
+
+    cfg = {
+        "backend": "classical",
+        "scenario": "anomaly_injection",
+        "horizon": 40,
+        "seed": 4,
+        "streaming": {"enabled": True, "chunk_size": 16},
+        "ensemble": {"enabled": True, "mode": "repeat", "n_runs": 2},
+    }
+    runner = SimulationRunner(RunRegistry(tmp_path / "runs.jsonl"))
+    dataset_id, results = runner.run_ensemble(None, BackendType.CLASSICAL, base_cfg=cfg)
+    manifest_path = repo_root() / "lab" / "datasets" / dataset_id / "dataset_manifest.json"
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    assert len(manifest["runs"]) == len(results) == 2
+    for entry, res in zip(manifest["runs"], results):
+        assert "store_index" not in entry and Path(entry["timeseries_path"]) == res.results_path / "series"
+        assert Path(entry["timeseries_path"]).is_dir() and len(load_run(res.results_path).series()["stress"]) == 41